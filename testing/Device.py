@@ -1,9 +1,13 @@
 from ppadb.client import Client as AdbClient
 import time
+import struct
 import cv2
+import numpy as np
 from os.path import join as pjoin
 import os
+from concurrent.futures import ThreadPoolExecutor
 from uta.config import *
+from uta.UIProcessing import _UISettleDetector
 
 
 class Device:
@@ -11,6 +15,10 @@ class Device:
         self.__host = host
         self.__port = port
         self.__adb_device = None
+        self.__saver = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ui-saver')   # writes the captures in order
+        self.__pending_saves = []
+        self.settle_detector = _UISettleDetector()  # waits for the screen to settle after the actions
+        self.__cur_app = None   # the last launched app, to learn its settle time
 
     def connect(self):
         """
@@ -53,18 +61,52 @@ class Device:
         Returns:
             screen_path, xml_path
         """
+        screen = self.cap_screenshot()
+        xml = self.cap_current_ui_hierarchy_xml()
+        return self.save_ui_screenshot_and_xml(ui_id, output_dir, screen, xml)
+
+    def cap_ui_screenshot_and_xml(self, ui_id=None, output_dir=None):
+        """
+        Capture ui screenshot and xml in memory, to be processed without reading them back from files
+        Args:
+            ui_id (int or string): The id of the current ui, used to name the saved files
+            output_dir (path): Directory to save img and xml in the background, None to not save
+        Returns:
+            screen (bytes): Png bytes of the screenshot
+            xml (str): XML content of the UI hierarchy
+        """
+        screen = self.cap_screenshot()
+        xml = self.cap_current_ui_hierarchy_xml()
+        if output_dir is not None:
+            self.__pending_saves = [f for f in self.__pending_saves if not f.done()]
+            self.__pending_saves.append(self.__saver.submit(self.save_ui_screenshot_and_xml, ui_id, output_dir, screen, xml))
+        return screen, xml
+
+    @staticmethod
+    def save_ui_screenshot_and_xml(ui_id, output_dir, screen, xml):
+        """
+        Save the captured ui screenshot and xml to target directory
+        Returns:
+            screen_path, xml_path
+        """
         os.makedirs(output_dir, exist_ok=True)
         screen_path = pjoin(output_dir, str(ui_id) + '.png')
         xml_path = pjoin(output_dir, str(ui_id) + '.xml')
-        screen = self.cap_screenshot()
         with open(screen_path, 'wb') as fp:
             fp.write(screen)
-        xml = self.cap_current_ui_hierarchy_xml()
         with open(xml_path, 'w', encoding='utf-8') as fp:
             fp.write(xml)
         # print('- Export UI image and xml to ', screen_path, xml_path, '-')
         return screen_path, xml_path
 
+    def wait_for_saves(self):
+        """
+        Wait until the captures saved in the background are written
+        """
+        for future in self.__pending_saves:
+            future.result()
+        self.__pending_saves = []
+
     def cap_screenshot(self, recur_time=0):
         """
         Captures a screenshot of the current device screen.
@@ -93,6 +135,32 @@ class Device:
         xml_content = self.__adb_device.shell('cat /sdcard/window_dump.xml')
         return xml_content
 
+    def cap_settle_frame(self, scale=8):
+        """
+        Captures a downscaled frame of the screen to tell whether it is still changing.
+        The raw screencap is read through exec-out, so the device skips the png encoding of the screenshot,
+        and only every scale-th row and column of the pixels is kept.
+        Args:
+            scale (int): Downscaling step of the rows and columns.
+        Returns:
+            The downscaled BGR frame, None if the capture failed so it never counts as an unchanged screen.
+        """
+        try:
+            conn = self.__adb_device.create_connection()
+            with conn:
+                conn.send('exec:screencap')
+                raw = conn.read_all()
+            # header of the raw screencap: width, height, format and, since Android 9, the color space
+            width, height = struct.unpack_from('<II', raw)
+            header_size = len(raw) - width * height * 4
+            if header_size not in (12, 16):
+                return None
+            pixels = np.frombuffer(raw, np.uint8, width * height * 4, header_size).reshape(height, width, 4)
+            return np.ascontiguousarray(pixels[::scale, ::scale, 2::-1])
+        except Exception as e:
+            print('* Capture settle frame failed: %s *' % e)
+            return None
+
     '''
     ***********
     *** App ***
@@ -113,16 +181,18 @@ class Device:
         # Step 2: Launch the app using the existing launch_app method
         self.launch_app(package_name, waiting_time)
 
-    def launch_app(self, package_name, waiting_time=3):
+    def launch_app(self, package_name, waiting_time=3, min_waiting_time=1):
         """
         Launches an app on the device by its package name.
         Args:
             package_name (str): The package name of the app to launch.
-            waiting_time (int): Time to wait after launching the app, in seconds.
+            waiting_time (int): Maximum time to wait for the app to load after launching it, in seconds.
+            min_waiting_time (float): Minimum time to wait even if the screen looks settled, in seconds.
         """
         print('--- Launch app:', package_name, '---')
         self.__adb_device.shell(f'monkey -p {package_name} -c android.intent.category.LAUNCHER 1')
-        time.sleep(waiting_time)
+        self.__cur_app = package_name
+        self.wait_for_settle(waiting_time, min_waiting_time=min_waiting_time)
 
     def close_app(self, package_name, waiting_time=3):
         """
@@ -331,25 +401,42 @@ class Device:
         """
         self.__adb_device.input_text(text)
 
-    def go_back(self, waiting_time=2):
+    def go_back(self, waiting_time=2, min_waiting_time=0.5):
         """
         Simulates the 'Back' button press on the device.
         Args:
-            waiting_time (int): Time to wait after the action, in seconds.
+            waiting_time (int): Maximum time to wait for the screen to be refreshed after the action, in seconds.
+            min_waiting_time (float): Minimum time to wait even if the screen looks settled, in seconds.
         """
         self.__adb_device.shell('input keyevent KEYCODE_BACK')
-        # wait a few second to be refreshed
-        time.sleep(waiting_time)
+        self.wait_for_settle(waiting_time, min_waiting_time=min_waiting_time)
 
-    def go_homepage(self, waiting_time=3):
+    def go_homepage(self, waiting_time=3, min_waiting_time=1):
         """
         Simulates the "Go Home Page" operation.
         Args:
-            waiting_time (int): Time to wait after the action, in seconds.
+            waiting_time (int): Maximum time to wait for the screen to be refreshed after the action, in seconds.
+            min_waiting_time (float): Minimum time to wait even if the screen looks settled, in seconds.
         """
         self.__adb_device.shell('input keyevent KEYCODE_HOME')
-        # wait a few second to be refreshed
-        time.sleep(waiting_time)
+        self.__cur_app = None
+        self.wait_for_settle(waiting_time, app='home', min_waiting_time=min_waiting_time)
+
+    def wait_for_settle(self, timeout=3, app=None, min_waiting_time=0):
+        """
+        Wait until the screen stops changing by polling cheap frames of it, rather than sleeping for a fixed time
+        Args:
+            timeout (float): Maximum time to wait, in seconds.
+            app (str): App on the screen whose settle time is learned, None for the last launched app
+            min_waiting_time (float): Minimum time to wait even if the screen looks settled, in seconds.
+        Returns:
+            settled (bool): True if the screen settled before the timeout
+        """
+        settled, elapsed = self.settle_detector.wait_for_settle(self.cap_settle_frame,
+                                                                app if app is not None else self.__cur_app, timeout,
+                                                                min_waiting_time)
+        print('* Screen %s in %.2fs *' % ('settled' if settled else 'still changing', elapsed))
+        return settled
 
     '''
     ***************
@@ -386,8 +473,60 @@ class Device:
         return board
 
 
+class SimulatedDevice:
+    def __init__(self, frames=None, capture_time=0, settle_detector=None):
+        """
+        Device replaying sequences of frames on a simulated clock, to test the waiting for the screen without a device
+        Args:
+            frames (list): [(seconds, frame)], each frame is on the screen from the seconds after the replay starts
+            capture_time (float): Simulated seconds taken by each capture
+            settle_detector (_UISettleDetector): Detector to wait with, a new one on the simulated clock if None
+        """
+        self.now = 0
+        self.capture_time = capture_time
+        self.captures = 0
+        self.__frames = []
+        self.__start = 0
+        self.settle_detector = settle_detector if settle_detector is not None else \
+            _UISettleDetector(clock=self.clock, sleep=self.sleep)
+        if frames is not None:
+            self.replay(frames)
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def replay(self, frames):
+        """
+        Start replaying a new sequence of frames from now, as the screen changes after an action
+        """
+        self.__frames = sorted(frames, key=lambda f: f[0])
+        self.__start = self.now
+
+    def cap_screenshot(self):
+        """
+        Returns:
+            frame: The frame on the screen at the current simulated time
+        """
+        self.captures += 1
+        self.now += self.capture_time
+        frame = None
+        for seconds, f in self.__frames:
+            if seconds > self.now - self.__start:
+                break
+            frame = f
+        return frame
+
+    def wait_for_settle(self, timeout=3, app=None, min_waiting_time=0):
+        settled, elapsed = self.settle_detector.wait_for_settle(self.cap_screenshot, app, timeout, min_waiting_time)
+        return settled
+
+
 if __name__ == '__main__':
     device = Device()
     device.connect()
     device.get_app_list_on_the_device()
     device.cap_and_save_ui_screenshot_and_xml(1, WORK_PATH + 'data/device')
+
@@ -0,0 +1,539 @@
+import sys
+import copy
+import glob
+import json
+import os
+import time
+import base64
+import shutil
+import tempfile
+import tracemalloc
+from difflib import SequenceMatcher
+import cv2
+import numpy as np
+import xmltodict
+from os.path import join as pjoin
+
+from uta.config import *
+from uta.UIProcessing import _UIPreProcessor, _UIAnalyser, _UITreeSerializer, _UIUtil, _UISimilarity, _UIChangeDetector
+from uta.ModelManagement.OpenAI import _OpenAI
+from uta.TaskAction import _TaskHistory
+from uta.DataStructures import Task, UIData, _UIElementStore
+from uta.SystemConnection import SystemConnector
+from testing.Device import SimulatedDevice
+
+
+class BenchUIData:
+    """
+    Light-weight stand-in of UIData that only carries the vh, so benchmarks do not pay for image decoding
+    """
+    def __init__(self, xml_file):
+        self.xml_file = xml_file
+        self.xml = None
+        self.ui_vh_json = None
+        self.elements_ids = 0
+        self.elements_version = 0
+        self.elements = []
+        self.elements_leaves = []
+        self.element_tree = None
+        self.element_tree_nodes = []
+        self.element_store = None
+        self.element_store_version = None
+        self.fingerprint = None
+
+    def mark_elements_changed(self):
+        self.elements_version += 1
+
+    def get_element_store(self):
+        if self.element_store is None or self.element_store_version != self.elements_version:
+            self.element_store = _UIElementStore(self.elements)
+            self.element_store_version = self.elements_version
+        return self.element_store
+
+    def get_element_tree_nodes(self):
+        return self.element_tree_nodes
+
+
+def collect_xml_corpus(corpus_dir=DATA_PATH):
+    """
+    Collect all the uiautomator dumps under the corpus directory
+    """
+    return sorted(glob.glob(pjoin(corpus_dir, '**', '*.xml'), recursive=True))
+
+
+def timeit(func, repeat=5):
+    """
+    Return the best runtime of the func over several runs
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+'''
+*****************************
+*** VH Parsing Benchmarks ***
+*****************************
+'''
+def legacy_vh_xml_cvt_to_json(xml_file):
+    """
+    The xmltodict + recursive conversion + deepcopy path, kept as the baseline to compare with
+    """
+    def cvt_node(node):
+        node_new = {}
+        for key in node.keys():
+            if node[key] == 'true':
+                node[key] = True
+            elif node[key] == 'false':
+                node[key] = False
+            if key == 'node':
+                node_new['children'] = node['node']
+            elif key == '@bounds':
+                node_new['bounds'] = eval(node['@bounds'].replace('][', ','))
+            else:
+                node_new[key.replace('@', '')] = node[key]
+        if 'children' in node_new:
+            children = node_new['children'] if type(node_new['children']) == list else [node_new['children']]
+            node_new['children'] = [cvt_node(child) for child in children]
+        return node_new
+
+    vh = xmltodict.parse(open(xml_file, 'r', encoding='utf-8').read())
+    return copy.deepcopy({'activity': {'root': cvt_node(vh['hierarchy']['node'])}})
+
+
+def benchmark_vh_parsing(corpus_dir=DATA_PATH, repeat=5):
+    """
+    Compare the streaming vh parser against the legacy path over a corpus of dumps
+    """
+    preprocessor = _UIPreProcessor()
+    xml_files = collect_xml_corpus(corpus_dir)
+    total_legacy, total_stream = 0, 0
+    for xml_file in xml_files:
+        ui_data = BenchUIData(xml_file)
+        preprocessor.ui_vh_xml_cvt_to_json(ui_data)
+        assert ui_data.ui_vh_json == legacy_vh_xml_cvt_to_json(xml_file), 'Mismatched vh json for ' + xml_file
+
+        t_legacy = timeit(lambda: legacy_vh_xml_cvt_to_json(xml_file), repeat)
+        t_stream = timeit(lambda: preprocessor.ui_vh_xml_cvt_to_json(BenchUIData(xml_file)), repeat)
+        total_legacy += t_legacy
+        total_stream += t_stream
+        print('%s: legacy %.2fms, streaming %.2fms' % (xml_file, t_legacy * 1000, t_stream * 1000))
+    print('[VH Parsing] %d dumps, legacy %.2fms, streaming %.2fms, speedup x%.2f'
+          % (len(xml_files), total_legacy * 1000, total_stream * 1000, total_legacy / max(total_stream, 1e-9)))
+
+
+'''
+*********************************************
+*** Element Tree Serialization Benchmarks ***
+*********************************************
+'''
+def benchmark_tree_serialization(corpus_dir=DATA_PATH, token_budgets=(None, 1000, 500)):
+    """
+    Compare the prompt tokens of the element tree as a dict string against the compact serialization
+    Descriptions come from the vh text and content-desc only, so no ocr is needed
+    """
+    preprocessor = _UIPreProcessor()
+    analyser = _UIAnalyser()
+    # counting tokens does not need an api key
+    serializer = _UITreeSerializer(model_manager=_OpenAI)
+    xml_files = collect_xml_corpus(corpus_dir)
+    total_dict = 0
+    total_compact = {budget: 0 for budget in token_budgets}
+    for xml_file in xml_files:
+        ui_data = BenchUIData(xml_file)
+        preprocessor.ui_vh_xml_cvt_to_json(ui_data)
+        preprocessor.ui_info_extraction(ui_data)
+        analyser.ui_analysis_elements_description(ui_data, ocr=False, cls=False)
+        analyser.ui_build_element_tree(ui_data)
+
+        n_dict = _OpenAI.count_token_size(str(ui_data.element_tree))
+        total_dict += n_dict
+        result = '%s: dict %d tokens' % (xml_file, n_dict)
+        for budget in token_budgets:
+            n_compact = _OpenAI.count_token_size(serializer.serialize_element_tree(ui_data, token_budget=budget))
+            total_compact[budget] += n_compact
+            result += ', compact(budget %s) %d tokens' % (budget, n_compact)
+        print(result)
+    for budget in token_budgets:
+        print('[Tree Serialization] %d UIs, budget %s: dict %d tokens, compact %d tokens, saving %.1f%%'
+              % (len(xml_files), budget, total_dict, total_compact[budget],
+                 100 * (1 - total_compact[budget] / max(total_dict, 1))))
+
+
+'''
+*******************************
+*** Task History Benchmarks ***
+*******************************
+'''
+def benchmark_task_history(n_steps=60, n_screens=8):
+    """
+    Compare the prompt tokens of the full action history against the compacted history over a long task
+    """
+    # counting tokens does not need an api key
+    task_history = _TaskHistory(model_manager=_OpenAI)
+    task = Task(task_id='bench', user_id='bench', task_description='Turn on the dark mode in settings')
+    max_legacy, max_compact = 0, 0
+    for step in range(n_steps):
+        task.relations.append({'Relation': 'Indirectly related', 'Element Id': str(step % 23),
+                               'Reason': 'The element %d may lead to the display settings of the task' % (step % 23),
+                               'Action': 'Click' if step % 4 else 'Back'})
+        task.relation_screens.append('.Settings$Screen%d' % (step % n_screens))
+        n_legacy = _OpenAI.count_token_size('!!!Action history for this task - MUST NOT REPEAT PREVIOUS ACTIONS:\n ' +
+                                            str(task.relations) + '.\n')
+        n_compact = _OpenAI.count_token_size(task_history.wrap_history(task))
+        max_legacy, max_compact = max(max_legacy, n_legacy), max(max_compact, n_compact)
+        if (step + 1) % 10 == 0:
+            print('Step %d: full history %d tokens, compacted history %d tokens' % (step + 1, n_legacy, n_compact))
+    print('[Task History] %d steps, max full history %d tokens, max compacted history %d tokens (ceiling %d)'
+          % (n_steps, max_legacy, max_compact, task_history.token_ceiling))
+
+
+def benchmark_save_ui_data(corpus_dir=DATA_PATH, n_steps=10):
+    """
+    Compare the step latency of saving the ui artifacts and preparing the vision upload:
+    legacy writes the json and png synchronously and reads the png back for base64,
+    while the background writer only encodes the jpg once on the critical path
+    """
+    screenshots = sorted(glob.glob(pjoin(corpus_dir, '**', '*.png'), recursive=True))[:n_steps]
+    output_dir = tempfile.mkdtemp()
+    system_connector = SystemConnector()
+    legacy_time, async_time = 0, 0
+    for screenshot in screenshots:
+        ui_data = UIData(screenshot)
+        ui_data.elements = [{'id': i, 'class': 'android.widget.TextView', 'bounds': [0, i, 100, i + 10]} for i in range(300)]
+        ui_data.annotated_elements_screenshot = ui_data.ui_screenshot
+
+        start = time.perf_counter()
+        with open(pjoin(output_dir, ui_data.ui_id + '_uitree.json'), 'w') as fp:
+            json.dump(ui_data.elements, fp, indent=4)
+        legacy_png = pjoin(output_dir, ui_data.ui_id + '_annotated_elements.png')
+        cv2.imwrite(legacy_png, ui_data.annotated_elements_screenshot)
+        with open(legacy_png, 'rb') as fp:
+            base64.b64encode(fp.read())
+        legacy_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        system_connector.save_ui_data(ui_data, output_dir)
+        base64.b64encode(ui_data.annotated_elements_screenshot_encoded)
+        async_time += time.perf_counter() - start
+    system_connector.flush()
+    shutil.rmtree(output_dir)
+    print('[Save UI Data] %d steps, legacy %.1fms per step, background writer %.1fms per step'
+          % (len(screenshots), legacy_time / max(len(screenshots), 1) * 1000, async_time / max(len(screenshots), 1) * 1000))
+
+
+def benchmark_ui_data_loading(corpus_dir=DATA_PATH, repeat=5):
+    """
+    Compare loading the UIData eagerly decoding and resizing the screenshot against the lazy screenshot,
+    for the text-only processing that never touches the pixels
+    """
+    screenshots = sorted(glob.glob(pjoin(corpus_dir, '**', '*.png'), recursive=True))
+    eager_time = timeit(lambda: [cv2.resize(cv2.imread(screenshot), (1080, 2280)) for screenshot in screenshots], repeat)
+    lazy_time = timeit(lambda: [UIData(screenshot) for screenshot in screenshots], repeat)
+    print('[UIData Loading] %d screenshots, eager decode and resize %.1fms, lazy screenshot %.1fms'
+          % (len(screenshots), eager_time * 1000, lazy_time * 1000))
+
+
+'''
+********************************
+*** Element Store Benchmarks ***
+********************************
+'''
+def benchmark_element_store(corpus_dir=DATA_PATH):
+    """
+    Compare the memory of the structural attributes in the element dicts against the columnar element store,
+    and the memory the store adds against the memory saved by sharing the coordinates of the bounds
+    """
+    preprocessor = _UIPreProcessor()
+    xml_files = collect_xml_corpus(corpus_dir)
+    total_dicts, total_store, total_bounds, total_unshared_bounds = 0, 0, 0, 0
+    for xml_file in xml_files:
+        ui_data = BenchUIData(xml_file)
+        preprocessor.ui_vh_xml_cvt_to_json(ui_data)
+        preprocessor.ui_info_extraction(ui_data)
+        tracemalloc.start()
+        structure = [{key: copy.copy(ele[key]) for key in ['class', 'resource-id', 'bounds', 'layer', 'leaf-id', 'children-id']
+                      + list(_UIElementStore.FLAG_NAMES) if key in ele} for ele in ui_data.elements]
+        total_dicts += tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del structure
+        total_store += ui_data.element_store.nbytes() + sum(sys.getsizeof(string) for string in ui_data.element_store.strings)
+        # the bounds with shared coordinates against parsing each coordinate into its own int,
+        # the ints in [-5, 256] are cached by python in both cases
+        counted = set()
+        for ele in ui_data.elements:
+            coordinates = [n for n in ele['bounds'] if not -5 <= n <= 256]
+            total_unshared_bounds += sys.getsizeof(ele['bounds']) + sum(sys.getsizeof(n) for n in coordinates)
+            total_bounds += sys.getsizeof(ele['bounds'])
+            for n in coordinates:
+                if id(n) not in counted:
+                    counted.add(id(n))
+                    total_bounds += sys.getsizeof(n)
+    print('[Element Store] %d dumps, structural attributes in element dicts %.1fKB, in element store %.1fKB, '
+          'bounds with shared coordinates %.1fKB against %.1fKB'
+          % (len(xml_files), total_dicts / 1024, total_store / 1024, total_bounds / 1024, total_unshared_bounds / 1024))
+
+
+'''
+*******************************
+*** Element Tree Benchmarks ***
+*******************************
+'''
+def legacy_build_element_tree(ui_data, start_element=None):
+    """
+    The recursive deepcopy + attribute deletion + str.replace path, kept as the baseline to compare with
+    """
+    def select_ele_attr(element, selected_attrs):
+        element_cp = copy.deepcopy(element)
+        for key in element_cp.keys():
+            if key == 'selected' and element[key]:
+                continue
+            if key not in selected_attrs or element[key] is None or element[key] == '':
+                del(element[key])
+
+    def simplify_ele_attr(element):
+        if 'resource-id' in element:
+            element['resource-id'] = element['resource-id'].replace('com', '')
+            element['resource-id'] = element['resource-id'].replace('android', '')
+            element['resource-id'] = element['resource-id'].replace('..', '.')
+            element['resource-id'] = element['resource-id'].replace('.:', ':')
+        if 'class' in element:
+            element['class'] = element['class'].replace('android', '')
+            element['class'] = element['class'].replace('..', '.')
+            element['class'] = element['class'].replace('.:', ':')
+
+    element_cp = copy.deepcopy(start_element if start_element is not None else ui_data.elements[0])
+    if 'children-id' in element_cp:
+        element_cp['children'] = []
+        for c_id in element_cp['children-id']:
+            element_cp['children'].append(legacy_build_element_tree(ui_data, ui_data.elements[c_id]))
+        select_ele_attr(element_cp, ['scrollable', 'id', 'resource-id', 'class', 'clickable', 'children', 'description'])
+    else:
+        select_ele_attr(element_cp, ['id', 'resource-id', 'class', 'clickable', 'children', 'description'])
+    simplify_ele_attr(element_cp)
+    return element_cp
+
+
+def trace_peak_memory(func):
+    """
+    Return the peak memory allocated while running the func
+    """
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def benchmark_element_tree(corpus_dir=DATA_PATH, repeat=5):
+    """
+    Compare the build time and peak memory of the element tree built from the element store
+    against the legacy deepcopy path
+    """
+    preprocessor = _UIPreProcessor()
+    analyser = _UIAnalyser()
+    xml_files = collect_xml_corpus(corpus_dir)
+    total_legacy, total_store = 0, 0
+    peak_legacy, peak_store = 0, 0
+    for xml_file in xml_files:
+        ui_data = BenchUIData(xml_file)
+        preprocessor.ui_vh_xml_cvt_to_json(ui_data)
+        preprocessor.ui_info_extraction(ui_data)
+        analyser.ui_build_element_tree(ui_data)
+        assert ui_data.element_tree == legacy_build_element_tree(ui_data), 'Mismatched element tree for ' + xml_file
+
+        total_legacy += timeit(lambda: legacy_build_element_tree(ui_data), repeat)
+        total_store += timeit(lambda: analyser.ui_build_element_tree(ui_data), repeat)
+        peak_legacy = max(peak_legacy, trace_peak_memory(lambda: legacy_build_element_tree(ui_data)))
+        peak_store = max(peak_store, trace_peak_memory(lambda: analyser.ui_build_element_tree(ui_data)))
+    print('[Element Tree] %d dumps, legacy %.2fms (peak %.1fKB), element store %.2fms (peak %.1fKB), speedup x%.2f'
+          % (len(xml_files), total_legacy * 1000, peak_legacy / 1024, total_store * 1000, peak_store / 1024,
+             total_legacy / max(total_store, 1e-9)))
+
+
+def legacy_get_ui_element_node_by_id(node, ele_id):
+    """
+    The recursive descent through the element tree, kept as the baseline to compare with
+    """
+    if node['id'] == ele_id:
+        return node
+    if node['id'] > ele_id:
+        return None
+    if 'children' in node:
+        last_child = None
+        for child in node['children']:
+            if child['id'] == ele_id:
+                return child
+            if child['id'] > ele_id:
+                break
+            last_child = child
+        return legacy_get_ui_element_node_by_id(last_child, ele_id)
+
+
+def benchmark_element_lookup(corpus_dir=DATA_PATH, repeat=5):
+    """
+    Compare looking up every element by id and its nearest clickable ancestor through the id-indexed maps
+    against the recursive descent through the element tree and walking up the parents
+    """
+    def legacy_lookup(ui_data):
+        parents = {c_id: ele['id'] for ele in ui_data.elements for c_id in ele.get('children-id', [])}
+        for ele in ui_data.elements:
+            legacy_get_ui_element_node_by_id(ui_data.element_tree, ele['id'])
+            ele_id = ele['id']
+            while ele_id is not None and not ui_data.elements[ele_id]['clickable']:
+                ele_id = parents.get(ele_id)
+
+    def indexed_lookup(ui_data):
+        for ele in ui_data.elements:
+            _UIUtil.get_ui_element_node_by_id(ui_data, ele['id'])
+            _UIUtil.get_nearest_clickable_ancestor(ui_data, ele['id'])
+
+    preprocessor = _UIPreProcessor()
+    analyser = _UIAnalyser()
+    xml_files = collect_xml_corpus(corpus_dir)
+    total_legacy, total_indexed, total_elements = 0, 0, 0
+    for xml_file in xml_files:
+        ui_data = BenchUIData(xml_file)
+        preprocessor.ui_vh_xml_cvt_to_json(ui_data)
+        preprocessor.ui_info_extraction(ui_data)
+        analyser.ui_build_element_tree(ui_data)
+        total_legacy += timeit(lambda: legacy_lookup(ui_data), repeat)
+        total_indexed += timeit(lambda: indexed_lookup(ui_data), repeat)
+        total_elements += len(ui_data.elements)
+    print('[Element Lookup] %d dumps, %d elements, tree descent %.2fms, id-indexed maps %.2fms, speedup x%.2f'
+          % (len(xml_files), total_elements, total_legacy * 1000, total_indexed * 1000,
+             total_legacy / max(total_indexed, 1e-9)))
+
+
+'''
+********************************
+*** UI Similarity Benchmarks ***
+********************************
+'''
+def benchmark_ui_similarity(corpus_dir=DATA_PATH):
+    """
+    Compare the structural fingerprints against SequenceMatcher over the string of the element trees,
+    on the pairs of the consecutive dumps in the corpus
+    """
+    preprocessor = _UIPreProcessor()
+    analyser = _UIAnalyser()
+    ui_similarity = _UISimilarity()
+    ui_datas = []
+    for xml_file in collect_xml_corpus(corpus_dir):
+        ui_data = BenchUIData(xml_file)
+        preprocessor.ui_vh_xml_cvt_to_json(ui_data)
+        preprocessor.ui_info_extraction(ui_data)
+        analyser.ui_build_element_tree(ui_data)
+        ui_datas.append(ui_data)
+    start = time.perf_counter()
+    for ui_data in ui_datas:
+        ui_similarity.fingerprint(ui_data)
+    t_fingerprint = time.perf_counter() - start
+
+    t_sequence, t_minhash, t_content, t_ted = 0, 0, 0, 0
+    for ui_data1, ui_data2 in zip(ui_datas, ui_datas[1:]):
+        start = time.perf_counter()
+        sequence = SequenceMatcher(None, str(ui_data1.element_tree), str(ui_data2.element_tree)).ratio()
+        t_sequence += time.perf_counter() - start
+        start = time.perf_counter()
+        minhash = ui_similarity.structure_similarity(ui_data1, ui_data2)
+        t_minhash += time.perf_counter() - start
+        start = time.perf_counter()
+        content = ui_similarity.content_similarity(ui_data1, ui_data2)
+        t_content += time.perf_counter() - start
+        start = time.perf_counter()
+        ted = ui_similarity.tree_edit_similarity(ui_data1, ui_data2)
+        t_ted += time.perf_counter() - start
+        print('%s vs %s: SequenceMatcher %.2f, structure minhash %.2f, content minhash %.2f, tree edit %.2f'
+              % (ui_data1.xml_file, ui_data2.xml_file, sequence, minhash, content, ted))
+    print('[UI Similarity] %d pairs, SequenceMatcher %.2fms, fingerprints %.2fms for %d uis, structure minhash %.2fms, '
+          'content minhash %.2fms, tree edit distance %.2fms'
+          % (len(ui_datas) - 1, t_sequence * 1000, t_fingerprint * 1000, len(ui_datas), t_minhash * 1000,
+             t_content * 1000, t_ted * 1000))
+
+
+def benchmark_ui_change_detection(corpus_dir=DATA_PATH, repeat=5):
+    """
+    Time the screen change detection of each UI against a recapture of itself and against the next UI in the corpus,
+    comparing the screenshots when the dump has one
+    """
+    preprocessor = _UIPreProcessor()
+    change_detector = _UIChangeDetector()
+
+    def load_ui(xml_file):
+        screenshot_file = xml_file[:-4] + '.png'
+        ui_data = UIData(screenshot_file=screenshot_file if os.path.exists(screenshot_file) else None, xml_file=xml_file,
+                         ui_id=os.path.basename(xml_file)[:-4])
+        preprocessor.ui_vh_xml_cvt_to_json(ui_data)
+        preprocessor.ui_info_extraction(ui_data)
+        return ui_data
+
+    def detect(ui_data, prev_ui_data):
+        # count the fingerprints and thumbnails in, as they are computed once for every captured UI
+        ui_data.fingerprint, ui_data.screenshot_thumbnail = None, None
+        return change_detector.detect_change(ui_data, prev_ui_data)[0]
+
+    xml_files = collect_xml_corpus(corpus_dir)
+    ui_datas = [load_ui(xml_file) for xml_file in xml_files]
+    changes = {}
+    total_same, total_next = 0, 0
+    for i, ui_data in enumerate(ui_datas):
+        recapture = load_ui(xml_files[i])
+        assert detect(recapture, ui_data) == _UIChangeDetector.UNCHANGED, 'Changed recapture of ' + xml_files[i]
+        total_same += timeit(lambda: detect(recapture, ui_data), repeat)
+        if i + 1 < len(ui_datas):
+            change = detect(ui_datas[i + 1], ui_data)
+            changes[change] = changes.get(change, 0) + 1
+            total_next += timeit(lambda: detect(ui_datas[i + 1], ui_data), repeat)
+    print('[UI Change Detection] %d uis, recapture %.2fms per ui, next ui %.2fms per ui, next ui changes %s'
+          % (len(ui_datas), total_same * 1000 / len(ui_datas), total_next * 1000 / max(len(ui_datas) - 1, 1), changes))
+
+
+'''
+*******************************
+*** Page Settle Benchmarks ***
+*******************************
+'''
+def benchmark_settle_waiting(n_actions=50, wait_time=3, capture_time=0.15, seed=0):
+    """
+    Compare the simulated time waited after the actions by the fixed sleep against the adaptive settle polling,
+    over pages loading in random times with a spinner changing the screen every 0.3s until loaded.
+    The capture_time is the cost of each capture, counted towards the poll interval
+    """
+    rng = np.random.RandomState(seed)
+    frames = [np.full((2400, 1080, 3), level, dtype=np.uint8) for level in range(0, 250, 25)]
+    device = SimulatedDevice(capture_time=capture_time)
+    total_fixed, total_adaptive, total_late = 0, 0, 0
+    for i in range(n_actions):
+        app = 'app%d' % (i % 3)
+        load_time = rng.uniform(0.3, 2.5) if app != 'app2' else rng.uniform(0.2, 0.6)
+        loading = [(seconds, frames[k % 9]) for k, seconds in enumerate(np.arange(0, load_time, 0.3))]
+        device.replay(loading + [(load_time, frames[9])])
+        start = device.now
+        device.wait_for_settle(timeout=wait_time, app=app)
+        total_adaptive += device.now - start
+        total_fixed += wait_time
+        # waits that ended before the page loaded
+        total_late += device.now - start < load_time
+    print('[Page Settle] %d actions, fixed sleep %.1fs, adaptive polling %.1fs in %d captures, %d ended before loaded, '
+          'learned %s' % (n_actions, total_fixed, total_adaptive, device.captures, total_late,
+                          {app: round(stats['median'], 2) for app, stats in device.settle_detector.get_settle_stats().items()}))
+
+
+if __name__ == '__main__':
+    benchmark_vh_parsing()
+    benchmark_tree_serialization()
+    benchmark_task_history()
+    benchmark_save_ui_data()
+    benchmark_ui_data_loading()
+    benchmark_element_store()
+    benchmark_element_tree()
+    benchmark_element_lookup()
+    benchmark_ui_similarity()
+    benchmark_ui_change_detection()
+    benchmark_settle_waiting()
+    # captures as slow as a full screenshot over adb on a slow device
+    benchmark_settle_waiting(capture_time=0.6)
@@ -7,12 +7,12 @@ import tqdm
 from uta.DataStructures import *
 from uta.ModelManagement import ModelManager
 from uta.ModelManagement.OpenAI import _OpenAI
-from uta.ModelManagement.GoogleOCR import _GoogleOCR
+from uta.ModelManagement.GoogleOCR import _GoogleOCR, _OCRCache
 
-from uta.SystemConnection import _Local, SystemConnector
+from uta.SystemConnection import _Local, SystemConnector, _SQLiteStorageBackend
 from uta.UIProcessing import UIProcessor, _UIChecker
 from uta.TaskDeclearation import TaskDeclarator
-from testing.Device import Device
+from testing.Device import Device, SimulatedDevice
 
 from uta.ThirdPartyAppManagement import ThirdPartyAppManager, _GooglePlay
 from uta.TaskAction import _TaskUIChecker, TaskActionChecker
@@ -50,6 +50,51 @@ def test_llmmodel():
         conversation.append(msg)
 
 
+def test_llmmodel_mock_server():
+    import json
+    import asyncio
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MockHandler(BaseHTTPRequestHandler):
+        # rate limit the first attempt of every conversation to exercise the retries
+        seen_messages = set()
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            if str(body['messages']) not in MockHandler.seen_messages:
+                MockHandler.seen_messages.add(str(body['messages']))
+                self.send_response(429)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({'error': {'message': 'rate limited'}}).encode())
+                return
+            content = body['messages'][-1]['content']
+            resp = {'id': 'mock', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': json.dumps({'echo': str(content)[:20]})}}],
+                    'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2}}
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(resp).encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    llm_model = _OpenAI(api_key='mock', base_url='http://127.0.0.1:%d/v1' % server.server_port, retry_backoff=0.01)
+    print(llm_model.send_openai_conversation([{'role': 'user', 'content': 'sync'}]))
+
+    async def send_concurrently():
+        conversations = [[{'role': 'user', 'content': 'async %d' % i}] for i in range(10)]
+        return await asyncio.gather(*[llm_model.send_openai_conversation_async(c, runtime=False) for c in conversations])
+    print(asyncio.run(send_concurrently()))
+    print(llm_model.send_gpt4_vision_base64_imgs('what is it?', []))
+    server.shutdown()
+
+
 def test_googleocr():
     img_path = WORK_PATH + 'old_test_data/test/general/0.png'
     google_ocr = _GoogleOCR()
@@ -58,6 +103,38 @@ def test_googleocr():
     print(img_data2)
 
 
+def test_ocr_cache():
+    img_path = WORK_PATH + 'data/user1/task1/0.png'
+    calls = []
+
+    def stub_ocr(path):
+        calls.append(path)
+        return [{'id': 0, 'bounds': [77, 20, 151, 48], 'content': '5:08'}]
+
+    ocr_cache = _OCRCache(cache_dir=WORK_PATH + 'old_test_data/test/ocr_cache', max_entries=2)
+    ocr_cache.clear()
+    texts = ocr_cache.detect_text_ocr(img_path, stub_ocr)
+    assert ocr_cache.detect_text_ocr(img_path, stub_ocr) == texts and len(calls) == 1
+    # persisted entries are reloaded by a new cache
+    assert _OCRCache(cache_dir=ocr_cache.cache_dir).detect_text_ocr(img_path, stub_ocr) == texts and len(calls) == 1
+    print(ocr_cache.stats())
+
+
+def test_region_ocr():
+    class StubOCR:
+        # stand-in ocr engine that detects one text at the top-left corner of the image
+        def detect_text_ocr(self, img_path, img_bytes=None):
+            # the mosaic is sent in memory without a file
+            return [{'id': 0, 'bounds': [2, 2, 30, 20], 'content': img_path.split('/')[-1] if img_path is not None else 'mosaic'}]
+
+    model_manager = ModelManager(ocr_model=StubOCR())
+    ui_processor = UIProcessor(model_manager)
+    ui = UIData(WORK_PATH + 'data/user1/task1/0.png', WORK_PATH + 'data/user1/task1/0.xml', (1080, 2400))
+    ui_processor.process_ui(ui, region_ocr=True)
+    print([(ele['id'], ele['ocr']) for ele in ui.elements_leaves if 'ocr' in ele])
+    print(ui.ocr_text)
+
+
 def test_iconclassifier():
     img_path = WORK_PATH + 'old_test_data/test/classification/a1.jpg'
     icon_classifier = _IconClassifier()
@@ -90,6 +167,14 @@ def test_model_manager():
 
     token_counts = model_manager.count_token_size("I like apple.")
     print(token_counts)
+    print(model_manager.count_tokens_many(["I like apple.", "I like banana too."]))
+
+    conversation = [{'role': 'system', 'content': 'You are a helpful assistant.'}]
+    token_counter = model_manager.create_conversation_token_counter()
+    for i in range(3):
+        conversation.append({'role': 'user', 'content': f'Step {i}: click the element {i}.'})
+        # only the appended message is encoded
+        print(token_counter.count_conversation(conversation))
 
 
 def test_local():
@@ -135,6 +220,32 @@ def test_systemcomnnector():
     system_connector.save_ui_data(ui_data, DATA_PATH + 'user1/task1/')
 
 
+def test_task_journal():
+    system_connector = SystemConnector()
+    task = Task(task_id='journal', user_id='test', task_description='Turn on the dark mode')
+    for i in range(5):
+        task.relations.append({'Relation': 'Directly related', 'Element Id': str(i), 'Action': 'Click'})
+        task.full_automation_conversation.append({'role': 'user', 'content': f'Step {i}'})
+        # only the new relation and conversation are appended to the journal
+        system_connector.save_task(task)
+
+    # write the saves behind in session, then rebuild the task from the snapshot and the journal
+    system_connector.flush_task('test', 'journal')
+    loaded = SystemConnector().load_task('test', 'journal')
+    print(loaded.relations)
+    print(loaded.to_dict() == task.to_dict())
+
+
+def test_storage_backend():
+    # copy the file data of the test user into SQLite and use it as the storage
+    backend = _SQLiteStorageBackend(DATA_PATH + 'uta.sqlite')
+    print(SystemConnector().export_to_backend(backend, prefix='test/'))
+    system_connector = SystemConnector(backend=backend)
+    print(backend.list_tasks('test'))
+    print(system_connector.load_task('test', 'journal').relations)
+    system_connector.close()
+
+
 def test_uiprocessor():
     model_manager = ModelManager()
     ui_processor = UIProcessor(model_manager)
@@ -287,6 +398,28 @@ def test_device():
     # device.take_action(action, ui_data=gui, show=True)
 
 
+def test_settle_detector():
+    # a page loading over 1.2s, then a screen with a blinking cursor
+    screen = cv2.imread(DATA_PATH + 'user1/task1/0.png')
+    loading = [screen // 4, screen // 2, screen]
+    blink = screen.copy()
+    cv2.line(blink, (500, 500), (500, 540), (0, 0, 0), 3)
+    device = SimulatedDevice(capture_time=0.1)
+    for i in range(5):
+        device.replay([(0, loading[0]), (0.4, loading[1]), (0.8, loading[0]), (1.2, loading[2]),
+                       (1.5, blink), (1.8, screen)])
+        start = device.now
+        print(device.wait_for_settle(timeout=3, app='app'), 'settled in %.2fs' % (device.now - start))
+    print(device.settle_detector.get_settle_stats(), device.captures)
+    # a screen that never settles waits until the timeout
+    device.replay([(t / 10, screen if t % 2 else blink // 2) for t in range(100)])
+    print(device.wait_for_settle(timeout=3, app='video'))
+    # a screen that looks settled still waits for the minimum time
+    device.replay([(0, screen)])
+    start = device.now
+    print(device.wait_for_settle(timeout=3, app='still', min_waiting_time=1), 'waited %.2fs' % (device.now - start))
+
+
 def test_taskuichecker():
     model_manager = ModelManager()
     task_ui_checker = _TaskUIChecker(model_manager)
@@ -486,12 +619,17 @@ if __name__ == '__main__':
     # test_task()
 
     # test_llmmodel()
+    # test_llmmodel_mock_server()
     # test_googleocr()
+    # test_ocr_cache()
+    # test_region_ocr()
     # test_iconclassifier()
     # test_model_manager()
 
     # test_local()
     # test_systemcomnnector()
+    # test_task_journal()
+    # test_storage_backend()
     # test_uiprocessor()
     # test_task_declarator()
 
@@ -499,6 +637,7 @@ if __name__ == '__main__':
     # test_appmanager()
 
     # test_device()
+    # test_settle_detector()
     get_package()
     # test_taskuichecker()
     # test_actionchecker()
@@ -151,14 +151,25 @@ class TaskList:
         Return:
             task_match (dict): {"RelatedTasks": [] or "None", "Reason":}
         """
+        return self.__model_manager.run_sync(self.match_task_to_list_async(task))
+
+    async def match_task_to_list_async(self, task):
+        """
+        Awaitable version of match_task_to_list
+        Args:
+            task (Task): Task object
+        Return:
+            task_match (dict): {"RelatedTasks": [] or "None", "Reason":}
+        """
         try:
-            if len(task.conversation_tasklist) == 0:
-                task.conversation_tasklist = [{'role': 'system', 'content': self.__system_prompt_task_match}]
+            conversation = task.conversation_tasklist if len(task.conversation_tasklist) > 0 else \
+                [{'role': 'system', 'content': self.__system_prompt_task_match}]
             prompt = self.__base_prompt_task_match.format(task=task.task_description)
             prompt += self.wrap_task_info(task)
-            task.conversation_tasklist.append({"role": "user", "content": prompt})
-            resp = self.__model_manager.send_fm_conversation(task.conversation_tasklist)
-            task.conversation_tasklist.append(resp)
+            conversation = conversation + [{"role": "user", "content": prompt}]
+            # only keep the prompt in the task once answered, in case the matching is cancelled
+            resp = await self.__model_manager.send_fm_conversation_async(conversation)
+            task.conversation_tasklist = conversation + [resp]
             task.res_task_match = self.transfer_to_dict(resp)
             task.res_task_match['Proc'] = 'TaskMatch'
             print(task.res_task_match)
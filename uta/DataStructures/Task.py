@@ -33,12 +33,14 @@ class Task(_Data):
         self.involved_app = None            # targeted app for task execution
         self.involved_app_package = None    # targeted app package or task execution
         self.clarification_user_msg = None  # user message for further clarification
+        self.declaration_latency = dict()   # {"Justify": seconds, "TaskMatch": seconds} of the last declaration
 
         # Only used when task automation
         self.conversation_automation = []   # List of conversations that occurred during multiple turns of task automation.
         self.full_automation_conversation = []  # for testing, store all conversation
         self.res_relation_check = dict()
         self.relations = []                 # List of relations associated with this task.
+        self.relation_screens = []          # Screen (activity or ui id) on which each relation was checked
         self.except_elements_ids = []       # List of except elements that have been tried and proved to be not related to the task
         self.step_hint = None
 
@@ -4,16 +4,41 @@ from uta.DataStructures._Data import _Data
 
 
 class Text(_Data):
+    # keep the text light-weight, as a screen can have thousands of ocr words to merge
+    __slots__ = ('id', 'content', 'bounds')
+
     def __init__(self, id, content, location):
         super().__init__()
         self.id = id
         self.content = content
-        self.location = location
+        self.bounds = [location['left'], location['top'], location['right'], location['bottom']]
+
+    @property
+    def location(self):
+        return {'left': self.bounds[0], 'top': self.bounds[1], 'right': self.bounds[2], 'bottom': self.bounds[3]}
+
+    @location.setter
+    def location(self, location):
+        self.bounds = [location['left'], location['top'], location['right'], location['bottom']]
+
+    @property
+    def width(self):
+        return self.bounds[2] - self.bounds[0]
+
+    @property
+    def height(self):
+        return self.bounds[3] - self.bounds[1]
+
+    @property
+    def area(self):
+        return self.width * self.height
+
+    @property
+    def word_width(self):
+        return self.width / len(self.content)
 
-        self.width = self.location['right'] - self.location['left']
-        self.height = self.location['bottom'] - self.location['top']
-        self.area = self.width * self.height
-        self.word_width = self.width / len(self.content)
+    def to_dict(self):
+        return {'id': self.id, 'content': self.content, 'location': self.location}
 
     '''
     ********************************
@@ -28,17 +53,17 @@ class Text(_Data):
              - 'v': vertical up-down connection
              - 'h': horizontal left-right connection
         """
-        l_a = self.location
-        l_b = ele_b.location
+        b_a = self.bounds
+        b_b = ele_b.bounds
         # connected vertically - up and below
         if direction == 'v':
             # left and right should be justified
-            if abs(l_a['left'] - l_b['left']) < max_bias_justify and abs(l_a['right'] - l_b['right']) < max_bias_justify:
+            if abs(b_a[0] - b_b[0]) < max_bias_justify and abs(b_a[2] - b_b[2]) < max_bias_justify:
                 return True
             return False
         elif direction == 'h':
             # top and bottom should be justified
-            if abs(l_a['top'] - l_b['top']) < max_bias_justify and abs(l_a['bottom'] - l_b['bottom']) < max_bias_justify:
+            if abs(b_a[1] - b_b[1]) < max_bias_justify and abs(b_a[3] - b_b[3]) < max_bias_justify:
                 return True
             return False
 
@@ -50,36 +75,30 @@ class Text(_Data):
              - 'h': horizontal left-right connection
         :return:
         """
-        l_a = self.location
-        l_b = text_b.location
+        b_a = self.bounds
+        b_b = text_b.bounds
         # connected vertically - up and below
         if direction == 'v':
             # left and right should be justified
             if self.is_justified(text_b, direction='v', max_bias_justify=bias_justify):
                 # top and bottom should be connected (small gap)
-                if abs(l_a['bottom'] - l_b['top']) < bias_gap or abs(l_a['top'] - l_b['bottom']) < bias_gap:
+                if abs(b_a[3] - b_b[1]) < bias_gap or abs(b_a[1] - b_b[3]) < bias_gap:
                     return True
             return False
         elif direction == 'h':
             # top and bottom should be justified
             if self.is_justified(text_b, direction='h', max_bias_justify=bias_justify):
                 # top and bottom should be connected (small gap)
-                if abs(l_a['right'] - l_b['left']) < bias_gap or abs(l_a['left'] - l_b['right']) < bias_gap:
+                if abs(b_a[2] - b_b[0]) < bias_gap or abs(b_a[0] - b_b[2]) < bias_gap:
                     return True
             return False
 
     def is_intersected(self, text_b, bias):
-        l_a = self.location
-        l_b = text_b.location
-        left_in = max(l_a['left'], l_b['left']) + bias
-        top_in = max(l_a['top'], l_b['top']) + bias
-        right_in = min(l_a['right'], l_b['right'])
-        bottom_in = min(l_a['bottom'], l_b['bottom'])
-
-        w_in = max(0, right_in - left_in)
-        h_in = max(0, bottom_in - top_in)
-        area_in = w_in * h_in
-        if area_in > 0:
+        b_a = self.bounds
+        b_b = text_b.bounds
+        w_in = min(b_a[2], b_b[2]) - max(b_a[0], b_b[0]) - bias
+        h_in = min(b_a[3], b_b[3]) - max(b_a[1], b_b[1]) - bias
+        if w_in > 0 and h_in > 0:
             return True
 
     '''
@@ -88,26 +107,14 @@ class Text(_Data):
     ***********************
     '''
     def merge_text(self, text_b):
-        text_a = self
-        top = min(text_a.location['top'], text_b.location['top'])
-        left = min(text_a.location['left'], text_b.location['left'])
-        right = max(text_a.location['right'], text_b.location['right'])
-        bottom = max(text_a.location['bottom'], text_b.location['bottom'])
-        self.location = {'left': left, 'top': top, 'right': right, 'bottom': bottom}
-        self.width = self.location['right'] - self.location['left']
-        self.height = self.location['bottom'] - self.location['top']
-        self.area = self.width * self.height
-
-        left_element = text_a
-        right_element = text_b
-        if text_a.location['left'] > text_b.location['left']:
-            left_element = text_b
-            right_element = text_a
-        self.content = left_element.content + ' ' + right_element.content
-        self.word_width = self.width / len(self.content)
+        b_a = self.bounds
+        b_b = text_b.bounds
+        # the merged text always starts from self, as the merged bounds are never on the right of text_b
+        self.content = self.content + ' ' + text_b.content
+        self.bounds = [min(b_a[0], b_b[0]), min(b_a[1], b_b[1]), max(b_a[2], b_b[2]), max(b_a[3], b_b[3])]
 
     def shrink_bound(self, binary_map):
-        bin_clip = binary_map[self.location['top']:self.location['bottom'], self.location['left']:self.location['right']]
+        bin_clip = binary_map[self.bounds[1]:self.bounds[3], self.bounds[0]:self.bounds[2]]
         height, width = np.shape(bin_clip)
 
         shrink_top = 0
@@ -121,7 +128,7 @@ class Text(_Data):
                     shrink_top = -1
             elif shrink_top == 1:
                 if sum(bin_clip[i]) != 0:
-                    self.location['top'] += i
+                    self.bounds[1] += i
                     shrink_top = -1
             # bottom
             if shrink_bottom == 0:
@@ -131,7 +138,7 @@ class Text(_Data):
                     shrink_bottom = -1
             elif shrink_bottom == 1:
                 if sum(bin_clip[height-i-1]) != 0:
-                    self.location['bottom'] -= i
+                    self.bounds[3] -= i
                     shrink_bottom = -1
 
             if shrink_top == -1 and shrink_bottom == -1:
@@ -148,7 +155,7 @@ class Text(_Data):
                     shrink_left = -1
             elif shrink_left == 1:
                 if sum(bin_clip[:, j]) != 0:
-                    self.location['left'] += j
+                    self.bounds[0] += j
                     shrink_left = -1
             # right
             if shrink_right == 0:
@@ -158,15 +165,11 @@ class Text(_Data):
                     shrink_right = -1
             elif shrink_right == 1:
                 if sum(bin_clip[:, width-j-1]) != 0:
-                    self.location['right'] -= j
+                    self.bounds[2] -= j
                     shrink_right = -1
 
             if shrink_left == -1 and shrink_right == -1:
                 break
-        self.width = self.location['right'] - self.location['left']
-        self.height = self.location['bottom'] - self.location['top']
-        self.area = self.width * self.height
-        self.word_width = self.width / len(self.content)
 
     '''
     *********************
@@ -1,33 +1,144 @@
 import cv2
+import weakref
+import numpy as np
 from uta.DataStructures._Data import _Data
+from uta.DataStructures._ScreenImage import _ScreenImage
+from uta.DataStructures._UIElementStore import _UIElementStore
 
 
 class UIData(_Data):
-    def __init__(self, screenshot_file, xml_file=None, resolution=(1080, 2280)):
+    def __init__(self, screenshot_file=None, xml_file=None, resolution=(1080, 2280), screenshot=None, xml=None, ui_id=None):
         """
+        The screenshot and vh can be given as files, or in memory as captured from the device without touching the disk
         Args:
             screenshot_file (path): .png or .jpg file path of the UI screenshot
             xml_file (path): .xml file path of the UI vh
             resolution (tuple): Specify the size/resolution of the UI
+            screenshot (bytes or ndarray): Encoded png/jpg bytes or decoded image of the screenshot, used instead of reading the screenshot_file
+            xml (str): Content of the UI vh, used instead of reading the xml_file
+            ui_id (str): Id of the UI, None to use the name of the screenshot_file
         """
         super().__init__()
         self.screenshot_file = screenshot_file
         self.xml_file = xml_file
-        self.ui_id = screenshot_file.replace('/', '\\').split('\\')[-1].split('.')[0]
+        self.xml = xml
+        self.ui_id = ui_id if ui_id is not None else screenshot_file.replace('/', '\\').split('\\')[-1].split('.')[0]
 
         # UI info
-        self.ui_screenshot = cv2.resize(cv2.imread(screenshot_file), resolution)   # ui screenshot
+        # the screenshot is read and decoded once, and shared with the ocr
+        self.screenshot = _ScreenImage(screenshot if screenshot is not None else screenshot_file, path=screenshot_file)
+        self.resolution = tuple(resolution)
+        self.__ui_screenshot = None     # ui screenshot in the resolution, decoded on first use
+        self.screenshot_thumbnail = None    # small grayscale screenshot, to detect the screen change
+        self.__changed_tiles = None     # (weakref of the previous UIData, tile size, changed tiles) of the last diff
         self.annotated_elements_screenshot = None
         self.annotated_elements_screenshot_path = None
+        self.annotated_elements_screenshot_encoded = None   # encoded bytes of the annotated screenshot, for the vision model
+        self.annotated_elements_ops = None  # drawing operations that produce the annotated screenshot
         self.ui_vh_json = None      # ui vh json, after processing
 
         # UI elements
         self.elements_ids = 0       # count elements
+        self.elements_version = 0   # bumped when the elements are replaced or changed, to rebuild the element store
+        self.__element_store_version = None     # elements_version the element store is built from
         self.elements = []          # list of element in dictionary {'id':, 'class':...}
         self.elements_leaves = []   # leaf nodes that does not have children
         self.element_tree = None    # structural element tree, dict type
+        self.element_tree_nodes = []    # node of each element in the element tree, indexed by id
         self.blocks = []            # list of blocks from element tree
         self.ocr_text = []          # UI ocr detection result, list of __texts {}
+        self.element_signatures = []    # subtree signature of each element, to diff against other UIs
+        self.elements_spatial_index = None  # spatial index over the bounds of elements, for coordinate lookup
+        self.element_store = None   # columnar store of the structural attributes of elements, indexed by id
+        self.fingerprint = None     # structural fingerprint of the UI, to compare with other UIs
+
+    @property
+    def ui_screenshot(self):
+        """
+        Screenshot in the UI resolution, decoded and resized on the first use, so the text-only processing never
+        decodes the pixels. A screenshot already in the resolution is used as decoded without resizing
+        """
+        if self.__ui_screenshot is None:
+            if self.screenshot.size == self.resolution:
+                self.__ui_screenshot = self.screenshot.decoded
+            else:
+                self.__ui_screenshot = cv2.resize(self.screenshot.decoded, self.resolution)
+        return self.__ui_screenshot
+
+    @ui_screenshot.setter
+    def ui_screenshot(self, ui_screenshot):
+        self.__ui_screenshot = ui_screenshot
+
+    @property
+    def elements(self):
+        return self.__elements
+
+    @elements.setter
+    def elements(self, elements):
+        self.__elements = elements
+        self.mark_elements_changed()
+
+    def mark_elements_changed(self):
+        """
+        Invalidate the element store and the fingerprint after changing the elements in place
+        (bounds, flags, class, resource-id, text, content-desc, layer or children), replacing the elements
+        invalidates them already
+        """
+        self.elements_version += 1
+
+    def get_element_store(self):
+        """
+        Return the columnar store of the elements, rebuilt from the element dicts if they changed since it was built
+        """
+        if self.element_store is None or self.__element_store_version != self.elements_version:
+            self.element_store = _UIElementStore(self.elements)
+            self.__element_store_version = self.elements_version
+        return self.element_store
+
+    def get_element_tree_nodes(self):
+        """
+        Return the element tree node of each element indexed by id, indexed from the element tree if not built with it
+        """
+        if self.element_tree is not None and len(self.element_tree_nodes) != len(self.elements):
+            self.element_tree_nodes = [None] * len(self.elements)
+            nodes = [self.element_tree]
+            while len(nodes) > 0:
+                node = nodes.pop()
+                self.element_tree_nodes[node['id']] = node
+                nodes += node.get('children', [])
+        return self.element_tree_nodes
+
+    def get_changed_tiles(self, prev_ui_data, tile_size=60):
+        """
+        Diff the ui screenshot against the previous UI on a grid of tiles, computed once and shared by the incremental
+        analysis and the annotation of the UI
+        Args:
+            prev_ui_data (UIData): The previous UI
+            tile_size (int): Size of the square tiles
+        Returns:
+            changed_tiles (ndarray): (rows, cols) bool grid, True for the tiles with changed pixels,
+                                     None if the screenshots are not in the same size
+        """
+        # the previous UIData is referenced weakly rather than by its id, which a freed UIData can pass on to another,
+        # and not strongly, which would keep the chain of all the previous UIs alive
+        if self.__changed_tiles is not None and self.__changed_tiles[0]() is prev_ui_data \
+                and self.__changed_tiles[1] == tile_size:
+            return self.__changed_tiles[2]
+        changed_tiles = None
+        if prev_ui_data.ui_screenshot.shape == self.ui_screenshot.shape:
+            height, width = self.ui_screenshot.shape[:2]
+            rows, cols = -(-height // tile_size), -(-width // tile_size)
+            pixel_changed = np.any(self.ui_screenshot != prev_ui_data.ui_screenshot, axis=2)
+            pixel_changed = np.pad(pixel_changed, ((0, rows * tile_size - height), (0, cols * tile_size - width)))
+            changed_tiles = pixel_changed.reshape(rows, tile_size, cols, tile_size).any(axis=(1, 3))
+        self.__changed_tiles = (weakref.ref(prev_ui_data), tile_size, changed_tiles)
+        return changed_tiles
+
+    def is_screenshot_loaded(self):
+        """
+        Check whether the ui screenshot has been decoded
+        """
+        return self.__ui_screenshot is not None
 
     '''
     *********************
@@ -1,4 +1,6 @@
 class _Data:
+    __slots__ = ()
+
     def __init__(self):
         pass
 
@@ -0,0 +1,108 @@
+import cv2
+import numpy as np
+
+
+class _ScreenImage:
+    def __init__(self, source, path=None):
+        """
+        A screenshot held in memory once and shared by the UI processing and the ocr, so it is read from the file
+        at most once and decoded at most once, lazily on the first use of the pixels
+        Args:
+            source (path, bytes or ndarray): Image file path, encoded png/jpg bytes or decoded cv2 image
+            path (path): File of the image if any, kept for the consumers that still need a file
+        """
+        self.path = path if path is not None or not isinstance(source, str) else source
+        self.__file = source if isinstance(source, str) else None
+        self.__encoded = bytes(source) if isinstance(source, (bytes, bytearray)) else None
+        self.__decoded = source if isinstance(source, np.ndarray) else None
+
+    @property
+    def encoded(self):
+        """
+        Encoded image bytes, read from the file or png-encoded from the pixels on first use
+        """
+        if self.__encoded is None:
+            if self.__file is not None:
+                with open(self.__file, 'rb') as fp:
+                    self.__encoded = fp.read()
+            else:
+                self.__encoded = cv2.imencode('.png', self.__decoded)[1].tobytes()
+        return self.__encoded
+
+    @property
+    def decoded(self):
+        """
+        Decoded BGR image, decoded from the encoded bytes on first use
+        """
+        if self.__decoded is None:
+            self.__decoded = cv2.imdecode(np.frombuffer(self.encoded, np.uint8), cv2.IMREAD_COLOR)
+        return self.__decoded
+
+    @property
+    def size(self):
+        """
+        (width, height) of the image, read from the png or jpg header without decoding the pixels
+        """
+        if self.__decoded is not None:
+            return self.__decoded.shape[1], self.__decoded.shape[0]
+        if self.__encoded is None and self.__file is not None:
+            # the header is at the start of the file, so the file is not read whole just for the size
+            with open(self.__file, 'rb') as fp:
+                size = self.read_header_size(fp.read(65536))
+        else:
+            size = self.read_header_size(self.encoded)
+        if size is None:
+            return self.decoded.shape[1], self.decoded.shape[0]
+        return size
+
+    @staticmethod
+    def read_header_size(data):
+        """
+        Read the size from the header of an encoded png or jpg image
+        Args:
+            data (bytes): Start of the encoded image
+        Returns:
+            size (tuple): (width, height), None if the header is not recognized
+        """
+        if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR':
+            return int.from_bytes(data[16:20], 'big'), int.from_bytes(data[20:24], 'big')
+        if data[:2] == b'\xff\xd8':
+            # walk the jpg segments to the start of frame, which holds the size
+            i = 2
+            while i + 9 <= len(data) and data[i] == 0xFF:
+                marker = data[i + 1]
+                if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+                    return int.from_bytes(data[i + 7:i + 9], 'big'), int.from_bytes(data[i + 5:i + 7], 'big')
+                i += 2 + int.from_bytes(data[i + 2:i + 4], 'big')
+        return None
+
+    def thumbnail(self, size):
+        """
+        Small grayscale image to compare screens, from the pixels if decoded, otherwise decoded in gray at half the scale,
+        so comparing the screens does not decode the full color image.
+        Smaller decoding scales are cheaper for jpg but subsample the pixels too coarsely to match the decoded path
+        Args:
+            size (tuple): (width, height) of the thumbnail
+        Returns:
+            thumbnail (ndarray): Grayscale image, None if there is no image or it can not be decoded
+        """
+        if self.__decoded is None and self.__encoded is None and self.__file is None:
+            return None
+        if self.__decoded is not None:
+            gray = cv2.cvtColor(self.__decoded, cv2.COLOR_BGR2GRAY)
+        else:
+            gray = cv2.imdecode(np.frombuffer(self.encoded, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_2)
+        if gray is None:
+            return None
+        return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+    def is_decoded(self):
+        return self.__decoded is not None
+
+    def save(self, file_path):
+        """
+        Write the encoded image to the file, and use it as the path of the image
+        """
+        with open(file_path, 'wb') as fp:
+            fp.write(self.encoded)
+        self.path = file_path
@@ -0,0 +1,246 @@
+import numpy as np
+
+
+class _UIElementView:
+    """
+    Attribute access to one element of the _UIElementStore, without building a dict
+    """
+    __slots__ = ('store', 'id')
+
+    def __init__(self, store, ele_id):
+        self.store = store
+        self.id = ele_id
+
+    @property
+    def bounds(self):
+        return self.store.bounds[self.id].tolist()
+
+    @property
+    def layer(self):
+        return int(self.store.layers[self.id])
+
+    @property
+    def parent_id(self):
+        parent = int(self.store.parents[self.id])
+        return parent if parent >= 0 else None
+
+    @property
+    def children_ids(self):
+        return self.store.children_of(self.id)
+
+    @property
+    def leaf_id(self):
+        leaf = int(self.store.leaf_ids[self.id])
+        return leaf if leaf >= 0 else None
+
+    @property
+    def is_leaf(self):
+        return self.store.leaf_ids[self.id] >= 0
+
+    @property
+    def class_name(self):
+        return self.store.string(self.store.class_codes[self.id])
+
+    @property
+    def resource_id(self):
+        return self.store.string(self.store.resource_codes[self.id])
+
+    @property
+    def clickable(self):
+        return self.flag('clickable')
+
+    @property
+    def scrollable(self):
+        return self.flag('scrollable')
+
+    def flag(self, name):
+        return bool(self.store.flags[self.id] & self.store.flag_bit(name))
+
+    def to_dict(self):
+        """
+        Dict of the structural attributes, in the keys of the element dicts
+        """
+        element = {'id': self.id, 'class': self.class_name, 'resource-id': self.resource_id, 'bounds': self.bounds,
+                   'layer': self.layer}
+        for name in _UIElementStore.FLAG_NAMES:
+            element[name] = self.flag(name)
+        if self.is_leaf:
+            element['leaf-id'] = self.leaf_id
+        else:
+            element['children-id'] = self.children_ids
+        return element
+
+    def __repr__(self):
+        return '_UIElementView(%d, %s)' % (self.id, self.class_name)
+
+
+class _UIElementStore:
+    """
+    Columnar store of the structural attributes of the UI elements, indexed by element id:
+    numpy arrays of the bounds, boolean flags, layer, parent and children, and interned class and resource-id strings.
+    Hot loops over the elements read the arrays instead of the element dicts, which stay as the public view
+    """
+    # boolean uiautomator attributes packed into the bits of the flags
+    FLAG_NAMES = ('clickable', 'scrollable', 'selected', 'checkable', 'checked', 'focusable', 'focused', 'enabled',
+                  'long-clickable', 'password')
+    __flag_bits = {name: 1 << i for i, name in enumerate(FLAG_NAMES)}
+
+    def __init__(self, elements):
+        """
+        Args:
+            elements (list of dict): UIData.elements, indexed by id, with children after their parents
+        """
+        n = len(elements)
+        self.strings = []           # interned strings, indexed by the codes
+        self.__string_codes = {}    # {string: code}
+        self.bounds = np.zeros((n, 4), dtype=np.int32)
+        self.flags = np.zeros(n, dtype=np.uint16)
+        self.layers = np.zeros(n, dtype=np.int16)
+        self.parents = np.full(n, -1, dtype=np.int32)
+        self.leaf_ids = np.full(n, -1, dtype=np.int32)
+        self.class_codes = np.full(n, -1, dtype=np.int32)
+        self.resource_codes = np.full(n, -1, dtype=np.int32)
+        # children of element i are children[children_offsets[i]: children_offsets[i + 1]]
+        self.children_offsets = np.zeros(n + 1, dtype=np.int32)
+        # the ids are in pre-order, so the subtree of element i is the ids in [i, subtree_ends[i])
+        self.subtree_ends = np.zeros(n, dtype=np.int32)
+        # nearest clickable element at or above element i, -1 if none
+        self.clickable_ancestors = np.full(n, -1, dtype=np.int32)
+        children = []
+        parents, clickable_ancestors = [-1] * n, [-1] * n
+        for i, ele in enumerate(elements):
+            self.bounds[i] = ele['bounds']
+            flags = 0
+            for name in self.FLAG_NAMES:
+                if ele.get(name):
+                    flags |= self.__flag_bits[name]
+            self.flags[i] = flags
+            if flags & self.__flag_bits['clickable']:
+                clickable_ancestors[i] = i
+            elif parents[i] >= 0:
+                clickable_ancestors[i] = clickable_ancestors[parents[i]]
+            self.layers[i] = ele.get('layer', 0)
+            self.leaf_ids[i] = ele.get('leaf-id', -1)
+            self.class_codes[i] = self.intern(ele.get('class'))
+            self.resource_codes[i] = self.intern(ele.get('resource-id'))
+            for c_id in ele.get('children-id', []):
+                parents[c_id] = i
+                children.append(c_id)
+            self.children_offsets[i + 1] = len(children)
+        self.children = np.array(children, dtype=np.int32)
+        self.parents[:] = parents
+        self.clickable_ancestors[:] = clickable_ancestors
+        subtree_ends = list(range(1, n + 1))
+        for i in range(n - 1, 0, -1):
+            if parents[i] >= 0 and subtree_ends[i] > subtree_ends[parents[i]]:
+                subtree_ends[parents[i]] = subtree_ends[i]
+        self.subtree_ends[:] = subtree_ends
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def __getitem__(self, ele_id):
+        return _UIElementView(self, ele_id)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield _UIElementView(self, i)
+
+    '''
+    ***************
+    *** Strings ***
+    ***************
+    '''
+    def intern(self, string):
+        """
+        Returns:
+            code (int): Code of the string in the store, -1 for None
+        """
+        if string is None:
+            return -1
+        code = self.__string_codes.get(string)
+        if code is None:
+            code = len(self.strings)
+            self.__string_codes[string] = code
+            self.strings.append(string)
+        return code
+
+    def string(self, code):
+        return self.strings[code] if code >= 0 else None
+
+    @classmethod
+    def flag_bit(cls, name):
+        return cls.__flag_bits[name]
+
+    '''
+    ***************
+    *** Queries ***
+    ***************
+    '''
+    def children_of(self, ele_id):
+        return self.children[self.children_offsets[ele_id]: self.children_offsets[ele_id + 1]].tolist()
+
+    def ancestors_of(self, ele_id):
+        """
+        Returns:
+            ids (list): Ids of the ancestors of the element, from its parent up to the root
+        """
+        ancestors = []
+        parent = int(self.parents[ele_id])
+        while parent >= 0:
+            ancestors.append(parent)
+            parent = int(self.parents[parent])
+        return ancestors
+
+    def is_ancestor(self, ancestor_id, ele_id):
+        """
+        Returns:
+            is_ancestor (bool): True if the element is in the subtree under the ancestor
+        """
+        return bool(ancestor_id < ele_id < self.subtree_ends[ancestor_id])
+
+    def nearest_clickable_ancestor(self, ele_id, include_self=True):
+        """
+        Returns:
+            id (int): Id of the nearest clickable element above the element, or the element itself if include_self,
+                      None if none is clickable
+        """
+        if not include_self:
+            ele_id = int(self.parents[ele_id])
+            if ele_id < 0:
+                return None
+        clickable = int(self.clickable_ancestors[ele_id])
+        return clickable if clickable >= 0 else None
+
+    def leaves(self):
+        """
+        Returns:
+            ids (ndarray): Ids of the leaf elements, in the order of their leaf ids
+        """
+        ids = np.flatnonzero(self.leaf_ids >= 0)
+        return ids[np.argsort(self.leaf_ids[ids], kind='stable')]
+
+    def with_flag(self, name):
+        """
+        Returns:
+            mask (ndarray): True for the elements with the flag set
+        """
+        return (self.flags & self.__flag_bits[name]) != 0
+
+    def ids_containing_point(self, x, y, only_leaves=False):
+        """
+        Returns:
+            ids (ndarray): Ids of the elements whose bounds contain the point
+        """
+        mask = (self.bounds[:, 0] <= x) & (x <= self.bounds[:, 2]) & (self.bounds[:, 1] <= y) & (y <= self.bounds[:, 3])
+        if only_leaves:
+            mask &= self.leaf_ids >= 0
+        return np.flatnonzero(mask)
+
+    def nbytes(self):
+        """
+        Memory of the arrays in bytes
+        """
+        return sum(array.nbytes for array in (self.bounds, self.flags, self.layers, self.parents, self.leaf_ids,
+                                               self.class_codes, self.resource_codes, self.children_offsets, self.children,
+                                               self.subtree_ends, self.clickable_ancestors))
@@ -2,3 +2,5 @@ from uta.DataStructures.Task import Task
 from uta.DataStructures.UIData import UIData
 from uta.DataStructures.User import User
 from uta.DataStructures._Data import _Data
+from uta.DataStructures._ScreenImage import _ScreenImage
+from uta.DataStructures._UIElementStore import _UIElementStore, _UIElementView
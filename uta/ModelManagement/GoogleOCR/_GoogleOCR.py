@@ -3,6 +3,7 @@ import json
 from base64 import b64encode
 import time
 import cv2
+import numpy as np
 from os.path import join as pjoin
 
 from uta.DataStructures.Text import Text
@@ -15,27 +16,30 @@ class _GoogleOCR:
         self.__api_key = open(WORK_PATH + 'uta/ModelManagement/GoogleOCR/googleapikey.txt', 'r').readline()
 
     @staticmethod
-    def __make_image_data(img_path):
+    def __make_image_data(img_path, img_bytes=None):
         """
         Prepares the image data for the API request.
         Args:
             img_path (str): Image file path.
+            img_bytes (bytes): Encoded image in memory, used instead of reading the img_path
         Returns:
             Encoded JSON data to be sent in the API request.
         """
-        with open(img_path, 'rb') as f:
-            ctxt = b64encode(f.read()).decode()
-            # Setting up the request parameters for the OCR
-            img_req = {
-                'image': {
-                    'content': ctxt
-                },
-                'features': [{
-                    'type': 'DOCUMENT_TEXT_DETECTION',
-                    # 'type': 'TEXT_DETECTION',
-                    'maxResults': 1
-                }]
-            }
+        if img_bytes is None:
+            with open(img_path, 'rb') as f:
+                img_bytes = f.read()
+        ctxt = b64encode(img_bytes).decode()
+        # Setting up the request parameters for the OCR
+        img_req = {
+            'image': {
+                'content': ctxt
+            },
+            'features': [{
+                'type': 'DOCUMENT_TEXT_DETECTION',
+                # 'type': 'TEXT_DETECTION',
+                'maxResults': 1
+            }]
+        }
         return json.dumps({"requests": img_req}).encode()
 
     @staticmethod
@@ -69,9 +73,14 @@ class _GoogleOCR:
         return texts
 
     @staticmethod
-    def __merge_intersected_texts(texts):
+    def __greedy_merge_texts(texts, is_mergeable):
         """
-        Merge intersected __texts (sentences or words)
+        Merge each text into the first kept text it is mergeable with, until no more texts can be merged
+        Args:
+            texts (list of Text): Texts in the detection order
+            is_mergeable (function): is_mergeable(text_a, text_b) -> True if text_a can be merged into text_b
+        Returns:
+            texts (list of Text): Merged texts
         """
         changed = True
         while changed:
@@ -80,7 +89,7 @@ class _GoogleOCR:
             for text_a in texts:
                 merged = False
                 for text_b in temp_set:
-                    if text_a.is_intersected(text_b, bias=2):
+                    if is_mergeable(text_a, text_b):
                         text_b.merge_text(text_a)
                         merged = True
                         changed = True
@@ -90,6 +99,113 @@ class _GoogleOCR:
             texts = temp_set.copy()
         return texts
 
+    def __merge_texts_in_clusters(self, texts, clusters, is_mergeable):
+        """
+        Greedily merge the texts within each cluster, clusters must be independent of each other
+        Args:
+            texts (list of Text): Texts in the detection order
+            clusters (list of lists): Indices of texts in each cluster, in ascending order
+            is_mergeable (function): is_mergeable(text_a, text_b) -> True if text_a can be merged into text_b
+        Returns:
+            texts (list of Text): Merged texts, in the same order as merging all the texts at once
+        """
+        merged = []
+        for cluster in clusters:
+            if len(cluster) == 1:
+                merged.append(cluster[0])
+                continue
+            # the text kept for a merged group is always its first text in the detection order
+            position = {id(texts[i]): i for i in cluster}
+            merged += [position[id(text)] for text in self.__greedy_merge_texts([texts[i] for i in cluster], is_mergeable)]
+        return [texts[i] for i in sorted(merged)]
+
+    @staticmethod
+    def __split_text_rows(texts):
+        """
+        Split the texts into rows of vertically overlapped texts, only texts in the same row can be merged
+        Args:
+            texts (list of Text)
+        Returns:
+            rows (list of lists): Indices of the texts in each row, in ascending order
+        """
+        if len(texts) == 0:
+            return []
+        boxes = np.array([text.bounds for text in texts]).reshape(-1, 4)
+        order = np.argsort(boxes[:, 1], kind='stable')
+        # start a new row if a text is below all the texts above it
+        row_bottoms = np.maximum.accumulate(boxes[order, 3])
+        new_row = np.concatenate([[True], boxes[order[1:], 1] > row_bottoms[:-1]])
+        row_ids = np.cumsum(new_row) - 1
+        rows = [[] for _ in range(row_ids[-1] + 1)]
+        for text_id, row_id in zip(order.tolist(), row_ids.tolist()):
+            rows[row_id].append(text_id)
+        return [sorted(row) for row in rows]
+
+    @staticmethod
+    def __union_find(size, pairs):
+        """
+        Label the connected components of the graph
+        Args:
+            size (int): Number of nodes
+            pairs (list): Connected node pairs
+        Returns:
+            labels (list): The smallest node of the component of each node
+        """
+        parent = list(range(size))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        for a, b in pairs:
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+        return [find(i) for i in range(size)]
+
+    def __cluster_intersected_texts(self, texts, row, bias):
+        """
+        Cluster the texts in a row that end up merged by intersection
+        The bounding box of merged texts only grows, so intersect the bounding boxes of the components until no
+        components intersect, and the components are exactly the merged groups
+        Args:
+            texts (list of Text)
+            row (list): Indices of the texts in the row
+            bias (int): The bias of Text.is_intersected
+        Returns:
+            clusters (list of lists): Indices of texts in each cluster, in ascending order
+        """
+        boxes = np.array([texts[i].bounds for i in row]).reshape(-1, 4)
+        labels = np.arange(len(row))
+        while True:
+            groups, firsts, members = np.unique(labels, return_index=True, return_inverse=True)
+            hulls = boxes[firsts].copy()
+            np.minimum.at(hulls[:, 0], members, boxes[:, 0])
+            np.minimum.at(hulls[:, 1], members, boxes[:, 1])
+            np.maximum.at(hulls[:, 2], members, boxes[:, 2])
+            np.maximum.at(hulls[:, 3], members, boxes[:, 3])
+            # batched Text.is_intersected between the hulls of components
+            w_in = np.minimum(hulls[:, None, 2], hulls[None, :, 2]) - np.maximum(hulls[:, None, 0], hulls[None, :, 0]) - bias
+            h_in = np.minimum(hulls[:, None, 3], hulls[None, :, 3]) - np.maximum(hulls[:, None, 1], hulls[None, :, 1]) - bias
+            pairs = np.argwhere(np.triu((w_in > 0) & (h_in > 0), k=1))
+            if len(pairs) == 0:
+                break
+            labels = np.array(self.__union_find(len(groups), pairs.tolist()))[members]
+        clusters = {}
+        for text_id, label in zip(row, labels.tolist()):
+            clusters.setdefault(label, []).append(text_id)
+        return list(clusters.values())
+
+    def __merge_intersected_texts(self, texts):
+        """
+        Merge intersected __texts (sentences or words)
+        """
+        clusters = []
+        for row in self.__split_text_rows(texts):
+            clusters += [row] if len(row) == 1 else self.__cluster_intersected_texts(texts, row, bias=2)
+        return self.__merge_texts_in_clusters(texts, clusters, lambda text_a, text_b: text_a.is_intersected(text_b, bias=2))
+
     @staticmethod
     def __text_filter_noise(texts):
         """
@@ -103,27 +219,15 @@ class _GoogleOCR:
             valid_texts.append(text)
         return valid_texts
 
-    @staticmethod
-    def __text_sentences_recognition(texts):
+    def __text_sentences_recognition(self, texts):
         """
         Merge separate words detected by Google ocr into a sentence
         """
-        changed = True
-        while changed:
-            changed = False
-            temp_set = []
-            for text_a in texts:
-                merged = False
-                for text_b in temp_set:
-                    if text_a.is_on_same_line(text_b, 'h', bias_justify=0.2 * min(text_a.height, text_b.height),
-                                              bias_gap=1.3 * max(text_a.word_width, text_b.word_width)):
-                        text_b.merge_text(text_a)
-                        merged = True
-                        changed = True
-                        break
-                if not merged:
-                    temp_set.append(text_a)
-            texts = temp_set.copy()
+        def is_on_same_line(text_a, text_b):
+            return text_a.is_on_same_line(text_b, 'h', bias_justify=0.2 * min(text_a.height, text_b.height),
+                                          bias_gap=1.3 * max(text_a.word_width, text_b.word_width))
+        # merging texts on a line does not meet the texts out of the row as the top and bottom need to be justified
+        texts = self.__merge_texts_in_clusters(texts, self.__split_text_rows(texts), is_on_same_line)
         for i, text in enumerate(texts):
             text.id = i
         return texts
@@ -136,8 +240,7 @@ class _GoogleOCR:
             shrink_rate: rate to resize
         """
         for text in texts:
-            for key in text.location:
-                text.location[key] = round(text.location[key] / shrink_rate)
+            text.bounds = [round(b / shrink_rate) for b in text.bounds]
         return texts
 
     @staticmethod
@@ -206,16 +309,17 @@ class _GoogleOCR:
             output['__texts'].append(c)
         json.dump(output, f_out, indent=4)
 
-    def request_google_ocr(self, img_path):
+    def request_google_ocr(self, img_path, img_bytes=None):
         """
         Sends an OCR request to the Google Cloud Vision API.
         Args:
             img_path (str): Image file path.
+            img_bytes (bytes): Encoded image in memory, used instead of reading the img_path
         Returns:
             The detected text annotations or None if no text is found.
         """
         try:
-            img_data = self.__make_image_data(img_path)  # Prepare the image data
+            img_data = self.__make_image_data(img_path, img_bytes)  # Prepare the image data
 
             # Post request to the Google Cloud Vision API
             response = requests.post(self.__url, data=img_data, params={'key': self.__api_key},
@@ -231,7 +335,7 @@ class _GoogleOCR:
         except Exception as e:
             raise e
 
-    def detect_text_ocr(self, img_path, output_dir='data/output', show=False, shrink_size=False):
+    def detect_text_ocr(self, img_path, output_dir='data/output', show=False, shrink_size=False, img_bytes=None, img=None):
         """
         Detect __texts on the image using google ocr
         Args:
@@ -239,20 +343,21 @@ class _GoogleOCR:
             output_dir: Directory to store the output
             show (bool): True to visualize the result
             shrink_size (bool): True to shrink the image before processing for faster speed
+            img_bytes (bytes): Encoded image in memory, sent instead of reading the img_path
+            img (cv2 image): Decoded image, only needed to shrink or show, decoded from the image if not given
         Returns:
             __texts (list of dicts): [{'id': 0, 'bounds': [77, 20, 151, 48], 'content': '5:08'}]
         """
         start = time.time()
-        name = img_path.replace('\\', '/').split('/')[-1][:-4]
-        org_img = cv2.imread(img_path)
+        # the pixels are only needed to shrink or show, the ocr engine takes the encoded image
+        if (shrink_size or show) and img is None:
+            img = cv2.imread(img_path) if img_bytes is None else cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
         if shrink_size:
             shrink_rate = 0.75
-            img_re = cv2.resize(org_img, (int(org_img.shape[1] * shrink_rate),
-                                          int(org_img.shape[0] * shrink_rate)))
-            img_path = img_path[:-4] + '_resize.jpg'
-            cv2.imwrite(img_path, img_re)
+            img_re = cv2.resize(img, (int(img.shape[1] * shrink_rate), int(img.shape[0] * shrink_rate)))
+            img_bytes = cv2.imencode('.jpg', img_re)[1].tobytes()
 
-        ocr_result = self.request_google_ocr(img_path)
+        ocr_result = self.request_google_ocr(img_path, img_bytes)
         texts = self.__text_cvt_orc_format(ocr_result)
         texts = self.__merge_intersected_texts(texts)
         texts = self.__text_filter_noise(texts)
@@ -260,7 +365,8 @@ class _GoogleOCR:
         if shrink_size:
             texts = self.__resize_label(texts, shrink_rate)
         if show:
-            self.visualize_texts(texts=texts, img=org_img, show=True)
+            name = img_path.replace('\\', '/').split('/')[-1][:-4] if img_path is not None else 'image'
+            self.visualize_texts(texts=texts, img=img.copy(), show=True)
             print("[Text Detection Completed in %.3f s] Input: %s Output: %s"
                   % (time.time() - start, img_path, pjoin(output_dir, name + '.json')))
         return self.__wrap_up_texts(texts)
@@ -0,0 +1,140 @@
+import os
+import copy
+import json
+import hashlib
+import cv2
+import numpy as np
+from collections import OrderedDict
+from os.path import join as pjoin
+
+from uta.config import *
+
+
+class _OCRCache:
+    def __init__(self, cache_dir=pjoin(DATA_PATH, 'ocr_cache'), max_entries=500):
+        """
+        Content-addressed cache of the post-processed ocr results, keyed by the hash of the image pixels
+        Args:
+            cache_dir (path): Directory to persist the cache entries, None to keep the cache in memory only
+            max_entries (int): Maximum number of cached images, the least recently used ones are evicted
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()  # {image hash: texts}, from the least to the most recently used
+        self.__load_cache()
+
+    '''
+    *******************
+    *** Cache Store ***
+    *******************
+    '''
+    def __entry_file(self, key):
+        return pjoin(self.cache_dir, key + '.json')
+
+    def __load_cache(self):
+        """
+        Load the persisted entries, ordered by their last access time
+        """
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry_files = [pjoin(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith('.json')]
+        for entry_file in sorted(entry_files, key=os.path.getmtime):
+            try:
+                self.__entries[os.path.basename(entry_file)[:-5]] = json.load(open(entry_file, 'r', encoding='utf-8'))
+            except (ValueError, OSError):
+                os.remove(entry_file)
+        self.__evict()
+
+    def __evict(self):
+        while len(self.__entries) > self.max_entries:
+            key, _ = self.__entries.popitem(last=False)
+            if self.cache_dir is not None and os.path.exists(self.__entry_file(key)):
+                os.remove(self.__entry_file(key))
+
+    def get(self, key):
+        """
+        Args:
+            key (str): Image hash
+        Returns:
+            texts (list of dicts) or None if not cached
+        """
+        if key not in self.__entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__entries.move_to_end(key)
+        if self.cache_dir is not None and os.path.exists(self.__entry_file(key)):
+            os.utime(self.__entry_file(key))  # record the access for the lru order across sessions
+        return self.__entries[key]
+
+    def put(self, key, texts):
+        """
+        Args:
+            key (str): Image hash
+            texts (list of dicts): Post-processed ocr result of the image
+        """
+        self.__entries[key] = texts
+        self.__entries.move_to_end(key)
+        if self.cache_dir is not None:
+            with open(self.__entry_file(key), 'w', encoding='utf-8') as f:
+                json.dump(texts, f)
+        self.__evict()
+
+    def clear(self):
+        for key in list(self.__entries.keys()):
+            if self.cache_dir is not None and os.path.exists(self.__entry_file(key)):
+                os.remove(self.__entry_file(key))
+        self.__entries.clear()
+        self.hits, self.misses = 0, 0
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict): {'hits':, 'misses':, 'entries':}
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.__entries)}
+
+    '''
+    *****************
+    *** Image Key ***
+    *****************
+    '''
+    @staticmethod
+    def hash_image(img_path=None, img=None, img_bytes=None):
+        """
+        Hash the decoded pixels, so that pixel-identical frames saved in different files share the key
+        Args:
+            img_path (path): Image file path
+            img (cv2 image): Decoded image, used directly if given
+            img_bytes (bytes): Encoded image in memory, decoded instead of reading the img_path
+        Returns:
+            key (str): Image hash
+        """
+        if img is None and img_bytes is not None:
+            img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+        elif img is None:
+            img = cv2.imread(img_path, cv2.IMREAD_COLOR)
+        digest = hashlib.sha1(str(img.shape).encode())
+        digest.update(img.tobytes())
+        return digest.hexdigest()
+
+    def detect_text_ocr(self, img_path, ocr_func, img=None, img_bytes=None):
+        """
+        Return the cached ocr result of the image, or run the ocr_func and cache its result
+        Args:
+            img_path (path): Image file path
+            ocr_func (function): ocr_func(img_path) -> texts (list of dicts), the ocr backend to call on cache misses
+            img (cv2 image): Decoded image of the img_path, to skip decoding it again for hashing
+            img_bytes (bytes): Encoded image in memory, to hash without the img_path
+        Returns:
+            texts (list of dicts): [{'id': 0, 'bounds': [77, 20, 151, 48], 'content': '5:08'}]
+        """
+        key = self.hash_image(img_path, img, img_bytes)
+        texts = self.get(key)
+        if texts is None:
+            texts = ocr_func(img_path)
+            self.put(key, texts)
+        return copy.deepcopy(texts)
@@ -0,0 +1,117 @@
+import cv2
+import numpy as np
+
+
+class _OCRMosaic:
+    def __init__(self, max_width=1080, gap=20, max_area_ratio=0.6):
+        """
+        Pack the image regions to ocr into a compact mosaic, so only the pixels of interest are sent to the ocr engine
+        Args:
+            max_width (int): Maximum width of the mosaic
+            gap (int): Minimum gap between packed regions
+            max_area_ratio (float): Give up packing if the mosaic is over this ratio of the full image area
+        """
+        self.max_width = max_width
+        self.gap = gap
+        self.max_area_ratio = max_area_ratio
+
+    def pack_regions(self, img, regions):
+        """
+        Pack the regions into shelves, from the tallest to the shortest
+        Regions in the same shelf are set apart by twice the shelf height, so the ocr engine won't merge
+        the words of neighbouring regions into a sentence
+        Args:
+            img (cv2 image): Full image
+            regions (list): List of bounds [left, top, right, bottom] on the img
+        Returns:
+            mosaic (cv2 image): Packed image, None if packing does not save enough pixels
+            placements (list): [(region index, (x, y) of the region on the mosaic)]
+        """
+        img_h, img_w = img.shape[:2]
+        crops = []
+        for i, (left, top, right, bottom) in enumerate(regions):
+            left, top, right, bottom = max(left, 0), max(top, 0), min(right, img_w), min(bottom, img_h)
+            if right > left and bottom > top:
+                crops.append((i, (left, top, right, bottom)))
+        crops.sort(key=lambda c: c[1][3] - c[1][1], reverse=True)
+
+        # place the crops shelf by shelf
+        placements = []
+        x, y, shelf_h, mosaic_w = 0, 0, 0, 0
+        for i, (left, top, right, bottom) in crops:
+            w, h = right - left, bottom - top
+            if x > 0 and x + 2 * shelf_h + w > self.max_width:
+                x, y, shelf_h = 0, y + shelf_h + self.gap, 0
+            if x > 0:
+                x += 2 * shelf_h
+            shelf_h = max(shelf_h, h)
+            placements.append((i, (x, y)))
+            x += w
+            mosaic_w = max(mosaic_w, x)
+        mosaic_h = y + shelf_h
+        if len(placements) == 0 or mosaic_w * mosaic_h > self.max_area_ratio * img_w * img_h:
+            return None, placements
+
+        mosaic = np.full((mosaic_h, mosaic_w) + img.shape[2:], 255, dtype=img.dtype)
+        for i, (x, y) in placements:
+            left, top, right, bottom = regions[i]
+            left, top = max(left, 0), max(top, 0)
+            crop = img[top: min(bottom, img_h), left: min(right, img_w)]
+            mosaic[y: y + crop.shape[0], x: x + crop.shape[1]] = crop
+        return mosaic, placements
+
+    @staticmethod
+    def map_texts_to_regions(texts, regions, placements):
+        """
+        Map the ocr texts on the mosaic back to the regions they are detected in
+        Args:
+            texts (list of dicts): Ocr result on the mosaic [{'id': 0, 'bounds': [77, 20, 151, 48], 'content': '5:08'}]
+            regions (list): List of bounds [left, top, right, bottom] on the full image
+            placements (list): [(region index, (x, y) of the region on the mosaic)]
+        Returns:
+            region_texts (list): Texts of each region, with bounds on the full image
+        """
+        region_texts = [[] for _ in regions]
+        for text in texts:
+            t_b = text['bounds']
+            center_x, center_y = (t_b[0] + t_b[2]) / 2, (t_b[1] + t_b[3]) / 2
+            for i, (x, y) in placements:
+                left, top, right, bottom = regions[i]
+                left, top = max(left, 0), max(top, 0)
+                if x <= center_x <= x + right - left and y <= center_y <= y + bottom - top:
+                    # translate back to the full image and clip into the region
+                    bounds = [min(max(t_b[0] - x + left, left), right), min(max(t_b[1] - y + top, top), bottom),
+                              min(max(t_b[2] - x + left, left), right), min(max(t_b[3] - y + top, top), bottom)]
+                    region_texts[i].append({'id': text['id'], 'bounds': bounds, 'content': text['content']})
+                    break
+        return region_texts
+
+    def detect_text_ocr_regions(self, img, img_path, regions, ocr_func, img_bytes=None, org_img=None):
+        """
+        Ocr only the given regions of the image
+        Args:
+            img (cv2 image): Full image
+            img_path (path): File path of the full image
+            regions (list): List of bounds [left, top, right, bottom] to ocr
+            ocr_func (function): ocr_func(img_path, img_bytes, img) -> texts (list of dicts), the image is given by the
+                                 file path or in memory by the encoded bytes, with its decoded pixels if known
+            img_bytes (bytes): Encoded full image in memory, sent instead of reading the img_path
+            org_img (cv2 image): Decoded full image as encoded, if known
+        Returns:
+            region_texts (list): Texts of each region, with bounds on the full image
+        """
+        if len(regions) == 0:
+            return []
+        mosaic, placements = self.pack_regions(img, regions)
+        if mosaic is None:
+            # packing does not pay off, ocr the full image and assign texts to the regions they intersect
+            region_texts = [[] for _ in regions]
+            for text in ocr_func(img_path, img_bytes, org_img):
+                t_b = text['bounds']
+                for i, r_b in enumerate(regions):
+                    if min(t_b[2], r_b[2]) > max(t_b[0], r_b[0]) and min(t_b[3], r_b[3]) > max(t_b[1], r_b[1]):
+                        region_texts[i].append(text)
+            return region_texts
+        # the mosaic is sent in memory without being saved
+        mosaic_bytes = cv2.imencode('.png', mosaic)[1].tobytes()
+        return self.map_texts_to_regions(ocr_func(None, mosaic_bytes, mosaic), regions, placements)
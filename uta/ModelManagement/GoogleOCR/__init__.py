@@ -1 +1,3 @@
 from uta.ModelManagement.GoogleOCR._GoogleOCR import _GoogleOCR
+from uta.ModelManagement.GoogleOCR._OCRCache import _OCRCache
+from uta.ModelManagement.GoogleOCR._OCRMosaic import _OCRMosaic
@@ -1,15 +1,22 @@
-from uta.ModelManagement.OpenAI import _OpenAI
-from uta.ModelManagement.GoogleOCR import _GoogleOCR
+from uta.ModelManagement.OpenAI import _OpenAI, _PromptCache, _TokenCounter
+from uta.ModelManagement.GoogleOCR import _GoogleOCR, _OCRCache, _OCRMosaic
 # from uta.ModelManagement.IconCls import _IconClassifier
 
 
 class ModelManager:
-    def __init__(self):
+    def __init__(self, ocr_model=None, fm_model=None, prompt_cache=None):
         """
         Initializes a ModelManager instance with vision model and fm model.
+        Args:
+            ocr_model: Ocr engine with detect_text_ocr(img_path, img_bytes=None), None to use Google ocr
+            fm_model (_OpenAI): Foundation model client, None to use the default OpenAI client
+            prompt_cache (_PromptCache): Cache of fm responses, None to cache in memory
         """
-        self.__fm_model = _OpenAI()
-        self.__google_ocr = _GoogleOCR()
+        self.__fm_model = fm_model if fm_model is not None else _OpenAI()
+        self.__prompt_cache = prompt_cache if prompt_cache is not None else _PromptCache()
+        self.__google_ocr = ocr_model if ocr_model is not None else _GoogleOCR()
+        self.__ocr_cache = _OCRCache()
+        self.__ocr_mosaic = _OCRMosaic()
         # self.__icon_cls = _IconClassifier()
 
     '''
@@ -17,15 +24,48 @@ class ModelManager:
     *** Vision Model ***
     ********************
     '''
-    def detect_text_ocr(self, img_path):
+    def detect_text_ocr(self, img_path, use_cache=True, img_bytes=None, img=None):
         """
         Sends an OCR request to the Google Cloud Vision API.
         Args:
             img_path (str): Image file path.
+            use_cache (bool): True to reuse the result of a pixel-identical image detected before
+            img_bytes (bytes): Encoded image in memory, sent instead of reading the img_path
+            img (cv2 image): Decoded image, to hash for the cache without decoding the image again
         Returns:
             The detected text annotations or None if no text is found.
         """
-        return self.__google_ocr.detect_text_ocr(img_path)
+        def ocr(path):
+            if img_bytes is None:
+                return self.__google_ocr.detect_text_ocr(path)
+            return self.__google_ocr.detect_text_ocr(path, img_bytes=img_bytes)
+        if not use_cache:
+            return ocr(img_path)
+        return self.__ocr_cache.detect_text_ocr(img_path, ocr, img=img, img_bytes=img_bytes)
+
+    def detect_text_ocr_regions(self, img, img_path, regions, use_cache=True, img_bytes=None, org_img=None):
+        """
+        Only ocr the given regions of the image, by packing their crops into a compact mosaic
+        Args:
+            img (cv2 image): Decoded image of the img_path, in the coordinates of the regions
+            img_path (str): Image file path.
+            regions (list): List of bounds [left, top, right, bottom] to ocr
+            use_cache (bool): True to reuse the result of a pixel-identical image detected before
+            img_bytes (bytes): Encoded image in memory, sent instead of reading the img_path
+            org_img (cv2 image): Decoded image of the img_bytes or img_path before resizing, if already decoded
+        Returns:
+            region_texts (list): Detected texts in each region [[{'id': 0, 'bounds': [77, 20, 151, 48], 'content': '5:08'}]]
+        """
+        return self.__ocr_mosaic.detect_text_ocr_regions(
+            img, img_path, regions, lambda path, data, pixels: self.detect_text_ocr(path, use_cache, img_bytes=data, img=pixels),
+            img_bytes=img_bytes, org_img=org_img)
+
+    def ocr_cache_stats(self):
+        """
+        Returns:
+            stats (dict): {'hits':, 'misses':, 'entries':} of the ocr cache
+        """
+        return self.__ocr_cache.stats()
 
     def classify_icons(self, imgs):
         """
@@ -52,9 +92,32 @@ class ModelManager:
         Returns:
             int: Token size.
         """
-        return _OpenAI().count_token_size(string, model=model)
+        return _TokenCounter.count_tokens(string, model=model)
 
-    def send_fm_prompt(self, prompt, system_prompt=None, printlog=False, runtime=True):
+    @staticmethod
+    def count_tokens_many(strings, model='gpt-3.5-turbo'):
+        """
+        Count the token sizes of a batch of strings to the gpt models in one call.
+        Args:
+            strings (list of str): Strings to calculate token size.
+            model (str): Using which model for embedding
+        Returns:
+            list of int: Token size of each string.
+        """
+        return _TokenCounter.count_tokens_many(strings, model=model)
+
+    @staticmethod
+    def create_conversation_token_counter(model='gpt-3.5-turbo'):
+        """
+        Create a counter that counts the prompt tokens of a growing conversation incrementally.
+        Args:
+            model (str): Using which model for embedding
+        Returns:
+            _TokenCounter: counter.count_conversation(conversation) -> token size of the conversation
+        """
+        return _TokenCounter(model=model)
+
+    def send_fm_prompt(self, prompt, system_prompt=None, printlog=False, runtime=True, use_cache=True):
         """
         Send single prompt to the llm Model
         Args:
@@ -62,12 +125,18 @@ class ModelManager:
             prompt (str): Single prompt
             printlog (bool): True to printout detailed intermediate result of llm
             runtime (bool): True to record the runtime of llm
+            use_cache (bool): True to reuse the response of the same request and cache the response,
+                              False to neither read nor write the cache
         Returns:
             message (dict): {'role':'assistant', 'content': '...'}
         """
-        return self.__fm_model.send_openai_prompt(prompt=prompt, system_prompt=system_prompt, printlog=printlog, runtime=runtime)
+        if system_prompt is None:
+            conversation = [{'role': 'user', 'content': prompt}]
+        else:
+            conversation = [{'role': 'system', 'content': system_prompt}, {'role': 'user', 'content': prompt}]
+        return self.send_fm_conversation(conversation=conversation, printlog=printlog, runtime=runtime, use_cache=use_cache)
 
-    def send_fm_conversation(self, conversation, printlog=False, runtime=False):
+    def send_fm_conversation(self, conversation, printlog=False, runtime=False, use_cache=True):
         """
         Send conversation to the llm Model.
         Args:
@@ -75,10 +144,61 @@ class ModelManager:
             'content':'...'}]
             printlog (bool): True to printout detailed intermediate result of llm
             runtime (bool): True to record the runtime of llm
+            use_cache (bool): True to reuse the response of the same request and cache the response,
+                              False to neither read nor write the cache
+        Returns:
+            message (dict): {'role':'assistant', 'content': '...'}
+        """
+        if not use_cache:
+            return self.__fm_model.send_openai_conversation(conversation=conversation, printlog=printlog, runtime=runtime)
+        key = self.__prompt_cache_key(conversation)
+        msg = self.__prompt_cache.get(key)
+        if msg is None:
+            msg = self.__fm_model.send_openai_conversation(conversation=conversation, printlog=printlog, runtime=runtime)
+            self.__prompt_cache.set(key, msg)
+        return msg
+
+    async def send_fm_conversation_async(self, conversation, printlog=False, runtime=False, use_cache=True):
+        """
+        Send conversation to the llm Model, awaitable so that concurrent requests do not block each other.
+        Args:
+            conversation (list): llm conversation [{'role': 'user', 'content': '...'}, {'role': 'assistant',
+            'content':'...'}]
+            printlog (bool): True to printout detailed intermediate result of llm
+            runtime (bool): True to record the runtime of llm
+            use_cache (bool): True to reuse the response of the same request and cache the response,
+                              False to neither read nor write the cache
         Returns:
             message (dict): {'role':'assistant', 'content': '...'}
         """
-        return self.__fm_model.send_openai_conversation(conversation=conversation, printlog=printlog, runtime=runtime)
+        if not use_cache:
+            return await self.__fm_model.send_openai_conversation_async(conversation=conversation, printlog=printlog, runtime=runtime)
+        key = self.__prompt_cache_key(conversation)
+        msg = self.__prompt_cache.get(key)
+        if msg is None:
+            msg = await self.__fm_model.send_openai_conversation_async(conversation=conversation, printlog=printlog, runtime=runtime)
+            self.__prompt_cache.set(key, msg)
+        return msg
+
+    def run_sync(self, coro):
+        """
+        Run a coroutine of fm requests from synchronous code, on the background loop of the fm client
+        Args:
+            coro (coroutine): Coroutine to run, such as the awaitable checks of the task declaration
+        Returns:
+            The result of the coroutine
+        """
+        return self.__fm_model.run_sync(coro)
+
+    def __prompt_cache_key(self, conversation):
+        return self.__prompt_cache.make_key(self.__fm_model.model, conversation, self.__fm_model.response_format)
+
+    def prompt_cache_stats(self):
+        """
+        Returns:
+            stats (dict): {'hits':, 'misses':, 'hit_rate':, 'entries':} of the prompt cache
+        """
+        return self.__prompt_cache.stats()
 
     '''
     **************************
@@ -98,6 +218,45 @@ class ModelManager:
         """
         return self.__fm_model.send_gpt4_vision_img_paths(prompt=prompt, img_paths=img_paths, printlog=printlog)
 
+    async def send_gpt4_vision_img_paths_async(self, prompt, img_paths, printlog=False):
+        """
+        Read images as base64 and use gpt4-v to analyze images, awaitable so that concurrent requests do not block each other
+        Args:
+            prompt (str): Prompt to ask questions
+            img_paths (list of paths): List of image file path(s)
+            printlog (bool): True to printout detailed intermediate result of llm
+        Returns:
+            success (bool): False to indicate error
+            content (string): Response content
+        """
+        return await self.__fm_model.send_gpt4_vision_img_paths_async(prompt=prompt, img_paths=img_paths, printlog=printlog)
+
+    def send_gpt4_vision_imgs(self, prompt, imgs, printlog=False):
+        """
+        Use gpt4-v to analyze images encoded in memory
+        Args:
+            prompt (str): Prompt to ask questions
+            imgs (list of bytes): List of encoded jpg, png or webp image(s)
+            printlog (bool): True to printout detailed intermediate result of llm
+        Returns:
+            success (bool): False to indicate error
+            content (string): Response content
+        """
+        return self.__fm_model.send_gpt4_vision_imgs(prompt=prompt, imgs=imgs, printlog=printlog)
+
+    async def send_gpt4_vision_imgs_async(self, prompt, imgs, printlog=False):
+        """
+        Use gpt4-v to analyze images encoded in memory, awaitable so that concurrent requests do not block each other
+        Args:
+            prompt (str): Prompt to ask questions
+            imgs (list of bytes): List of encoded jpg, png or webp image(s)
+            printlog (bool): True to printout detailed intermediate result of llm
+        Returns:
+            success (bool): False to indicate error
+            content (string): Response content
+        """
+        return await self.__fm_model.send_gpt4_vision_imgs_async(prompt=prompt, imgs=imgs, printlog=printlog)
+
 
 if __name__ == '__main__':
     model_mg = ModelManager()
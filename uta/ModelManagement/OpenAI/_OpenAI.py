@@ -1,24 +1,53 @@
 import openai
 import time
-import tiktoken
+import asyncio
+import threading
 from uta.config import *
+from uta.ModelManagement.OpenAI._TokenCounter import _TokenCounter
 import base64
-import requests
 
 
 class _OpenAI:
-    def __init__(self, model='gpt-4-1106-preview'):
+    def __init__(self, model='gpt-4-1106-preview', api_key=None, base_url=None, max_concurrency=8, timeout=60,
+                 max_retries=3, retry_backoff=1):
         """
         Initialize the Model with default settings.
+        Args:
+            model (str): Default language model
+            api_key (str): OpenAI api key, None to read from the key file
+            base_url (str): Base url of the api, None for the OpenAI api
+            max_concurrency (int): Maximum number of requests in flight at the same time
+            timeout (float): Timeout in seconds of each request
+            max_retries (int): Maximum retries on rate limit (429), server errors (5xx), timeout and connection errors
+            retry_backoff (float): Seconds to wait before the first retry, doubled for every following retry
         """
-        self.api_key = open(WORK_PATH + 'uta/ModelManagement/OpenAI/openaikey.txt', 'r').readline()
+        self.api_key = api_key if api_key is not None else open(WORK_PATH + 'uta/ModelManagement/OpenAI/openaikey.txt', 'r').readline()
         openai.api_key = self.api_key
         self._model = model
+        self.response_format = {"type": "json_object"}
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        # all requests run on a background event loop that owns the pooled http client
+        self.__loop = None
+        self.__loop_lock = threading.Lock()
+        self.__client = None
+        self.__semaphore = None
 
         self.system_prompt = 'You are a mobile virtual assistant that automatically completes a given task on any apps.' \
                              'You understand UIs, analyse the relations between UIs and the given task, and identify the most appropriate elements to proceed or complete the task.' \
                              'You always find the most convenient way to finish the task (e.g., making use of the search bar with flexibility).'
 
+    @property
+    def model(self):
+        """
+        Name of the default language model, part of the key of the cached responses
+        """
+        return self._model
+
     @staticmethod
     def count_token_size(string, model="gpt-3.5-turbo"):
         """
@@ -29,8 +58,19 @@ class _OpenAI:
         Returns:
             int: Token size.
         """
-        enc = tiktoken.encoding_for_model(model)
-        return len(enc.encode(string))
+        return _TokenCounter.count_tokens(string, model=model)
+
+    @staticmethod
+    def count_tokens_many(strings, model="gpt-3.5-turbo"):
+        """
+        Count the token sizes of a batch of strings to the gpt models.
+        Args:
+            strings (list of str): Strings to calculate token size.
+            model (str): Using which model for embedding
+        Returns:
+            list of int: Token size of each string.
+        """
+        return _TokenCounter.count_tokens_many(strings, model=model)
 
     '''
     **********************
@@ -65,11 +105,27 @@ class _OpenAI:
         Returns:
             message (dict): {'role':'assistant', 'content': '...'}
         """
+        return self.__run_sync(self.__send_conversation(conversation, printlog, runtime))
+
+    async def send_openai_conversation_async(self, conversation, printlog=False, runtime=True):
+        """
+        Send conversation to the llm Model without blocking the event loop of the caller
+        Args:
+            conversation (list): llm conversation [{'role': 'user', 'content': '...'}, {'role': 'assistant',
+            'content':'...'}]
+            printlog (bool): True to printout detailed intermediate result of llm
+            runtime (bool): True to record the runtime of llm
+        Returns:
+            message (dict): {'role':'assistant', 'content': '...'}
+        """
+        return await self.__run_async(self.__send_conversation(conversation, printlog, runtime))
+
+    async def __send_conversation(self, conversation, printlog, runtime):
         try:
             start = time.time()
             if printlog:
                 print('*** Asking ***\n', conversation)
-            resp = openai.chat.completions.create(model=self._model, messages=conversation, temperature=0.0, seed=42, response_format={"type": "json_object"})
+            resp = await self.__create_chat_completion(model=self._model, messages=conversation, temperature=0.0, seed=42, response_format=self.response_format)
             if runtime:
                 usage = resp.usage
                 prompt_tokens = usage.prompt_tokens
@@ -100,49 +156,55 @@ class _OpenAI:
             success (bool): False to indicate error
             content (string): Response content
         """
+        return self.__run_sync(self.__send_vision(prompt, base64_imgs, printlog))
+
+    async def send_gpt4_vision_base64_imgs_async(self, prompt, base64_imgs, printlog=False):
+        """
+        Use gpt4-v to analyze base64 images without blocking the event loop of the caller
+        Args:
+            prompt (str): Prompt to ask questions
+            base64_imgs (list): List of base64 image(s)
+            printlog (bool): True to printout detailed intermediate result of llm
+        Returns:
+            success (bool): False to indicate error
+            content (string): Response content
+        """
+        return await self.__run_async(self.__send_vision(prompt, base64_imgs, printlog))
+
+    async def __send_vision(self, prompt, base64_imgs, printlog, mime_types=None):
         content = [{
                 "type": "text",
                 "text": prompt
             }]
-        for base64_img in base64_imgs:
+        for i, base64_img in enumerate(base64_imgs):
+            mime_type = mime_types[i] if mime_types is not None else 'image/jpeg'
             content.append({
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/jpeg;base64,{base64_img}",
+                    "url": f"data:{mime_type};base64,{base64_img}",
                     "detail": "high"
                 }
             })
-
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        payload = {
-            "model": "gpt-4-vision-preview",
-            "messages": [
-                {'role': 'system', 'content': self.system_prompt},
-                {
-                    "role": "user",
-                    "content": content
-                }
-            ],
-            "max_tokens": 300,
-            "temperature": 0.0,
-            "seed": 42,
-            "n": 1
-        }
+        messages = [
+            {'role': 'system', 'content': self.system_prompt},
+            {
+                "role": "user",
+                "content": content
+            }
+        ]
         start = time.time()
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload).json()
-        if "error" not in response:
-            usage = response["usage"]
-            prompt_tokens = usage["prompt_tokens"]
-            completion_tokens = usage["completion_tokens"]
-            if printlog:
-                print(f"[Request cost - ${'{0:.4f}'.format(prompt_tokens / 1000 * 0.01 + completion_tokens / 1000 * 0.03)}] ",
-                      f"[Run time - {'{:.3f}s'.format(time.time() - start)}]")
-        else:
-            return False, response["error"]["message"]
-        return True, response["choices"][0]["message"]["content"]
+        try:
+            response = await self.__create_chat_completion(model="gpt-4-vision-preview", messages=messages, max_tokens=300,
+                                                           temperature=0.0, seed=42, n=1)
+        except openai.APIStatusError as e:
+            return False, e.message
+        usage = response.usage
+        prompt_tokens = usage.prompt_tokens
+        completion_tokens = usage.completion_tokens
+        if printlog:
+            print(f"[Request cost - ${'{0:.4f}'.format(prompt_tokens / 1000 * 0.01 + completion_tokens / 1000 * 0.03)}] ",
+                  f"[Run time - {'{:.3f}s'.format(time.time() - start)}]")
+        return True, response.choices[0].message.content
 
     def send_gpt4_vision_img_paths(self, prompt, img_paths, printlog=True):
         """
@@ -155,14 +217,140 @@ class _OpenAI:
             success (bool): False to indicate error
             content (string): Response content
         """
-        def encode_image(image_path):
-            with open(image_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
+        return self.send_gpt4_vision_base64_imgs(prompt, self.encode_images(img_paths), printlog=printlog)
+
+    async def send_gpt4_vision_img_paths_async(self, prompt, img_paths, printlog=True):
+        """
+        Read images as base64 and use gpt4-v to analyze images without blocking the event loop of the caller
+        Args:
+            prompt (str): Prompt to ask questions
+            img_paths (list of paths): List of image file path(s)
+            printlog (bool): True to printout detailed intermediate result of llm
+        Returns:
+            success (bool): False to indicate error
+            content (string): Response content
+        """
+        return await self.send_gpt4_vision_base64_imgs_async(prompt, self.encode_images(img_paths), printlog=printlog)
 
+    def send_gpt4_vision_imgs(self, prompt, imgs, printlog=False):
+        """
+        Use gpt4-v to analyze images encoded in memory, without writing and reading them back from files
+        Args:
+            prompt (str): Prompt to ask questions
+            imgs (list of bytes): List of encoded jpg, png or webp image(s)
+            printlog (bool): True to printout detailed intermediate result of llm
+        Returns:
+            success (bool): False to indicate error
+            content (string): Response content
+        """
+        return self.__run_sync(self.__send_vision(prompt, [base64.b64encode(img).decode('utf-8') for img in imgs], printlog,
+                                                  [self.image_mime_type(img) for img in imgs]))
+
+    async def send_gpt4_vision_imgs_async(self, prompt, imgs, printlog=False):
+        """
+        Use gpt4-v to analyze images encoded in memory without blocking the event loop of the caller
+        Args:
+            prompt (str): Prompt to ask questions
+            imgs (list of bytes): List of encoded jpg, png or webp image(s)
+            printlog (bool): True to printout detailed intermediate result of llm
+        Returns:
+            success (bool): False to indicate error
+            content (string): Response content
+        """
+        return await self.__run_async(self.__send_vision(prompt, [base64.b64encode(img).decode('utf-8') for img in imgs],
+                                                         printlog, [self.image_mime_type(img) for img in imgs]))
+
+    @staticmethod
+    def image_mime_type(img):
+        """
+        Tell the mime type of the encoded image by its signature
+        """
+        if img[:8] == b'\x89PNG\r\n\x1a\n':
+            return 'image/png'
+        if img[:4] == b'RIFF' and img[8:12] == b'WEBP':
+            return 'image/webp'
+        return 'image/jpeg'
+
+    @staticmethod
+    def encode_images(img_paths):
+        """
+        Read images as base64
+        Args:
+            img_paths (list of paths): List of image file path(s)
+        Returns:
+            base64_imgs (list): List of base64 image(s)
+        """
         base64_imgs = []
         for img_path in img_paths:
-            base64_imgs.append(encode_image(img_path))
-        return self.send_gpt4_vision_base64_imgs(prompt, base64_imgs, printlog=printlog)
+            with open(img_path, "rb") as image_file:
+                base64_imgs.append(base64.b64encode(image_file.read()).decode('utf-8'))
+        return base64_imgs
+
+    '''
+    ********************
+    *** Async Client ***
+    ********************
+    '''
+    def __get_loop(self):
+        """
+        Start the background event loop on the first request
+        """
+        with self.__loop_lock:
+            if self.__loop is None:
+                self.__loop = asyncio.new_event_loop()
+                threading.Thread(target=self.__loop.run_forever, daemon=True).start()
+        return self.__loop
+
+    def __run_sync(self, coro):
+        """
+        Run the coroutine on the background loop and block until its result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.__get_loop()).result()
+
+    def run_sync(self, coro):
+        """
+        Run a coroutine of fm requests on the background loop and block until its result, so synchronous code
+        can be called from a thread with a running event loop and does not create a loop for each call
+        Args:
+            coro (coroutine): Coroutine to run
+        Returns:
+            The result of the coroutine
+        """
+        loop = self.__get_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError('run_sync can not block the background loop it runs on, await the coroutine instead')
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    async def __run_async(self, coro):
+        """
+        Run the coroutine on the background loop and await its result from the loop of the caller
+        """
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.__get_loop()))
+
+    async def __create_chat_completion(self, **kwargs):
+        """
+        Request a chat completion through the pooled client with bounded concurrency, retrying with exponential
+        backoff on rate limit, server errors, timeout and connection errors.
+        Each attempt holds a slot of the concurrency only while in flight, so the requests backing off do not
+        starve the others
+        """
+        if self.__client is None:
+            self.__client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout, max_retries=0)
+            self.__semaphore = asyncio.Semaphore(self.max_concurrency)
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.__semaphore:
+                    return await self.__client.chat.completions.create(**kwargs)
+            except (openai.RateLimitError, openai.InternalServerError, openai.APITimeoutError, openai.APIConnectionError) as e:
+                if attempt == self.max_retries:
+                    raise e
+                print('FM request failed (%s), retry in %.2fs' % (type(e).__name__, self.retry_backoff * 2 ** attempt))
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
 
 
 if __name__ == '__main__':
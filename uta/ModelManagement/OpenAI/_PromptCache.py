@@ -0,0 +1,158 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class _PromptCache:
+    def __init__(self, backend=None, ttl=24 * 3600):
+        """
+        Cache of fm responses keyed by the canonical hash of the request
+        Args:
+            backend: Storage of the entries, _MemoryPromptCacheBackend or _SQLitePromptCacheBackend, default in memory
+            ttl (float): Seconds for an entry to live
+        """
+        self.backend = backend if backend is not None else _MemoryPromptCacheBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()    # the counters are updated from the background loop and the caller threads
+
+    @staticmethod
+    def make_key(model, messages, response_format=None):
+        """
+        Hash the request canonically, so the same request has the same key regardless of the order of dict keys
+        Args:
+            model (str): Model name
+            messages (list): Conversation sent to the model
+            response_format (dict): Response format of the request
+        Returns:
+            key (str)
+        """
+        request = {'model': model, 'messages': messages, 'response_format': response_format}
+        return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Returns:
+            response (dict): Cached response, or None if not cached or expired
+        """
+        response = self.backend.get(key, time.time())
+        with self.__lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def set(self, key, response):
+        """
+        Args:
+            key (str): Request key
+            response (dict): Response to cache, must be json serializable
+        """
+        self.backend.set(key, response, time.time() + self.ttl)
+
+    def clear(self):
+        self.backend.clear()
+        with self.__lock:
+            self.hits, self.misses = 0, 0
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict): {'hits':, 'misses':, 'hit_rate':, 'entries':}
+        """
+        with self.__lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total > 0 else 0,
+                'entries': self.backend.size()}
+
+
+class _MemoryPromptCacheBackend:
+    def __init__(self, max_entries=1000):
+        """
+        Least recently used entries in memory
+        Args:
+            max_entries (int): Maximum number of entries
+        """
+        self.max_entries = max_entries
+        self.__entries = OrderedDict()     # {key: (response, expire_at)}, from the least to the most recently used
+        self.__lock = threading.Lock()
+
+    def get(self, key, now):
+        with self.__lock:
+            if key not in self.__entries:
+                return None
+            response, expire_at = self.__entries[key]
+            if expire_at < now:
+                del self.__entries[key]
+                return None
+            self.__entries.move_to_end(key)
+            return json.loads(response)
+
+    def set(self, key, response, expire_at):
+        with self.__lock:
+            # store the serialized response so the cached entry can not be changed by the caller
+            self.__entries[key] = (json.dumps(response), expire_at)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def size(self):
+        return len(self.__entries)
+
+
+class _SQLitePromptCacheBackend:
+    def __init__(self, db_file, max_entries=10000):
+        """
+        Least recently used entries persisted in a SQLite database, shared across processes and sessions
+        Args:
+            db_file (path): SQLite database file
+            max_entries (int): Maximum number of entries
+        """
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.__conn.execute('CREATE TABLE IF NOT EXISTS prompt_cache (key TEXT PRIMARY KEY, response TEXT, '
+                            'expire_at REAL, last_access REAL)')
+        self.__conn.execute('CREATE INDEX IF NOT EXISTS prompt_cache_last_access ON prompt_cache (last_access)')
+        self.__conn.commit()
+
+    def get(self, key, now):
+        with self.__lock:
+            row = self.__conn.execute('SELECT response, expire_at FROM prompt_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self.__conn.execute('DELETE FROM prompt_cache WHERE key = ?', (key,))
+                self.__conn.commit()
+                return None
+            self.__conn.execute('UPDATE prompt_cache SET last_access = ? WHERE key = ?', (now, key))
+            self.__conn.commit()
+            return json.loads(row[0])
+
+    def set(self, key, response, expire_at):
+        with self.__lock:
+            self.__conn.execute('INSERT OR REPLACE INTO prompt_cache VALUES (?, ?, ?, ?)',
+                                (key, json.dumps(response), expire_at, time.time()))
+            self.__conn.execute('DELETE FROM prompt_cache WHERE key IN (SELECT key FROM prompt_cache '
+                                'ORDER BY last_access DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+            self.__conn.commit()
+
+    def clear(self):
+        with self.__lock:
+            self.__conn.execute('DELETE FROM prompt_cache')
+            self.__conn.commit()
+
+    def size(self):
+        with self.__lock:
+            return self.__conn.execute('SELECT COUNT(*) FROM prompt_cache').fetchone()[0]
@@ -0,0 +1,108 @@
+import threading
+import tiktoken
+
+# tiktoken encoders are expensive to build and safe to share, so build each one once per process
+_encoders = {}     # {model: tiktoken encoder}
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(model='gpt-3.5-turbo'):
+    """
+    Get the cached tiktoken encoder of the model
+    Args:
+        model (str): Model name
+    Returns:
+        encoder (tiktoken.Encoding)
+    """
+    encoder = _encoders.get(model)
+    if encoder is None:
+        with _encoders_lock:
+            if model not in _encoders:
+                try:
+                    _encoders[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    # models unknown to tiktoken, such as new snapshots, use the encoding of the gpt-4 family
+                    _encoders[model] = tiktoken.get_encoding('cl100k_base')
+            encoder = _encoders[model]
+    return encoder
+
+
+class _TokenCounter:
+    # tokens wrapping each message and priming the reply, following the chat format of the gpt-3.5 and gpt-4 models
+    tokens_per_message = 3
+    tokens_per_reply = 3
+
+    def __init__(self, model='gpt-3.5-turbo'):
+        """
+        Incremental token counter of a conversation, only the messages appended since the last count are encoded
+        Messages already counted are assumed not to be edited in place
+        Args:
+            model (str): Model name
+        """
+        self.model = model
+        self.__conversation = None      # the conversation being counted
+        self.__message_tokens = []      # token size of each counted message
+        self.__total_tokens = 0
+
+    @staticmethod
+    def count_tokens(string, model='gpt-3.5-turbo'):
+        """
+        Args:
+            string (str): String to count
+            model (str): Model name
+        Returns:
+            tokens (int): Token size of the string
+        """
+        return len(get_encoder(model).encode(string))
+
+    @staticmethod
+    def count_tokens_many(strings, model='gpt-3.5-turbo'):
+        """
+        Count a batch of strings in one call, encoding them in parallel
+        Args:
+            strings (list of str): Strings to count
+            model (str): Model name
+        Returns:
+            tokens (list of int): Token size of each string
+        """
+        return [len(tokens) for tokens in get_encoder(model).encode_batch(list(strings))]
+
+    @staticmethod
+    def message_content(message):
+        """
+        Get the text content of a message, the image parts of vision messages are ignored
+        Args:
+            message (dict): {'role': 'user', 'content': '...'}
+        """
+        content = message.get('content') or ''
+        if isinstance(content, list):
+            content = '\n'.join([part['text'] for part in content if part.get('type') == 'text'])
+        return content
+
+    def count_conversation(self, conversation):
+        """
+        Count the prompt tokens of the conversation, encoding only the messages appended since the last call.
+        The conversation is recounted from scratch if it is another list or has been shortened
+        Args:
+            conversation (list): llm conversation [{'role': 'user', 'content': '...'}]
+        Returns:
+            tokens (int): Token size of the conversation as a prompt
+        """
+        if conversation is not self.__conversation or len(conversation) < len(self.__message_tokens):
+            self.reset()
+            self.__conversation = conversation
+        new_messages = conversation[len(self.__message_tokens):]
+        if len(new_messages) > 0:
+            texts = []
+            for msg in new_messages:
+                texts += [msg['role'], self.message_content(msg)]
+            tokens = self.count_tokens_many(texts, self.model)
+            for i in range(0, len(tokens), 2):
+                self.__message_tokens.append(self.tokens_per_message + tokens[i] + tokens[i + 1])
+                self.__total_tokens += self.__message_tokens[-1]
+        return self.__total_tokens + self.tokens_per_reply
+
+    def reset(self):
+        self.__conversation = None
+        self.__message_tokens = []
+        self.__total_tokens = 0
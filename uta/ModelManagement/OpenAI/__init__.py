@@ -1 +1,3 @@
 from uta.ModelManagement.OpenAI._OpenAI import _OpenAI
+from uta.ModelManagement.OpenAI._TokenCounter import _TokenCounter
+from uta.ModelManagement.OpenAI._PromptCache import _PromptCache, _MemoryPromptCacheBackend, _SQLitePromptCacheBackend
@@ -1,4 +1,5 @@
 import os
+import json
 from os.path import join as pjoin
 
 import cv2
@@ -6,18 +7,53 @@ from PIL import Image
 import io
 
 from uta.SystemConnection._Local import _Local
+from uta.SystemConnection._TaskJournal import _TaskJournal
+from uta.SystemConnection._SessionStore import _SessionStore
+from uta.SystemConnection._StorageBackend import _FileStorageBackend
+from uta.SystemConnection._ArtifactWriter import _ArtifactWriter
 from uta.DataStructures import *
 from uta.config import *
 
 
 class SystemConnector:
-    def __init__(self):
+    def __init__(self, backend=None, max_sessions=256, flush_interval=2, max_artifact_writes=16,
+                 annotated_img_format='.jpg', annotated_img_quality=90):
         """
         Initializes a SystemConnector instance.
+        Args:
+            backend (_StorageBackend): Storage of users, tasks and UI steps, None to use files under DATA_PATH
+            max_sessions (int): Maximum number of users and tasks kept in memory
+            flush_interval (float): Seconds between the background writes of the saved users and tasks
+            max_artifact_writes (int): Maximum number of UI step files waiting to be written in the background
+            annotated_img_format (str): '.jpg' or '.webp' to encode the annotated screenshot for both storage and upload
+            annotated_img_quality (int): 0-100 encoding quality of the annotated screenshot
         """
         self.__local = _Local()
+        self.__user_data_root = DATA_PATH
+        self.__backend = backend if backend is not None else _FileStorageBackend(DATA_PATH)
+        self.__task_journal = _TaskJournal(self.__backend)
+        self.__sessions = _SessionStore(self.__task_journal.write_ops, max_entries=max_sessions, flush_interval=flush_interval,
+                                        on_evict=self.__forget_session)
+        self.__artifact_writer = _ArtifactWriter(max_pending=max_artifact_writes)
+        self.annotated_img_format = annotated_img_format
+        self.annotated_img_quality = annotated_img_quality
+
+    @property
+    def user_data_root(self):
+        """
+        Local folder of the device captures and working files, also the root of the default file storage
+        """
+        return self.__user_data_root
 
-        self.user_data_root = DATA_PATH
+    @user_data_root.setter
+    def user_data_root(self, user_data_root):
+        self.__user_data_root = user_data_root
+        if isinstance(self.__backend, _FileStorageBackend):
+            self.__backend.root = user_data_root
+
+    @property
+    def backend(self):
+        return self.__backend
 
     '''
     ***************
@@ -26,17 +62,24 @@ class SystemConnector:
     '''
     def load_user(self, user_id):
         """
-        Load user info from 'data/user_id/user.json'
+        Load user info from memory if it is in session, otherwise from 'user_id/user.json' in the storage
         Args:
             user_id (str)
         Returns:
             user (User)
         """
-        user_file = pjoin(self.user_data_root, user_id, 'user.json')
-        if os.path.exists(user_file):
+        user = self.__sessions.get(('user', user_id))
+        if user is not None:
+            return user
+        # write the saves still pending, such as of a discarded user, before reading it back
+        self.__sessions.flush(('user', user_id))
+        user_key = user_id + '/user.json'
+        data = self.__backend.read(user_key)
+        if data is not None:
             user = User(user_id=user_id)
-            user.load_from_dict(self.load_json(user_file))
-            print('- Import user info from file', user_file, '-')
+            user.load_from_dict(json.loads(data))
+            print('- Import user info from', user_key, '-')
+            self.__sessions.put(('user', user_id), user)
             return user
         else:
             # raise FileNotFoundError(f"The user file {user_file} does not exist.")
@@ -44,23 +87,26 @@ class SystemConnector:
 
     def save_user(self, user):
         """
-        Save user info under the user folder
-        'data/user_id/user.json'
+        Save user info to 'user_id/user.json' in the storage, written behind in the background
         Args:
             user (User)
         """
-        user_folder = pjoin(self.user_data_root, user.user_id)
-        if not os.path.exists(user_folder):
-            os.makedirs(user_folder)
-            print('- Create user folder', user_folder, '-')
-        user_file = pjoin(user_folder, 'user.json')
-        self.save_json(user.to_dict(), user_file)
-        print('- Export user info to', user_file, '-')
+        user_key = user.user_id + '/user.json'
+        data = json.dumps(user.to_dict(), indent=4).encode('utf-8')
+        self.__sessions.put(('user', user.user_id), user, [('replace', user_key, data)])
+        print('- Export user info to', user_key, '-')
+
+    def __forget_session(self, key):
+        """
+        Release the journal baseline of an evicted task
+        """
+        if key[0] == 'task':
+            self.__task_journal.forget(key[1], key[2])
 
     def load_task(self, user_id, task_id):
         """
-        Retrieve task if exists or create a new task if not
-        'data/user_id/task_id/task.json'
+        Retrieve task from memory if it is in session, otherwise rebuild from the snapshot 'user_id/task_id/task.json'
+        and the journal 'user_id/task_id/task_journal.jsonl' in the storage
         Args:
             user_id (str): User id, associated to the folder named with the user_id
             task_id (str): Task id, associated to the json file named with task in the user folder
@@ -68,66 +114,177 @@ class SystemConnector:
             Task (Task) if exists: Retrieved or created Task object
             None if not exists
         """
-        user_folder = pjoin(self.user_data_root, user_id)       # 'data/user_id'
-        task_file = pjoin(user_folder, task_id, 'task.json')    # 'data/user_id/task_id/task.json'
-        if os.path.exists(task_file):
-            task = Task(task_id=task_id, user_id=user_id)
-            task.load_from_dict(self.load_json(task_file))
-            print('- Import task from file', task_file, '-')
+        task = self.__sessions.get(('task', user_id, task_id))
+        if task is not None:
             return task
-        else:
-            return None
+        # write the saves still pending, such as of a discarded task, before reading it back
+        self.__sessions.flush(('task', user_id, task_id))
+        task = self.__task_journal.load_task(Task(task_id=task_id, user_id=user_id))
+        if task is not None:
+            print('- Import task from', user_id + '/' + task_id, '-')
+            self.__sessions.put(('task', user_id, task_id), task)
+        return task
 
     def save_task(self, task):
         """
-        Save Task object to json file under the associated user folder, and with the file name of task id
-        'data/user_id/task_id/task.json'
+        Save Task object by appending the changes since the last save to the journal 'user_id/task_id/task_journal.jsonl',
+        which is compacted into the snapshot 'user_id/task_id/task.json' in the storage
+        The changes are encoded now and written behind in the background
         Args:
             task (Task): Task object
         """
-        task_folder = pjoin(self.user_data_root, task.user_id, task.task_id)
-        if not os.path.exists(task_folder):
-            os.makedirs(task_folder)
-            # print('- Create task folder', task_folder, '-')
-        task_file = pjoin(task_folder, 'task.json')
-        self.save_json(task.to_dict(), task_file)
-        # print('- Export task to file', task_file, '-')
+        self.__sessions.put(('task', task.user_id, task.task_id), task, self.__task_journal.make_save_ops(task))
+        # print('- Export task to', task.user_id + '/' + task.task_id, '-')
+
+    def discard_task(self, user_id, task_id):
+        """
+        Drop the changes of the task in memory since its last save, such as of a failed step,
+        so the next load rebuilds it from the last save
+        Args:
+            user_id (str): User id
+            task_id (str): Task id
+        """
+        self.__sessions.discard(('task', user_id, task_id))
+
+    def flush_task(self, user_id, task_id):
+        """
+        Write the pending saves of the task and its user to the storage now, such as when the task is completed
+        Args:
+            user_id (str): User id
+            task_id (str): Task id
+        """
+        self.__sessions.flush(('user', user_id))
+        self.__sessions.flush(('task', user_id, task_id))
+        self.__artifact_writer.flush()
+
+    def flush(self):
+        """
+        Write all the pending saves of users and tasks and the UI step files to the storage now
+        """
+        self.__sessions.flush()
+        self.__artifact_writer.flush()
+
+    def close(self):
+        """
+        Stop the background writes and make all the pending saves durable
+        """
+        self.__sessions.close()
+        self.__artifact_writer.close()
 
     @staticmethod
-    def load_ui_data(screenshot_file, xml_file=None, ui_resize=(1080, 2280)):
+    def load_ui_data(screenshot_file=None, xml_file=None, ui_resize=(1080, 2280), screenshot=None, xml=None, ui_id=None):
         """
         Load UI to UIData
         Args:
             screenshot_file (path): Path to screenshot image
             xml_file (path): Path to xml file if any
             ui_resize (tuple): Specify the size/resolution of the UI
+            screenshot (bytes or ndarray): Screenshot in memory, used instead of the screenshot_file
+            xml (str): XML content in memory, used instead of the xml_file
+            ui_id (str): Id of the UI, None to use the name of the screenshot_file
         Returns:
             self.ui_data (UIData)
         """
-        return UIData(screenshot_file, xml_file, ui_resize)
+        return UIData(screenshot_file, xml_file, ui_resize, screenshot=screenshot, xml=xml, ui_id=ui_id)
 
     def save_ui_data(self, ui_data, output_dir):
         """
-        Save UIData to files, including elements and tree
-        Save to 'data/user_id/task_id/ui_id_element.json', 'data/user_id/task_id/ui_id_uitree.json'
+        Save UIData to the storage, including elements and tree
+        Save to 'user_id/task_id/ui_id_uitree.json', 'user_id/task_id/ui_id_annotated_elements.jpg'
+        The annotated screenshot is encoded once into ui_data.annotated_elements_screenshot_encoded for the vision model,
+        and the files are written in the background, so the elements must not be changed after saving
         Args:
             ui_data (UIData): UIData object to save
             output_dir (str): The output directory, usually under 'data/user_id/task_id/'
         """
         # output_file_path_elements = pjoin(output_dir, ui_data.ui_id + '_elements.json')
         # self.save_json(ui_data.elements, output_file_path_elements)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            # print('- Create ui folder', output_dir, '-')
-        output_file_path_element_tree = pjoin(output_dir, ui_data.ui_id + '_uitree.json')
-        self.save_json(ui_data.elements, output_file_path_element_tree)
-        # print('- Export ui elements to file', output_file_path_element_tree, '-')
+        # the steps out of the data folder are kept in the output directory as files
+        key_prefix = os.path.relpath(output_dir, self.user_data_root).replace(os.sep, '/')
+        backend = self.__backend
+        if key_prefix.startswith('..'):
+            backend, key_prefix = _FileStorageBackend(output_dir), ''
+        key_prefix = '' if key_prefix in ('', '.') else key_prefix + '/'
+        self.__artifact_writer.submit(self.__write_json, backend, key_prefix + ui_data.ui_id + '_uitree.json', ui_data.elements)
+        # print('- Export ui elements to', key_prefix + ui_data.ui_id + '_uitree.json', '-')
 
         # save annotated screenshot
         if ui_data.annotated_elements_screenshot is not None:
-            ui_data.annotated_elements_screenshot_path = pjoin(output_dir, ui_data.ui_id + '_annotated_elements.png')
-            cv2.imwrite(ui_data.annotated_elements_screenshot_path, ui_data.annotated_elements_screenshot)
-            # print('- Export annotated elements screenshot to file', ui_data.annotated_elements_screenshot_path, '-')
+            annotated_key = key_prefix + ui_data.ui_id + '_annotated_elements' + self.annotated_img_format
+            ui_data.annotated_elements_screenshot_encoded = self.encode_img(ui_data.annotated_elements_screenshot,
+                                                                            self.annotated_img_format, self.annotated_img_quality)
+            ui_data.annotated_elements_screenshot_path = backend.local_path(annotated_key)
+            self.__artifact_writer.submit(backend.write, annotated_key, ui_data.annotated_elements_screenshot_encoded)
+            # print('- Export annotated elements screenshot to', annotated_key, '-')
+
+    @staticmethod
+    def __write_json(backend, key, json_obj):
+        backend.write(key, json.dumps(json_obj, indent=4).encode('utf-8'))
+
+    @staticmethod
+    def encode_img(img, img_format='.jpg', quality=90):
+        """
+        Encode the image array into bytes
+        Args:
+            img (ndarray): Image array
+            img_format (str): '.jpg', '.webp' or '.png'
+            quality (int): 0-100 quality of '.jpg' and '.webp'
+        Returns:
+            data (bytes): Encoded image
+        """
+        params = []
+        if img_format in ('.jpg', '.jpeg'):
+            params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        elif img_format == '.webp':
+            params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+        return cv2.imencode(img_format, img, params)[1].tobytes()
+
+    '''
+    *******************
+    *** Bulk Export ***
+    *******************
+    '''
+    def export_to_backend(self, backend, prefix=''):
+        """
+        Copy the data in the storage to another backend, such as moving from files to SQLite
+        Args:
+            backend (_StorageBackend): Target storage
+            prefix (str): Only copy the keys starting with the prefix, such as 'user_id/'
+        Returns:
+            count (int): Number of copied keys
+        """
+        self.flush()
+        return self.copy_storage(self.__backend, backend, prefix)
+
+    def import_from_backend(self, backend, prefix=''):
+        """
+        Copy the data in another backend into the storage
+        The sessions in memory are written and dropped first, so the imported users and tasks are loaded afresh
+        Args:
+            backend (_StorageBackend): Source storage
+            prefix (str): Only copy the keys starting with the prefix, such as 'user_id/'
+        Returns:
+            count (int): Number of copied keys
+        """
+        self.close()
+        count = self.copy_storage(backend, self.__backend, prefix)
+        self.__task_journal = _TaskJournal(self.__backend, self.__task_journal.compaction_ratio)
+        self.__sessions = _SessionStore(self.__task_journal.write_ops, max_entries=self.__sessions.max_entries,
+                                        flush_interval=self.__sessions.flush_interval, on_evict=self.__forget_session)
+        self.__artifact_writer = _ArtifactWriter(self.__artifact_writer.max_workers, self.__artifact_writer.max_pending)
+        return count
+
+    @staticmethod
+    def copy_storage(source, target, prefix=''):
+        """
+        Copy the keys starting with the prefix from the source backend to the target backend
+        Returns:
+            count (int): Number of copied keys
+        """
+        keys = source.list_keys(prefix)
+        for key in keys:
+            target.write(key, source.read(key))
+        return len(keys)
 
     '''
     ****************
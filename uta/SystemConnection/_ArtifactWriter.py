@@ -0,0 +1,72 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _ArtifactWriter:
+    def __init__(self, max_workers=2, max_pending=16):
+        """
+        Write the step artifacts, such as the ui tree json and the annotated screenshot, in a background thread pool,
+        so they are persisted off the critical path of the step
+        Args:
+            max_workers (int): Number of writer threads
+            max_pending (int): Maximum number of writes queued or running, submitting more waits for a slot,
+                               so a slow storage holds back the steps instead of piling up screenshots in memory
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='artifact-writer')
+        self.__slots = threading.BoundedSemaphore(max_pending)
+        self.__lock = threading.Lock()
+        self.__pending = set()      # futures of the writes not finished
+        self.__errors = []          # exceptions of the failed writes not yet reported by flush
+
+    def submit(self, func, *args):
+        """
+        Queue func(*args) to run in the background, waiting if max_pending writes are already queued
+        """
+        self.__slots.acquire()
+        try:
+            future = self.__executor.submit(func, *args)
+        except Exception as e:
+            self.__slots.release()
+            raise e
+        with self.__lock:
+            self.__pending.add(future)
+        future.add_done_callback(self.__on_done)
+        return future
+
+    def __on_done(self, future):
+        with self.__lock:
+            self.__pending.discard(future)
+            if future.exception() is not None:
+                print('Failed to write artifact:', future.exception())
+                self.__errors.append(future.exception())
+        self.__slots.release()
+
+    def pending_count(self):
+        with self.__lock:
+            return len(self.__pending)
+
+    def flush(self):
+        """
+        Wait until all the submitted writes are finished
+        Raises the first error of the writes failed since the last flush
+        """
+        with self.__lock:
+            pending = list(self.__pending)
+        for future in pending:
+            try:
+                future.result()
+            except Exception:
+                pass
+        with self.__lock:
+            errors, self.__errors = self.__errors, []
+        if len(errors) > 0:
+            raise errors[0]
+
+    def close(self):
+        """
+        Finish all the submitted writes and stop the threads
+        """
+        self.__executor.shutdown(wait=True)
+        self.flush()
@@ -0,0 +1,150 @@
+import atexit
+import weakref
+import functools
+import threading
+from collections import OrderedDict
+
+
+class _SessionStore:
+    def __init__(self, write_ops, max_entries=256, flush_interval=2, on_evict=None):
+        """
+        Keep the hot User and Task objects in memory and write their saves behind, in a background thread
+        The saves are encoded into file operations by the caller, so the objects can keep changing while being written
+        Args:
+            write_ops (function): write_ops(ops) to write a list of file operations in order
+            max_entries (int): Maximum number of objects in memory, the least recently used one is flushed and evicted
+            flush_interval (float): Seconds between the background flushes
+            on_evict (function): on_evict(key) called after an object is flushed and evicted
+        """
+        self.__write_ops = write_ops
+        self.__on_evict = on_evict
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.__entries = OrderedDict()   # {key: object}, from the least to the most recently used
+        self.__pending = {}              # {key: [file operations not yet written]}
+        self.__lock = threading.RLock()
+        self.__io_lock = threading.Lock()   # keeps the operations of each key written in order
+        self.__closed = threading.Event()
+        # the flusher and the exit hook only hold the store weakly, so a store dropped without being closed
+        # is still collected, and its flusher stops
+        store_ref = weakref.ref(self)
+        self.__flusher = threading.Thread(target=_SessionStore.__flush_periodically, args=(store_ref, self.__closed),
+                                          daemon=True)
+        self.__flusher.start()
+        # make the pending saves durable when the process exits
+        self.__exit_hook = functools.partial(_SessionStore.__close_at_exit, store_ref)
+        atexit.register(self.__exit_hook)
+
+    def get(self, key):
+        """
+        Args:
+            key (tuple): ('user', user_id) or ('task', user_id, task_id)
+        Returns:
+            obj (User or Task): The object in memory, None if not cached
+        """
+        with self.__lock:
+            if key not in self.__entries:
+                return None
+            self.__entries.move_to_end(key)
+            return self.__entries[key]
+
+    def put(self, key, obj, ops=()):
+        """
+        Cache the object and queue its file operations to write behind
+        Args:
+            key (tuple): ('user', user_id) or ('task', user_id, task_id)
+            obj (User or Task): The object
+            ops (list): File operations to save the object [(op, file path, bytes)]
+        """
+        with self.__lock:
+            self.__entries[key] = obj
+            self.__entries.move_to_end(key)
+            if len(ops) > 0:
+                self.__pending.setdefault(key, []).extend(ops)
+            evicted = []
+            while len(self.__entries) > self.max_entries:
+                evicted.append(self.__entries.popitem(last=False)[0])
+        # an evicted object is reloaded from the disk, so its saves must be written first
+        for evicted_key in evicted:
+            self.flush(evicted_key)
+            if self.__on_evict is not None:
+                self.__on_evict(evicted_key)
+
+    def discard(self, key):
+        """
+        Drop the object from memory without saving its changes since the last put, so it is reloaded from the last
+        save. Its pending operations are kept and written before it is reloaded
+        Args:
+            key (tuple): ('user', user_id) or ('task', user_id, task_id)
+        """
+        with self.__lock:
+            discarded = self.__entries.pop(key, None) is not None
+        if discarded and self.__on_evict is not None:
+            self.__on_evict(key)
+
+    def flush(self, key=None):
+        """
+        Write the pending operations of the key, or of all the keys if None, before returning
+        If writing fails, the operations not confirmed are queued again, rewriting them is harmless as the journal
+        skips the records already applied and the replaces are idempotent
+        """
+        with self.__io_lock:
+            with self.__lock:
+                if key is None:
+                    pending = list(self.__pending.items())
+                    self.__pending = {}
+                else:
+                    pending = [(key, self.__pending.pop(key, []))]
+            for i, (pending_key, ops) in enumerate(pending):
+                try:
+                    self.__write_ops(ops)
+                except Exception as e:
+                    with self.__lock:
+                        for failed_key, failed_ops in pending[i:]:
+                            self.__pending[failed_key] = failed_ops + self.__pending.get(failed_key, [])
+                    raise e
+
+    def dirty_keys(self):
+        with self.__lock:
+            return list(self.__pending.keys())
+
+    def close(self):
+        """
+        Stop the background flushes and write all the pending operations
+        """
+        self.__closed.set()
+        if self.__flusher.is_alive() and self.__flusher is not threading.current_thread():
+            self.__flusher.join()
+        self.flush()
+        atexit.unregister(self.__exit_hook)
+
+    def __del__(self):
+        # a store dropped without being closed still writes its pending saves
+        self.__closed.set()
+        try:
+            self.flush()
+        except Exception as e:
+            print('Failed to flush sessions:', e)
+
+    @staticmethod
+    def __close_at_exit(store_ref):
+        store = store_ref()
+        if store is not None:
+            store.close()
+
+    @staticmethod
+    def __flush_periodically(store_ref, closed):
+        store = store_ref()
+        while store is not None:
+            flush_interval = store.flush_interval
+            # release the store while waiting, so it can be collected
+            del store
+            if closed.wait(flush_interval):
+                break
+            store = store_ref()
+            if store is not None:
+                try:
+                    store.flush()
+                except Exception as e:
+                    # the failed saves stay pending and are retried in the next flush
+                    print('Failed to flush sessions:', e)
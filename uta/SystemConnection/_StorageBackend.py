@@ -0,0 +1,331 @@
+import os
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from urllib.parse import quote, unquote
+from os.path import join as pjoin
+
+
+class _StorageBackend(ABC):
+    """
+    Storage of the user data as bytes under '/' separated keys, in the layout of the data folder:
+        'user_id/user.json', 'user_id/task_id/task.json', 'user_id/task_id/task_journal.jsonl',
+        'user_id/task_id/<ui_id>_uitree.json', 'user_id/task_id/<ui_id>_annotated_elements.jpg'
+    """
+    @abstractmethod
+    def read(self, key):
+        """
+        Returns:
+            data (bytes): None if the key does not exist
+        """
+        pass
+
+    @abstractmethod
+    def write(self, key, data):
+        """
+        Atomically create or replace the key with the data (bytes)
+        """
+        pass
+
+    @abstractmethod
+    def append(self, key, data):
+        """
+        Append the data (bytes) to the key, creating it if not exists
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        """
+        Delete the key if exists
+        """
+        pass
+
+    @abstractmethod
+    def list_keys(self, prefix=''):
+        """
+        Returns:
+            keys (list): Sorted keys starting with the prefix
+        """
+        pass
+
+    def exists(self, key):
+        return self.read(key) is not None
+
+    def local_path(self, key):
+        """
+        Returns:
+            path (path): File path of the key readable by other tools, None if the key is not stored as a file
+        """
+        return None
+
+
+class _FileStorageBackend(_StorageBackend):
+    def __init__(self, root):
+        """
+        Keys as files under the root directory, the default layout of the data folder
+        Args:
+            root (path): Root directory, usually DATA_PATH
+        """
+        self.root = root
+
+    def local_path(self, key):
+        return pjoin(self.root, *key.split('/'))
+
+    def read(self, key):
+        file_path = self.local_path(key)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, 'rb') as fp:
+            return fp.read()
+
+    def write(self, key, data):
+        file_path = self.local_path(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # write to a temporary file and rename, so a crash leaves either the old or the new file
+        tmp_file = file_path + '.tmp'
+        with open(tmp_file, 'wb') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_file, file_path)
+
+    def append(self, key, data):
+        file_path = self.local_path(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'ab') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def delete(self, key):
+        file_path = self.local_path(key)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    def list_keys(self, prefix=''):
+        keys = []
+        for folder, _, files in os.walk(self.root):
+            rel_folder = os.path.relpath(folder, self.root).replace(os.sep, '/')
+            for file in files:
+                key = file if rel_folder == '.' else rel_folder + '/' + file
+                if key.startswith(prefix) and not key.endswith('.tmp'):
+                    keys.append(key)
+        return sorted(keys)
+
+
+class _ObjectStorageBackend(_StorageBackend):
+    def __init__(self, root):
+        """
+        Local stand-in of an object store such as S3: a flat namespace of immutable objects that are put and got whole
+        Objects are files named by the escaped key in the root directory, so there is no directory tree to scan.
+        Objects can not be appended, so each append puts a record object '<key>#<seq>' rather than rewriting the key,
+        and reading the key concatenates its object with its records in order
+        Args:
+            root (path): Directory of the objects, plays the bucket
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.__lock = threading.Lock()
+        # {key: sequence number of its last record object}, listed once from the bucket and kept up to date after
+        self.__record_seqs = {}
+        for name in os.listdir(root):
+            if '#' in name and not name.endswith('.tmp'):
+                key, seq = name.rsplit('#', 1)
+                key = unquote(key)
+                self.__record_seqs[key] = max(self.__record_seqs.get(key, 0), int(seq))
+
+    def __object_path(self, key, seq=None):
+        # '#' is always escaped in the key, so the record objects never collide with the keys
+        name = quote(key, safe='')
+        return pjoin(self.root, name if seq is None else name + '#' + str(seq))
+
+    @staticmethod
+    def __get_object(object_path):
+        if not os.path.exists(object_path):
+            return None
+        with open(object_path, 'rb') as fp:
+            return fp.read()
+
+    @staticmethod
+    def __put_object(object_path, data):
+        # a put replaces the whole object atomically
+        tmp_file = object_path + '.tmp'
+        with open(tmp_file, 'wb') as fp:
+            fp.write(data)
+        os.replace(tmp_file, object_path)
+
+    def __delete_records(self, key):
+        for seq in range(1, self.__record_seqs.pop(key, 0) + 1):
+            record_path = self.__object_path(key, seq)
+            if os.path.exists(record_path):
+                os.remove(record_path)
+
+    def read(self, key):
+        with self.__lock:
+            data = self.__get_object(self.__object_path(key))
+            records = [self.__get_object(self.__object_path(key, seq))
+                       for seq in range(1, self.__record_seqs.get(key, 0) + 1)]
+        records = [record for record in records if record is not None]
+        if len(records) == 0:
+            return data
+        return (data if data is not None else b'') + b''.join(records)
+
+    def write(self, key, data):
+        # put the object before deleting the records it replaces, so a crash leaves at worst duplicated records
+        with self.__lock:
+            self.__put_object(self.__object_path(key), data)
+            self.__delete_records(key)
+
+    def append(self, key, data):
+        # put the data as the next record object, so an append costs O(data) however long the key has grown
+        with self.__lock:
+            seq = self.__record_seqs.get(key, 0) + 1
+            self.__put_object(self.__object_path(key, seq), data)
+            self.__record_seqs[key] = seq
+
+    def delete(self, key):
+        with self.__lock:
+            object_path = self.__object_path(key)
+            if os.path.exists(object_path):
+                os.remove(object_path)
+            self.__delete_records(key)
+
+    def list_keys(self, prefix=''):
+        with self.__lock:
+            keys = set([unquote(name) for name in os.listdir(self.root)
+                        if '#' not in name and not name.endswith('.tmp')])
+            keys.update(self.__record_seqs)
+        return sorted([key for key in keys if key.startswith(prefix)])
+
+
+class _SQLiteStorageBackend(_StorageBackend):
+    def __init__(self, db_file):
+        """
+        Keys in indexed tables of a SQLite database, so users, tasks and UI steps can be queried across tasks:
+            users: 'user_id/user.json'
+            tasks: 'user_id/task_id/task.json', with the journal 'user_id/task_id/task_journal.jsonl' in task_journal
+            ui_steps: 'user_id/task_id/<ui_id>_<name>', such as the uitree json and the annotated screenshot blob
+            files: any other key
+        Args:
+            db_file (path): SQLite database file
+        """
+        self.db_file = db_file
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.__conn.executescript('''
+            CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, data BLOB, updated_at REAL);
+            CREATE TABLE IF NOT EXISTS tasks (user_id TEXT, task_id TEXT, data BLOB, updated_at REAL,
+                                              PRIMARY KEY (user_id, task_id));
+            CREATE TABLE IF NOT EXISTS task_journal (record_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                                     user_id TEXT, task_id TEXT, data BLOB);
+            CREATE INDEX IF NOT EXISTS task_journal_task ON task_journal (user_id, task_id);
+            CREATE TABLE IF NOT EXISTS ui_steps (user_id TEXT, task_id TEXT, ui_id TEXT, name TEXT, data BLOB,
+                                                 updated_at REAL, PRIMARY KEY (user_id, task_id, name));
+            CREATE INDEX IF NOT EXISTS ui_steps_ui ON ui_steps (user_id, task_id, ui_id);
+            CREATE TABLE IF NOT EXISTS files (key TEXT PRIMARY KEY, data BLOB, updated_at REAL);
+        ''')
+        self.__conn.commit()
+
+    @staticmethod
+    def __route(key):
+        """
+        Find the table of the key
+        Returns:
+            table (str): 'users', 'tasks', 'task_journal', 'ui_steps' or 'files'
+            ids (tuple): Primary key values of the key in the table
+        """
+        parts = key.split('/')
+        if len(parts) == 2 and parts[1] == 'user.json':
+            return 'users', (parts[0],)
+        if len(parts) == 3 and parts[2] == 'task.json':
+            return 'tasks', (parts[0], parts[1])
+        if len(parts) == 3 and parts[2] == 'task_journal.jsonl':
+            return 'task_journal', (parts[0], parts[1])
+        if len(parts) == 3 and '_' in parts[2]:
+            return 'ui_steps', (parts[0], parts[1], parts[2])
+        return 'files', (key,)
+
+    def read(self, key):
+        table, ids = self.__route(key)
+        with self.__lock:
+            if table == 'task_journal':
+                rows = self.__conn.execute('SELECT data FROM task_journal WHERE user_id = ? AND task_id = ? '
+                                           'ORDER BY record_id', ids).fetchall()
+                return b''.join([bytes(row[0]) for row in rows]) if len(rows) > 0 else None
+            where = {'users': 'user_id = ?', 'tasks': 'user_id = ? AND task_id = ?',
+                     'ui_steps': 'user_id = ? AND task_id = ? AND name = ?', 'files': 'key = ?'}[table]
+            row = self.__conn.execute('SELECT data FROM %s WHERE %s' % (table, where), ids).fetchone()
+            return bytes(row[0]) if row is not None else None
+
+    def write(self, key, data):
+        table, ids = self.__route(key)
+        now = time.time()
+        with self.__lock:
+            if table == 'task_journal':
+                self.__conn.execute('DELETE FROM task_journal WHERE user_id = ? AND task_id = ?', ids)
+                self.__conn.execute('INSERT INTO task_journal (user_id, task_id, data) VALUES (?, ?, ?)', ids + (data,))
+            elif table == 'ui_steps':
+                ui_id = ids[2].split('_')[0]
+                self.__conn.execute('INSERT OR REPLACE INTO ui_steps VALUES (?, ?, ?, ?, ?, ?)',
+                                    (ids[0], ids[1], ui_id, ids[2], data, now))
+            else:
+                self.__conn.execute('INSERT OR REPLACE INTO %s VALUES (%s)' % (table, ', '.join(['?'] * (len(ids) + 2))),
+                                    ids + (data, now))
+            self.__conn.commit()
+
+    def append(self, key, data):
+        table, ids = self.__route(key)
+        if table != 'task_journal':
+            old = self.read(key)
+            self.write(key, data if old is None else old + data)
+            return
+        # journal records are rows, appending is an insert
+        with self.__lock:
+            self.__conn.execute('INSERT INTO task_journal (user_id, task_id, data) VALUES (?, ?, ?)', ids + (data,))
+            self.__conn.commit()
+
+    def delete(self, key):
+        table, ids = self.__route(key)
+        where = {'users': 'user_id = ?', 'tasks': 'user_id = ? AND task_id = ?',
+                 'task_journal': 'user_id = ? AND task_id = ?',
+                 'ui_steps': 'user_id = ? AND task_id = ? AND name = ?', 'files': 'key = ?'}[table]
+        with self.__lock:
+            self.__conn.execute('DELETE FROM %s WHERE %s' % (table, where), ids)
+            self.__conn.commit()
+
+    def list_keys(self, prefix=''):
+        with self.__lock:
+            keys = [row[0] + '/user.json' for row in self.__conn.execute('SELECT user_id FROM users')]
+            keys += [row[0] + '/' + row[1] + '/task.json' for row in self.__conn.execute('SELECT user_id, task_id FROM tasks')]
+            keys += [row[0] + '/' + row[1] + '/task_journal.jsonl' for row in
+                     self.__conn.execute('SELECT DISTINCT user_id, task_id FROM task_journal')]
+            keys += ['/'.join(row) for row in self.__conn.execute('SELECT user_id, task_id, name FROM ui_steps')]
+            keys += [row[0] for row in self.__conn.execute('SELECT key FROM files')]
+        return sorted([key for key in keys if key.startswith(prefix)])
+
+    '''
+    ***************
+    *** Queries ***
+    ***************
+    '''
+    def list_tasks(self, user_id=None):
+        """
+        Returns:
+            tasks (list): [(user_id, task_id)] of the user, or of all users if None, most recently updated first
+        """
+        with self.__lock:
+            if user_id is None:
+                return self.__conn.execute('SELECT user_id, task_id FROM tasks ORDER BY updated_at DESC').fetchall()
+            return self.__conn.execute('SELECT user_id, task_id FROM tasks WHERE user_id = ? ORDER BY updated_at DESC',
+                                       (user_id,)).fetchall()
+
+    def list_ui_steps(self, user_id, task_id):
+        """
+        Returns:
+            ui_steps (list): [(ui_id, name)] of the task, in the order they were saved
+        """
+        with self.__lock:
+            return self.__conn.execute('SELECT ui_id, name FROM ui_steps WHERE user_id = ? AND task_id = ? '
+                                       'ORDER BY updated_at', (user_id, task_id)).fetchall()
@@ -0,0 +1,213 @@
+import json
+
+
+class _TaskJournal:
+    def __init__(self, backend, compaction_ratio=1.0):
+        """
+        Persist tasks as a snapshot 'task.json' plus an append-only journal 'task_journal.jsonl' of per-step deltas,
+        so saving a step writes only what changed in the step rather than the whole task history.
+        Each journal record is {"seq": int, "set": {attr: value}, "append": {attr: [new items]}}
+        Args:
+            backend (_StorageBackend): Storage of the snapshots and journals
+            compaction_ratio (float): Compact the journal into a new snapshot once the journal is this times larger
+                                      than the snapshot, so the snapshot rewrites cost O(1) amortized per journal byte
+        """
+        self.backend = backend
+        self.compaction_ratio = compaction_ratio
+        # {(user_id, task_id): persisted state of the task}, the baseline to compute the next delta against
+        self.__states = {}
+
+    @staticmethod
+    def snapshot_key(user_id, task_id):
+        return user_id + '/' + task_id + '/task.json'
+
+    @staticmethod
+    def journal_key(user_id, task_id):
+        return user_id + '/' + task_id + '/task_journal.jsonl'
+
+    '''
+    ************
+    *** Save ***
+    ************
+    '''
+    def save_task(self, task):
+        """
+        Append the changes of the task since its last save or load to the journal,
+        or write a snapshot if the task has no baseline or the journal is due for compaction
+        Args:
+            task (Task): Task to save
+        """
+        self.write_ops(self.make_save_ops(task))
+
+    def make_save_ops(self, task):
+        """
+        Encode the save of the task into storage operations without writing them, so they can be written later.
+        The baseline moves on as if the operations were written, so they must all be written in order
+        Args:
+            task (Task): Task to save
+        Returns:
+            ops (list): Storage operations [(op, key, bytes)], op is 'append', 'replace' or 'remove'
+        """
+        key = (task.user_id, task.task_id)
+        state = self.__states.get(key)
+        if state is None or state['journal_bytes'] > self.compaction_ratio * state['snapshot_bytes']:
+            return self.make_snapshot_ops(task, state['seq'] if state is not None else 0)
+        delta = self.__compute_delta(task, state)
+        if len(delta['set']) == 0 and len(delta['append']) == 0:
+            return []
+        delta['seq'] = state['seq'] + 1
+        line = (json.dumps(delta) + '\n').encode('utf-8')
+        state['journal_bytes'] += len(line)
+        self.__update_state(state, delta)
+        return [('append', self.journal_key(task.user_id, task.task_id), line)]
+
+    def make_snapshot_ops(self, task, seq):
+        """
+        Replace the snapshot with the whole task and clear the journal.
+        The snapshot records the sequence number it includes, so if the process dies before the journal is cleared,
+        the loader skips the records already in the snapshot
+        Args:
+            task (Task): Task to save
+            seq (int): Sequence number of the last journal record included in the task
+        Returns:
+            ops (list): Storage operations [(op, key, bytes)]
+        """
+        snapshot = task.to_dict()
+        snapshot['journal_seq'] = seq
+        data = json.dumps(snapshot, indent=4).encode('utf-8')
+        self.__states[(task.user_id, task.task_id)] = self.__make_state(task, seq, len(data), 0)
+        return [('replace', self.snapshot_key(task.user_id, task.task_id), data),
+                ('remove', self.journal_key(task.user_id, task.task_id), None)]
+
+    def write_ops(self, ops):
+        """
+        Write the storage operations in order.
+        The backend appends each record in one write, so a crash can only leave a torn last line that the loader
+        skips, and replaces atomically, so a crash leaves either the old or the new data
+        Args:
+            ops (list): Storage operations [(op, key, bytes)]
+        """
+        for op, key, data in ops:
+            if op == 'append':
+                self.backend.append(key, data)
+            elif op == 'replace':
+                self.backend.write(key, data)
+            elif op == 'remove':
+                self.backend.delete(key)
+
+    def forget(self, user_id, task_id):
+        """
+        Drop the baseline of the task, so its next save writes a snapshot
+        """
+        self.__states.pop((user_id, task_id), None)
+
+    '''
+    ************
+    *** Load ***
+    ************
+    '''
+    def load_task(self, task):
+        """
+        Rebuild the task from the snapshot and the journal records after it
+        Args:
+            task (Task): Empty task with user_id and task_id to load the attributes into
+        Returns:
+            task (Task): Loaded task, None if neither the snapshot nor the journal exists
+        """
+        snapshot = self.backend.read(self.snapshot_key(task.user_id, task.task_id))
+        journal = self.backend.read(self.journal_key(task.user_id, task.task_id))
+        if snapshot is None and journal is None:
+            return None
+        seq, journal_bytes = 0, 0
+        if snapshot is not None:
+            snapshot_dict = json.loads(snapshot)
+            seq = snapshot_dict.pop('journal_seq', 0)
+            task.load_from_dict(snapshot_dict)
+        if journal is not None:
+            for line in journal.splitlines(keepends=True):
+                try:
+                    if not line.endswith(b'\n'):
+                        raise json.JSONDecodeError('Incomplete record', line.decode('utf-8', 'replace'), len(line))
+                    record = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    # torn write of the last record, cut it off so the following records are appended cleanly
+                    self.backend.write(self.journal_key(task.user_id, task.task_id), journal[:journal_bytes])
+                    break
+                journal_bytes += len(line)
+                if record['seq'] <= seq:
+                    continue
+                self.apply_delta(task, record)
+                seq = record['seq']
+        snapshot_bytes = len(snapshot) if snapshot is not None else 0
+        self.__states[(task.user_id, task.task_id)] = self.__make_state(task, seq, snapshot_bytes, journal_bytes)
+        return task
+
+    @staticmethod
+    def apply_delta(task, delta):
+        """
+        Apply a journal record to the task
+        """
+        for attr, value in delta['set'].items():
+            if hasattr(task, attr):
+                setattr(task, attr, value)
+        for attr, items in delta['append'].items():
+            if hasattr(task, attr):
+                getattr(task, attr).extend(items)
+
+    '''
+    *************
+    *** Delta ***
+    *************
+    '''
+    @staticmethod
+    def __make_state(task, seq, snapshot_bytes, journal_bytes):
+        """
+        Baseline of the persisted task: shallow copies of the lists and the serialized other attributes
+        """
+        state = {'seq': seq, 'snapshot_bytes': snapshot_bytes, 'journal_bytes': journal_bytes,
+                 'lists': {}, 'last_items': {}, 'values': {}}
+        for attr, value in task.to_dict().items():
+            if type(value) is list:
+                _TaskJournal.__set_list_state(state, attr, list(value))
+            else:
+                state['values'][attr] = json.dumps(value, sort_keys=True)
+        return state
+
+    @staticmethod
+    def __set_list_state(state, attr, items):
+        state['lists'][attr] = items
+        state['last_items'][attr] = json.dumps(items[-1], sort_keys=True) if len(items) > 0 else None
+
+    @staticmethod
+    def __compute_delta(task, state):
+        """
+        Compare the task with its baseline. Lists that only grew get their new items appended,
+        anything else that changed is set as a whole.
+        Items of a list are compared by identity except for the last persisted one, which is compared by value
+        as it is often updated right after being appended
+        """
+        delta = {'set': {}, 'append': {}}
+        for attr, value in task.to_dict().items():
+            if type(value) is list and attr in state['lists']:
+                old = state['lists'][attr]
+                grown = len(value) >= len(old) and all([a is b for a, b in zip(value, old)])
+                if grown and len(old) > 0:
+                    grown = json.dumps(value[len(old) - 1], sort_keys=True) == state['last_items'].get(attr)
+                if not grown:
+                    delta['set'][attr] = value
+                elif len(value) > len(old):
+                    delta['append'][attr] = value[len(old):]
+            elif type(value) is list or json.dumps(value, sort_keys=True) != state['values'].get(attr):
+                delta['set'][attr] = value
+        return delta
+
+    @staticmethod
+    def __update_state(state, delta):
+        state['seq'] = delta['seq']
+        for attr, value in delta['set'].items():
+            if type(value) is list:
+                _TaskJournal.__set_list_state(state, attr, list(value))
+            else:
+                state['values'][attr] = json.dumps(value, sort_keys=True)
+        for attr, items in delta['append'].items():
+            _TaskJournal.__set_list_state(state, attr, state['lists'][attr] + items)
@@ -1,2 +1,6 @@
 from uta.SystemConnection._Local import _Local
+from uta.SystemConnection._StorageBackend import _StorageBackend, _FileStorageBackend, _SQLiteStorageBackend, _ObjectStorageBackend
+from uta.SystemConnection._TaskJournal import _TaskJournal
+from uta.SystemConnection._SessionStore import _SessionStore
+from uta.SystemConnection._ArtifactWriter import _ArtifactWriter
 from uta.SystemConnection.SystemConnector import SystemConnector
@@ -1,4 +1,5 @@
 from uta.TaskAction._TaskUIChecker import _TaskUIChecker
+from uta.UIProcessing._UIUtil import _UIUtil
 
 
 class TaskActionChecker:
@@ -42,6 +43,7 @@ class TaskActionChecker:
         # Check ui task relation
         relation = self.__task_ui_checker.check_ui_relation(ui_data, task, printlog)
         task.relations.append(relation)
+        task.relation_screens.append(task.cur_activity if task.cur_activity else ui_data.ui_id)
         return self.wrap_action(action=relation, task=task, ui_data=ui_data)
 
     def action_on_ui_vision(self, ui_data, task, printlog=False):
@@ -58,8 +60,46 @@ class TaskActionChecker:
         # Check ui task relation
         relation = self.__task_ui_checker.check_ui_relation_gpt4v(ui_data, task, printlog)
         task.relations.append(relation)
+        task.relation_screens.append(task.cur_activity if task.cur_activity else ui_data.ui_id)
         return self.wrap_action(action=relation, task=task, ui_data=ui_data)
 
+    @staticmethod
+    def recover_no_op_action(ui_data, task, prev_action):
+        """
+        Retry an action that did not change the screen without checking the UI with the FM.
+        A click on an element is retried on its nearest clickable ancestor, as the elements inherit the clickability
+        of their ancestors in preprocessing and the one actually handling the click may be the ancestor
+        Args:
+            ui_data (UIData): The current UI, unchanged from the UI that the prev_action was performed on
+            task (Task): Task object
+            prev_action (dict): The last performed action, which had no visible effect
+        Returns:
+            Action (dict): The retried action, None if there is no cheap retry and the FM needs to check the UI
+        """
+        if prev_action.get('Recovery') or 'click' not in str(prev_action.get('Action')).lower():
+            return None
+        try:
+            ele_id = int(prev_action['Element Id'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        # the ids are the same in the unchanged UI
+        if not 0 <= ele_id < len(ui_data.elements):
+            return None
+        ancestor = _UIUtil.get_nearest_clickable_ancestor(ui_data, ele_id, include_self=False)
+        # clicking the root or at the same point is not worth retrying
+        if ancestor is None or ancestor['id'] == 0:
+            return None
+        bounds, ele_bounds = ancestor['bounds'], ui_data.elements[ele_id]['bounds']
+        centroid = ((bounds[2] + bounds[0]) // 2, (bounds[3] + bounds[1]) // 2)
+        if centroid == ((ele_bounds[2] + ele_bounds[0]) // 2, (ele_bounds[3] + ele_bounds[1]) // 2):
+            return None
+        action = {**prev_action, 'Element Id': str(ancestor['id']), 'Coordinate': centroid, 'ElementBounds': bounds,
+                  'Reason': 'Clicking element %d did not change the screen, click its clickable ancestor' % ele_id,
+                  'Recovery': True}
+        task.relations.append(action)
+        task.relation_screens.append(task.cur_activity if task.cur_activity else ui_data.ui_id)
+        return action
+
     @staticmethod
     def wrap_action(action, task, ui_data):
         """
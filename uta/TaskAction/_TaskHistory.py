@@ -0,0 +1,113 @@
+import json
+
+
+class _TaskHistory:
+    def __init__(self, model_manager, window_size=5, token_ceiling=800):
+        """
+        Compact the action history of a task for the fm prompt, so the prompt does not grow with the step count.
+        The recent steps are kept verbatim, and the older steps are summarized into a digest of the visited screens,
+        tried elements and taken actions
+        Args:
+            model_manager (ModelManager): To count the tokens of the history
+            window_size (int): Number of recent steps to keep verbatim
+            token_ceiling (int): Maximum tokens of the history in the prompt
+        """
+        self.__model_manager = model_manager
+        self.window_size = window_size
+        self.token_ceiling = token_ceiling
+
+    @staticmethod
+    def align_screens(relations, screens):
+        """
+        Pair each relation with its screen. Tasks recorded before the screens were have fewer screens than relations,
+        the missing screens are of the oldest steps and padded with None
+        Args:
+            relations (list of dict): Relation and action of each step
+            screens (list): Screen of each recorded step
+        Returns:
+            screens (list): Screen of each step, as long as the relations
+        """
+        if len(relations) == 0:
+            return []
+        return [None] * (len(relations) - len(screens)) + list(screens[-len(relations):])
+
+    @staticmethod
+    def digest_steps(relations, screens):
+        """
+        Summarize the steps into a structured digest.
+        Element ids are only meaningful on their screen, so the tried ids are grouped by the screen they were tried on
+        Args:
+            relations (list of dict): Relation and action of each step [{"Relation":, "Element Id":, "Action":}]
+            screens (list): Screen of each step, can be shorter than relations for tasks recorded without screens
+        Returns:
+            digest (dict): {"Steps": int, "Visited screens": [], "Tried element IDs by screen": {screen: [ids]},
+                            "Actions": {action: count}}, the screens from the least to the most recently tried
+        """
+        visited_screens = []
+        tried_element_ids = {}
+        actions = {}
+        for relation, screen in zip(relations, _TaskHistory.align_screens(relations, screens)):
+            if screen is not None and screen not in visited_screens:
+                visited_screens.append(screen)
+            element_id = relation.get('Element Id')
+            if element_id is not None and 'none' not in str(element_id).lower():
+                screen = str(screen) if screen is not None else 'Unknown screen'
+                # move the screen to the end as the most recently tried
+                element_ids = tried_element_ids.pop(screen, [])
+                if str(element_id) not in element_ids:
+                    element_ids.append(str(element_id))
+                tried_element_ids[screen] = element_ids
+            action = relation.get('Action', relation.get('Relation'))
+            if action is not None:
+                actions[str(action)] = actions.get(str(action), 0) + 1
+        return {'Steps': len(relations), 'Visited screens': visited_screens,
+                'Tried element IDs by screen': tried_element_ids, 'Actions': actions}
+
+    def wrap_history(self, task):
+        """
+        Wrap up the action history of the task within the token ceiling.
+        The window of verbatim steps shrinks until the history fits, and if the digest alone is still over the
+        ceiling, its lists keep only the most recent entries
+        Args:
+            task (Task)
+        Return:
+            prompt (str): The wrapped history, empty if the task has no history
+        """
+        relations = task.relations
+        if len(relations) == 0:
+            return ''
+        screens = self.align_screens(relations, task.relation_screens)
+        for window in range(min(self.window_size, len(relations)), -1, -1):
+            prompt = self.__format_history(relations, screens, window)
+            if self.__model_manager.count_token_size(prompt) <= self.token_ceiling:
+                return prompt
+
+        # keep halving the lists of the digest of all steps
+        digest = self.digest_steps(relations, screens)
+        while True:
+            prompt = '!!!Action history for this task - MUST NOT REPEAT PREVIOUS ACTIONS:\n' \
+                     ' Digest of the steps: ' + json.dumps(digest, ensure_ascii=False) + '.\n'
+            longest = max(len(digest['Visited screens']), len(digest['Tried element IDs by screen']))
+            if longest <= 1 or self.__model_manager.count_token_size(prompt) <= self.token_ceiling:
+                return prompt
+            digest['Visited screens'] = digest['Visited screens'][-(longest // 2):]
+            tried_screens = list(digest['Tried element IDs by screen'].items())
+            digest['Tried element IDs by screen'] = dict(tried_screens[-(longest // 2):])
+
+    def __format_history(self, relations, screens, window):
+        """
+        Format the digest of the steps before the window and the verbatim steps in the window with their screens
+        Args:
+            relations (list of dict): Relation and action of each step
+            screens (list): Screen of each step, aligned with the relations
+            window (int): Number of recent steps to keep verbatim
+        """
+        n_old = len(relations) - window
+        prompt = '!!!Action history for this task - MUST NOT REPEAT PREVIOUS ACTIONS:\n'
+        if n_old > 0:
+            digest = self.digest_steps(relations[:n_old], screens[:n_old])
+            prompt += ' Digest of steps 1-' + str(n_old) + ': ' + json.dumps(digest, ensure_ascii=False) + '\n'
+        for i in range(n_old, len(relations)):
+            screen = ' on ' + str(screens[i]) if screens[i] is not None else ''
+            prompt += ' Step ' + str(i + 1) + screen + ': ' + str(relations[i]) + '\n'
+        return prompt
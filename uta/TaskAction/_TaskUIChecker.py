@@ -1,4 +1,6 @@
 from uta.config import *
+from uta.UIProcessing._UITreeSerializer import _UITreeSerializer
+from uta.TaskAction._TaskHistory import _TaskHistory
 import json
 import re
 
@@ -6,6 +8,8 @@ import re
 class _TaskUIChecker:
     def __init__(self, model_manager):
         self.__model_manager = model_manager
+        self.__tree_serializer = _UITreeSerializer(model_manager)
+        self.__task_history = _TaskHistory(model_manager)
 
         # Initialize the base prompt template
         self.__relation_prompt = 'What is the relation between this UI and the task "{task}" and why?\n' \
@@ -110,19 +114,15 @@ class _TaskUIChecker:
         #     prompt += '(Potential subtasks and steps to complete the task: ' + str(task.subtasks) + '.)\n'
         return prompt
 
-    @staticmethod
-    def wrap_task_history(task):
+    def wrap_task_history(self, task):
         """
-        Wrap up task info to put in the fm prompt
+        Wrap up task history to put in the fm prompt, with the older steps summarized to bound the prompt size
         Args:
             task (Task)
         Return:
             prompt (str): The wrapped prompt
         """
-        prompt = ''
-        if len(task.relations) > 0:
-            prompt += '!!!Action history for this task - MUST NOT REPEAT PREVIOUS ACTIONS:\n ' + str(task.relations) + '.\n'
-        return prompt
+        return self.__task_history.wrap_history(task)
 
     @staticmethod
     def transfer_to_dict(resp):
@@ -151,12 +151,13 @@ class _TaskUIChecker:
         """
         try:
             if len(task.conversation_automation) == 0:
+                element_tree = self.__tree_serializer.serialize_element_tree(ui_data)
                 task.conversation_automation = [{'role': 'system', 'content': SYSTEM_PROMPT},
                                                 {'role': 'user', 'content': f'This is a view hierarchy of a UI:\n'
-                                                                            f'{str(ui_data.element_tree)}\n\n{prompt}'}]
+                                                                            f'{element_tree}\n\n{prompt}'}]
                 task.full_automation_conversation += [{'role': 'system', 'content': SYSTEM_PROMPT},
                                                       {'role': 'user', 'content': f'This is a view hierarchy of a UI:\n'
-                                                      f'{str(ui_data.element_tree)}\n\n{prompt}'}]
+                                                      f'{element_tree}\n\n{prompt}'}]
             else:
                 task.conversation_automation.append({'role': 'user', 'content': prompt})
                 task.full_automation_conversation.append({'role': 'user', 'content': prompt})
@@ -175,7 +176,11 @@ class _TaskUIChecker:
         try:
             task.conversation_automation.append({'role': 'user', 'content': prompt})
             task.full_automation_conversation.append({'role': 'user', 'content': prompt})
-            resp = self.__model_manager.send_gpt4_vision_img_paths(prompt=prompt, img_paths=[ui_data.annotated_elements_screenshot_path], printlog=printlog)
+            # use the annotated screenshot encoded in memory when saving, as its file may still be being written
+            if ui_data.annotated_elements_screenshot_encoded is not None:
+                resp = self.__model_manager.send_gpt4_vision_imgs(prompt=prompt, imgs=[ui_data.annotated_elements_screenshot_encoded], printlog=printlog)
+            else:
+                resp = self.__model_manager.send_gpt4_vision_img_paths(prompt=prompt, img_paths=[ui_data.annotated_elements_screenshot_path], printlog=printlog)
             resp = {'role': 'assistant', 'content': resp[1]}
             task.conversation_automation.append(resp)
             task.full_automation_conversation.append(resp)
@@ -1,2 +1,3 @@
 from uta.TaskAction.TaskActionChecker import TaskActionChecker
 from uta.TaskAction._TaskUIChecker import _TaskUIChecker
+from uta.TaskAction._TaskHistory import _TaskHistory
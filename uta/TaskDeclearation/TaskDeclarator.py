@@ -2,6 +2,7 @@ import json
 import re
 
 from uta.config import *
+from uta.TaskDeclearation._DeclarationPipeline import _DeclarationPipeline
 
 
 class TaskDeclarator:
@@ -127,20 +128,33 @@ class TaskDeclarator:
         Returns:
             LLM answer (dict): {"Clear": "True", "Question": "None", "Options":[]}
         """
+        return self.__model_manager.run_sync(self.clarify_task_async(task, app_list, printlog))
+
+    async def clarify_task_async(self, task, app_list, printlog=False):
+        """
+        Awaitable version of clarify_task
+        Args:
+            task (Task): Task object
+            app_list: list of user installed apps
+            printlog (bool): True to print the intermediate log
+        Returns:
+            LLM answer (dict): {"Clear": "True", "Question": "None", "Options":[]}
+        """
         try:
             # set base prompt for new conv
             if len(task.conversation_clarification) == 0:
-                task.conversation_clarification = [{'role': 'system', 'content': SYSTEM_PROMPT},
-                                                   {"role": "user", "content": self.__base_prompt_clarify.format(task=task.task_description)}]
+                conversation = [{'role': 'system', 'content': SYSTEM_PROMPT},
+                                {"role": "user", "content": self.__base_prompt_clarify.format(task=task.task_description)}]
             elif task.clarification_user_msg:
-                task.conversation_clarification.append({'role': 'user', 'content': f"Response to the Question: {task.clarification_user_msg}.\n"
-                                                                                   + self.__succeed_prompt_clarify})
-                task.user_clarify.append(task.clarification_user_msg)
+                conversation = task.conversation_clarification + [
+                    {'role': 'user', 'content': f"Response to the Question: {task.clarification_user_msg}.\n" + self.__succeed_prompt_clarify}]
             else:
                 raise ValueError("not initial clarification but not clarification_user_msg is stored.")
-            # send conv to fm
-            resp = self.__model_manager.send_fm_conversation(conversation=task.conversation_clarification, printlog=printlog)
-            task.conversation_clarification.append(resp)
+            # send conv to fm, and only keep the prompt in the task once answered, in case the check is cancelled
+            resp = await self.__model_manager.send_fm_conversation_async(conversation=conversation, printlog=printlog)
+            if len(task.conversation_clarification) > 0:
+                task.user_clarify.append(task.clarification_user_msg)
+            task.conversation_clarification = conversation + [resp]
             task.res_clarification = self.transfer_to_dict(resp)
             task.res_clarification['Proc'] = 'Clarify'
             print(task.res_clarification)
@@ -158,13 +172,24 @@ class TaskDeclarator:
         Returns:
             LLM answer (dict): {"Clear": "True", "Question": "None", "Options":[]}
         """
+        return self.__model_manager.run_sync(self.justify_user_message_async(task, printlog))
+
+    async def justify_user_message_async(self, task, printlog=False):
+        """
+        Awaitable version of justify_user_message
+        Args:
+            task (Task): Task object
+            printlog (bool): True to print the intermediate log
+        Returns:
+            LLM answer (dict): {"Clear": "True", "Question": "None", "Options":[]}
+        """
         try:
             if task.clarification_user_msg:
-                task.conversation_clarification.append(
-                    {'role': 'user', 'content': f"Response to the Question: {self.__user_input_justify.format(user_msg=task.clarification_user_msg)}.\n"})
-                # send conv to fm
-                resp = self.__model_manager.send_fm_conversation(conversation=task.conversation_clarification, printlog=printlog)
-                task.conversation_clarification.append(resp)
+                conversation = task.conversation_clarification + [
+                    {'role': 'user', 'content': f"Response to the Question: {self.__user_input_justify.format(user_msg=task.clarification_user_msg)}.\n"}]
+                # send conv to fm, and only keep the prompt in the task once answered, in case the check is cancelled
+                resp = await self.__model_manager.send_fm_conversation_async(conversation=conversation, printlog=printlog)
+                task.conversation_clarification = conversation + [resp]
                 task.res_justification = self.transfer_to_dict(resp)
                 task.res_justification['Proc'] = 'Justify'
                 print(task.res_justification)
@@ -184,12 +209,23 @@ class TaskDeclarator:
         Returns:
             LLM answer (dict): {"Decompose": "True", "Sub-tasks":[], "Explanation": }
         """
+        return self.__model_manager.run_sync(self.decompose_task_async(task, printlog))
+
+    async def decompose_task_async(self, task, printlog=False):
+        """
+        Awaitable version of decompose_task
+        Args:
+            task (Task): Task object
+            printlog (bool): True to print the intermediate log
+        Returns:
+            LLM answer (dict): {"Decompose": "True", "Sub-tasks":[], "Explanation": }
+        """
         try:
             prompt = self.wrap_task_info(task)
             prompt += self.__base_prompt_decompose.format(task=task.task_description)
             conversation = [{"role": "system", "content": SYSTEM_PROMPT},
                             {"role": "user", "content": prompt}]
-            resp = self.__model_manager.send_fm_conversation(conversation=conversation, printlog=printlog)
+            resp = await self.__model_manager.send_fm_conversation_async(conversation=conversation, printlog=printlog)
             task.res_decomposition = self.transfer_to_dict(resp)
             task.subtasks = task.res_decomposition['Sub-tasks']
             task.res_decomposition['Proc'] = 'Decompose'
@@ -208,12 +244,23 @@ class TaskDeclarator:
         Returns:
             LLM answer (dict): {"Task Type": "1. General Inquiry", "Explanation":}
         """
+        return self.__model_manager.run_sync(self.classify_task_async(task, printlog))
+
+    async def classify_task_async(self, task, printlog=False):
+        """
+        Awaitable version of classify_task
+        Args:
+            task (Task): Task object
+            printlog (bool): True to print the intermediate log
+        Returns:
+            LLM answer (dict): {"Task Type": "1. General Inquiry", "Explanation":}
+        """
         try:
             prompt = self.wrap_task_info(task)
             prompt += self.__base_prompt_classify.format(task=task.task_description)
             conversation = [{"role": "system", "content": SYSTEM_PROMPT},
                             {"role": "user", "content": prompt}]
-            resp = self.__model_manager.send_fm_conversation(conversation=conversation, printlog=printlog)
+            resp = await self.__model_manager.send_fm_conversation_async(conversation=conversation, printlog=printlog)
             task.res_classification = self.transfer_to_dict(resp)
             task.res_classification['Proc'] = 'Classify'
             task.task_type = task.res_classification["Task Type"]
@@ -224,6 +271,45 @@ class TaskDeclarator:
             raise e
 
 
+    '''
+    **************************
+    *** Declaration Checks ***
+    **************************
+    '''
+    def declare_task(self, task, task_list, checks=('Justify', 'TaskMatch'), printlog=False):
+        """
+        Run the declaration checks of the task, independent checks run concurrently
+            - Justify: Justify the user message if the user answered a clarification question, cancel the other checks if unrelated
+            - Clarify: Clarify the task, after Justify as they share the clarification conversation
+            - Classify: Classify the task type
+            - TaskMatch: Match the task to the available task list
+        Args:
+            task (Task): Task object
+            task_list (TaskList): Available task list to match the task
+            checks (list): Names of the checks to run
+            printlog (bool): True to print the intermediate log
+        Returns:
+            results (dict): {check name: LLM answer} of the finished checks
+            stopped_by (str): "Justify" if the user message is unrelated, otherwise None
+            task.declaration_latency (dict): {check name: seconds}
+        """
+        pipeline = _DeclarationPipeline()
+        # only justify an answer to a question asked in the clarification conversation
+        if 'Justify' in checks and task.clarification_user_msg and len(task.conversation_clarification) > 0:
+            pipeline.add_stage('Justify', lambda: self.justify_user_message_async(task, printlog),
+                               stop_if=lambda res: 'false' in str(res.get('Related')).lower())
+        if 'Clarify' in checks:
+            pipeline.add_stage('Clarify', lambda: self.clarify_task_async(task, None, printlog), depends_on=['Justify'])
+        if 'Classify' in checks:
+            pipeline.add_stage('Classify', lambda: self.classify_task_async(task, printlog))
+        if 'TaskMatch' in checks:
+            pipeline.add_stage('TaskMatch', lambda: task_list.match_task_to_list_async(task))
+        results, stopped_by = pipeline.run(self.__model_manager.run_sync)
+        task.declaration_latency = pipeline.latency
+        print('Declaration latency:', {name: round(latency, 3) for name, latency in pipeline.latency.items()})
+        return results, stopped_by
+
+
 if __name__ == '__main__':
     from uta.ModelManagement import ModelManager
     model_mg = ModelManager()
@@ -0,0 +1,69 @@
+import time
+import asyncio
+
+
+class _DeclarationPipeline:
+    """
+    Run the declaration checks of a task as a dependency graph
+    A check starts as soon as the checks it depends on finish, so independent checks run concurrently
+    """
+    def __init__(self):
+        self.stages = {}    # {stage name: (check, depends_on, stop_if)}
+        self.latency = {}   # {stage name: seconds} of the finished stages in the last run
+
+    def add_stage(self, name, check, depends_on=(), stop_if=None):
+        """
+        Args:
+            name (str): Stage name
+            check (function): Coroutine function check() -> result (dict)
+            depends_on (list): Names of the stages to finish before this stage, stages not added are ignored
+            stop_if (function): stop_if(result) -> True to cancel all the unfinished stages
+        """
+        self.stages[name] = (check, depends_on, stop_if)
+
+    async def run_async(self):
+        """
+        Returns:
+            results (dict): {stage name: result} of the finished stages
+            stopped_by (str): Name of the stage that stopped the pipeline, None if all the stages finished
+        """
+        self.latency = {}
+        results = {}
+        tasks = {}
+        stopped_by = []
+
+        async def run_stage(name):
+            check, depends_on, stop_if = self.stages[name]
+            for dependency in depends_on:
+                if dependency in tasks:
+                    await tasks[dependency]
+            start = time.time()
+            result = await check()
+            self.latency[name] = time.time() - start
+            results[name] = result
+            if stop_if is not None and stop_if(result) and len(stopped_by) == 0:
+                stopped_by.append(name)
+                for task in tasks.values():
+                    if task is not asyncio.current_task() and not task.done():
+                        task.cancel()
+            return result
+
+        for name in self.stages:
+            tasks[name] = asyncio.ensure_future(run_stage(name))
+        # cancelled stages return CancelledError, which is not an Exception
+        for outcome in await asyncio.gather(*tasks.values(), return_exceptions=True):
+            if isinstance(outcome, Exception):
+                raise outcome
+        return results, stopped_by[0] if stopped_by else None
+
+    def run(self, run_sync=asyncio.run):
+        """
+        Run the pipeline from synchronous code
+        Args:
+            run_sync (function): run_sync(coroutine) -> result, runs the coroutine to completion,
+                                 such as ModelManager.run_sync to run on the loop of the fm client
+        Returns:
+            results (dict): {stage name: result} of the finished stages
+            stopped_by (str): Name of the stage that stopped the pipeline, None if all the stages finished
+        """
+        return run_sync(self.run_async())
@@ -1 +1,2 @@
 from uta.TaskDeclearation.TaskDeclarator import TaskDeclarator
+from uta.TaskDeclearation._DeclarationPipeline import _DeclarationPipeline
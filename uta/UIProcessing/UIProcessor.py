@@ -3,6 +3,9 @@ from uta.UIProcessing._UIPreProcessor import _UIPreProcessor
 from uta.UIProcessing._UIAnalyser import _UIAnalyser
 from uta.UIProcessing._UIChecker import _UIChecker
 from uta.UIProcessing._UIUtil import _UIUtil
+from uta.UIProcessing._UIDiffer import _UIDiffer
+from uta.UIProcessing._UISimilarity import _UISimilarity
+from uta.UIProcessing._UIChangeDetector import _UIChangeDetector
 
 
 class UIProcessor:
@@ -13,13 +16,16 @@ class UIProcessor:
         self.__ui_analyser = _UIAnalyser(self.__model_manager)
         self.__ui_checker = _UIChecker(self.__model_manager)
         self.__ui_util = _UIUtil()
+        self.__ui_differ = _UIDiffer()
+        self.__ui_similarity = _UISimilarity()
+        self.__ui_change_detector = _UIChangeDetector()
 
     '''
     ***********************
     *** Process UI Info ***
     ***********************
     '''
-    def process_ui(self, ui_data, show=False, ocr=True, cls=False):
+    def process_ui(self, ui_data, show=False, ocr=True, cls=False, prev_ui_data=None, region_ocr=False):
         """
         Process a UI, including
             1. Pre-process UI
@@ -29,11 +35,13 @@ class UIProcessor:
             show (bool): True to show processing result on window
             ocr (bool): True to turn on ocr for the whole UI image
             cls (bool): True to turn on UI element classification
+            prev_ui_data (UIData): UI of the previous step, if given, only analyze the changed elements
+            region_ocr (bool): True to only ocr the regions of the elements without text
         Returns:
             ui_data (UIData): UI data after processing
         """
         self.preprocess_ui(ui_data)
-        self.analyze_ui(ui_data, ocr=ocr, cls=cls)
+        self.analyze_ui(ui_data, ocr=ocr, cls=cls, prev_ui_data=prev_ui_data, region_ocr=region_ocr)
         if show:
             ui_data.show_all_elements()
         return ui_data
@@ -44,20 +52,23 @@ class UIProcessor:
             1. Convert vh to tidy and formatted json
             2. Extract basic UI info (elements) and store as dicts
             3. Build element tree
+            4. Fingerprint the UI structure
         Args:
             ui_data (UIData): ui data for processing
         Returns:
             ui_data.ui_vh_json (dict): VH in a tidy json format
             ui_data.elements; ui_data.elements_leaves (list of dicts)
             ui_data.element_tree (dict): Simplified element tree
+            ui_data.fingerprint (_UIFingerprint): Structural fingerprint of the UI
         """
         print('* Pre-process XML VH to clean-up as JSON and extract UI elements *')
         self.__ui_preprocessor.ui_vh_xml_cvt_to_json(ui_data=ui_data)
         self.__ui_preprocessor.ui_info_extraction(ui_data=ui_data)
         self.__ui_analyser.ui_build_element_tree(ui_data)
+        self.__ui_similarity.fingerprint(ui_data)
         return ui_data
 
-    def analyze_ui(self, ui_data, ocr=True, cls=False):
+    def analyze_ui(self, ui_data, ocr=True, cls=False, prev_ui_data=None, region_ocr=False):
         """
         Analyze ui to generate description for elements and hierarchical element tree
             1. Analyze UI element to attach description
@@ -66,12 +77,21 @@ class UIProcessor:
             ui_data (UIData): Target UI data for analysis
             ocr (bool): True to turn on ocr for the whole UI image
             cls (bool): True to turn on UI element classification
+            prev_ui_data (UIData): Analyzed UI of the previous step, if given, reuse the analysis of unchanged elements
+            region_ocr (bool): True to only ocr the regions of the elements without text
         Returns:
             ui_data.element['description']: 'description' attribute in element
             ui_data.element_tree (dict): structural element tree
         """
         print('* Analyze UI to generate an element tree with element descriptions *')
-        self.__ui_analyser.ui_analysis_elements_description(ui_data=ui_data, ocr=ocr, cls=cls)
+        elements = None
+        if prev_ui_data is not None:
+            # incremental mode: only analyze the leaves that changed since the previous UI
+            elements = self.__ui_differ.reuse_unchanged_elements(ui_data, prev_ui_data, ocr=ocr, cls=cls)
+            ocr = ocr and any(ele['text'] == '' for ele in elements)
+            cls = cls and len(elements) > 0
+        self.__ui_analyser.ui_analysis_elements_description(ui_data=ui_data, ocr=ocr, cls=cls, elements=elements,
+                                                            region_ocr=region_ocr)
         self.__ui_analyser.ui_build_element_tree(ui_data)
         return ui_data
 
@@ -97,7 +117,7 @@ class UIProcessor:
     *** UI Utils ***
     ****************
     '''
-    def annotate_elements_with_id(self, ui_data, only_leaves=True, show=False, draw_bound=False):
+    def annotate_elements_with_id(self, ui_data, only_leaves=True, show=False, draw_bound=False, prev_ui_data=None):
         """
         Annotate elements on the ui screenshot using IDs
         Args:
@@ -105,9 +125,23 @@ class UIProcessor:
             only_leaves (bool): True to just show element_leaves
             show (bool): True to show the result
             draw_bound (bool): True to draw bounding box of elements
+            prev_ui_data (UIData): Annotated UI of the previous step, if given, only re-annotate the changed regions
         Returns:
             annotated_img (cv2 image): Annotated UI screenshot
         """
         print('* Annotate elements with their IDs on the screenshot image *')
-        return self.__ui_util.annotate_elements_with_id(ui_data=ui_data, only_leaves=only_leaves, show=show, draw_bound=draw_bound)
+        return self.__ui_util.annotate_elements_with_id(ui_data=ui_data, only_leaves=only_leaves, show=show,
+                                                        draw_bound=draw_bound, prev_ui_data=prev_ui_data)
 
+    def detect_ui_change(self, ui_data, prev_ui_data):
+        """
+        Detect how the screen changed from the previous UI, through the downsampled screenshots and the vh fingerprints
+        Args:
+            ui_data (UIData): The current UI after preprocessing
+            prev_ui_data (UIData): The previous UI after preprocessing
+        Returns:
+            change (str): 'unchanged', 'minor change' or 'new screen'
+        """
+        change, details = self.__ui_change_detector.detect_change(ui_data, prev_ui_data)
+        print('* Screen change: %s %s *' % (change, details))
+        return change
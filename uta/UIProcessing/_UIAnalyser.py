@@ -1,26 +1,39 @@
 import time
 import copy
 
+from uta.UIProcessing._UISpatialIndex import _UISpatialIndex
+
 
 class _UIAnalyser:
     """
     Analyze UI raw data for element description and element tree
     """
+    # attributes kept in the element tree nodes of the containers and the leaves
+    __container_attrs = frozenset(['scrollable', 'id', 'resource-id', 'class', 'clickable', 'description'])
+    __leaf_attrs = frozenset(['id', 'resource-id', 'class', 'clickable', 'children', 'description'])
+    __resource_id_replacements = (('com', ''), ('android', ''), ('..', '.'), ('.:', ':'))
+    __class_replacements = (('android', ''), ('..', '.'), ('.:', ':'))
+    __max_simplified = 65536
+
     def __init__(self, model_manager=None):
         self.__model_manager = model_manager
+        self.__simplified_classes = {}          # {class: simplified class}
+        self.__simplified_resource_ids = {}     # {resource-id: simplified resource-id}
 
     '''
     *******************
     *** UI Analysis ***
     *******************
     '''
-    def ui_analysis_elements_description(self, ui_data, ocr=True, cls=False):
+    def ui_analysis_elements_description(self, ui_data, ocr=True, cls=False, elements=None, region_ocr=False):
         """
         Extract description for UI elements through 'text', 'content-desc', 'classification' and 'caption'
         Args:
             ui_data (UIData): Target UI data for analysis
             ocr (bool): True to turn on ocr for the whole UI image
             cls (bool): True to turn on UI element classification
+            elements (list): Leaf elements to analyze, None to analyze all the leaves
+            region_ocr (bool): True to only ocr the regions of the elements without text rather than the whole UI image
         Returns:
             ui_data.element['description']: 'description' attribute in element
         """
@@ -50,59 +63,86 @@ class _UIAnalyser:
             ele['description'] = description
 
         # print('* Analyse descriptions for elements *')
+        if elements is None:
+            elements = ui_data.elements_leaves
         # use ocr to detect text
         if ocr:
             s1 = time.time()
-            self.ocr_detect_ui_text(ui_data)
+            if region_ocr:
+                self.ocr_detect_elements_text(ui_data, elements)
+            else:
+                self.ocr_detect_ui_text(ui_data, elements)
             print('OCR Time: %.3fs' % (time.time() - s1))
         # classify non-text elements
         if cls:
             s2 = time.time()
-            self.classify_elements(ui_data)
+            self.classify_elements(ui_data, elements)
             print('CLs Time: %.3fs' % (time.time() - s2))
         # extract element description from 'text', 'content-desc', 'icon-cls' and 'caption'
-        for element in ui_data.elements_leaves:
+        for element in elements:
             extract_element_description(element)
 
-    def ocr_detect_ui_text(self, ui_data):
+    def ocr_detect_ui_text(self, ui_data, elements=None):
         """
         Detect text on UI through OCR
         Args:
             ui_data (UIData): Target UI data for analysis
+            elements (list): Leaf elements to attach ocr text, None for all the leaves
         Returns:
             ui_data.ocr_text: UI ocr detection result, list of __texts {}
             ui_data.elements_leaves['text']: store text content for each element
         """
         def match_text_and_element(ele):
             """
-            Match ocr text and element through iou
+            Match ocr text and element through their intersected area
             """
-            for text in ui_data.ocr_text:
-                t_b, e_b = text['bounds'], ele['bounds']
-                # calculate intersected area between text and element
-                intersected = max(0, min(t_b[2], e_b[2]) - max(t_b[0], e_b[0])) \
-                              * max(0, min(t_b[3], e_b[3]) - max(t_b[1], e_b[1]))
-                if intersected > 0:
-                    ele['ocr'] += text['content']
-                    ele['text'] += text['content']
+            for text_id in text_index.query_intersect(ele['bounds']):
+                ele['ocr'] += ui_data.ocr_text[text_id]['content']
+                ele['text'] += ui_data.ocr_text[text_id]['content']
 
         # google ocr detection for the GUI image
-        ui_data.ocr_text = self.__model_manager.detect_text_ocr(img_path=ui_data.screenshot_file)
+        # the screenshot shared with the ui data is sent without reading the file again
+        ui_data.ocr_text = self.__model_manager.detect_text_ocr(img_path=ui_data.screenshot_file, img_bytes=ui_data.screenshot.encoded,
+                                                                img=ui_data.screenshot.decoded)
+        text_index = _UISpatialIndex([text['bounds'] for text in ui_data.ocr_text])
         # merge text to elements according to position
-        for element in ui_data.elements_leaves:
+        for element in ui_data.elements_leaves if elements is None else elements:
             if element['text'] == '':
                 element['ocr'] = ''
                 match_text_and_element(element)
 
-    def classify_elements(self, ui_data):
+    def ocr_detect_elements_text(self, ui_data, elements=None):
+        """
+        Detect text through OCR only in the regions of the elements without text
+        Args:
+            ui_data (UIData): Target UI data for analysis
+            elements (list): Leaf elements to attach ocr text, None for all the leaves
+        Returns:
+            ui_data.ocr_text: ocr detection result in the element regions, list of __texts {}
+            ui_data.elements_leaves['text']: store text content for each element
+        """
+        targets = [ele for ele in (ui_data.elements_leaves if elements is None else elements) if ele['text'] == '']
+        region_texts = self.__model_manager.detect_text_ocr_regions(img=ui_data.ui_screenshot, img_path=ui_data.screenshot_file,
+                                                                    regions=[ele['bounds'] for ele in targets],
+                                                                    img_bytes=ui_data.screenshot.encoded, org_img=ui_data.screenshot.decoded)
+        ui_data.ocr_text = []
+        for ele, texts in zip(targets, region_texts):
+            ele['ocr'] = ''.join([text['content'] for text in texts])
+            ele['text'] += ele['ocr']
+            for text in texts:
+                ui_data.ocr_text.append(dict(text, id=len(ui_data.ocr_text)))
+
+    def classify_elements(self, ui_data, elements=None):
         """
         Classify element using the icon classification model
         Args:
             ui_data (UIData): Target UI data for analysis
+            elements (list): Leaf elements to classify, None for all the leaves
         Returns:
             ui_data.elements_leaves['icon-cls']: class of icon if any, otherwise None
         """
-        elements = ui_data.elements_leaves
+        if elements is None:
+            elements = ui_data.elements_leaves
         clips = []
         for ele in elements:
             bound = ele['bounds']
@@ -121,71 +161,76 @@ class _UIAnalyser:
     '''
     def ui_build_element_tree(self, ui_data):
         """
-        Build a hierarchical element tree with a few key attributes to represent the vh
+        Build a hierarchical element tree with a few key attributes to represent the vh.
+        The nodes are built bottom-up from the element store, each as a shallow dict of the whitelisted attributes,
+        so no element is copied and deep trees do not recurse
         Args:
             ui_data (UIData): Target UI data for analysis
         Returns:
             ui_data.element_tree (dict): structural element tree
+            ui_data.element_tree_nodes (list): node of each element in the tree, indexed by id
         """
         # print('* Organize simplified element tree *')
-        ui_data.element_tree = self.__combine_children_to_tree(ui_data=ui_data, start_element=ui_data.elements[0])
+        store = ui_data.get_element_store()
+        offsets = store.children_offsets.tolist()
+        children = store.children.tolist()
+        nodes = [None] * len(ui_data.elements)
+        # children always have larger ids than their parents, so they are built first
+        for ele_id in range(len(ui_data.elements) - 1, -1, -1):
+            start, end = offsets[ele_id], offsets[ele_id + 1]
+            if end > start:
+                node = self.__make_tree_node(ui_data.elements[ele_id], self.__container_attrs)
+                node['children'] = [nodes[c_id] for c_id in children[start: end]]
+            else:
+                node = self.__make_tree_node(ui_data.elements[ele_id], self.__leaf_attrs)
+            nodes[ele_id] = node
+        ui_data.element_tree = nodes[0]
+        ui_data.element_tree_nodes = nodes
         # json.dump(ui_data.element_tree, open(ui_data.output_file_path_element_tree, 'w'), indent=4)
         # print('Save element tree to', self.output_file_path_element_tree)
 
-    def __combine_children_to_tree(self, ui_data, start_element):
+    def __make_tree_node(self, element, selected_attrs):
         """
-        Combine the element's children to a tree recursively
+        Build the tree node of an element with its selected attributes, skipping the empty ones
         Args:
-            ui_data (UIData): The whole UIData for finding elements by ids
-            start_element (UIData.elements[n], dict): The start element to merge children
+            element (UIData.elements[n], dict): Element to build the node for
+            selected_attrs (frozenset): Attributes to keep, 'selected' is also kept if True
         Returns:
-            element (dict): Element with children combined and attributes simplified
-        """
-        element_cp = copy.deepcopy(start_element)
-        if 'children-id' in element_cp:
-            element_cp['children'] = []
-            for c_id in element_cp['children-id']:
-                element_cp['children'].append(self.__combine_children_to_tree(ui_data=ui_data,
-                                                                              start_element=ui_data.elements[c_id]))
-            self.__select_ele_attr(element_cp, ['scrollable', 'id', 'resource-id', 'class', 'clickable',
-                                                'children', 'description'])
-        else:
-            self.__select_ele_attr(element_cp, ['id', 'resource-id', 'class', 'clickable', 'children', 'description'])
-        self.__simplify_ele_attr(element_cp)
-        return element_cp
-
-    @staticmethod
-    def __select_ele_attr(element, selected_attrs):
+            node (dict): Node with the selected attributes simplified, in the order of the element's attributes
         """
-        Select certain attributes in a dict
-        Args:
-            element (dict): Element with attributes
-            selected_attrs (list): List of selected attributes
-        Returns:
-            element (dict): Elements with selected attributes
-        """
-        element_cp = copy.deepcopy(element)
-        for key in element_cp.keys():
-            if key == 'selected' and element[key]:
+        node = {}
+        for key, value in element.items():
+            if key == 'selected' and value:
+                node[key] = value
+            elif key not in selected_attrs or value is None or value == '':
                 continue
-            if key not in selected_attrs or element[key] is None or element[key] == '':
-                del(element[key])
+            elif key == 'class':
+                node[key] = self.__simplify_attr(self.__simplified_classes, value, self.__class_replacements)
+            elif key == 'resource-id':
+                node[key] = self.__simplify_attr(self.__simplified_resource_ids, value, self.__resource_id_replacements)
+            elif type(value) is list:
+                node[key] = copy.deepcopy(value)
+            else:
+                node[key] = value
+        return node
 
     @staticmethod
-    def __simplify_ele_attr(element):
+    def __simplify_attr(simplified, value, replacements):
         """
-        Rename and simplify attributes
+        Rename and simplify an attribute value, memoized as the same classes and resource-ids repeat across the UIs
         Args:
-            element (dict): Element with attributes
+            simplified (dict): {value: simplified value} of the attribute
+            value (str): Attribute value
+            replacements (tuple): (old, new) replacements applied in order
         Returns:
-            element (dict): Elements with simplified attributes
+            value (str): Simplified value
         """
-        if 'resource-id' in element:
-            element['resource-id'] = element['resource-id'].replace('com', '')
-            element['resource-id'] = element['resource-id'].replace('android', '')
-            element['resource-id'] = element['resource-id'].replace('..', '.')
-            element['resource-id'] = element['resource-id'].replace('.:', ':')
-        if 'class' in element:
-            element['class'] = element['class'].replace('android', '')
-            element['class'] = element['class'].replace('..', '.')
-            element['class'] = element['class'].replace('.:', ':')
+        result = simplified.get(value)
+        if result is None:
+            result = value
+            for old, new in replacements:
+                result = result.replace(old, new)
+            if len(simplified) >= _UIAnalyser.__max_simplified:
+                simplified.clear()
+            simplified[value] = result
+        return result
@@ -0,0 +1,76 @@
+import numpy as np
+
+from uta.UIProcessing._UISimilarity import _UISimilarity
+
+
+class _UIChangeDetector:
+    """
+    Detect how the screen changed after an action, by comparing downsampled screenshots and the vh fingerprints,
+    so the actions that had no visible effect can be told without processing and checking the new UI with the FM
+    """
+    UNCHANGED = 'unchanged'
+    MINOR_CHANGE = 'minor change'
+    NEW_SCREEN = 'new screen'
+
+    def __init__(self, thumbnail_size=(36, 76), pixel_threshold=24, unchanged_pixel_ratio=0.01,
+                 minor_pixel_ratio=0.3, minor_similarity=0.8):
+        """
+        Args:
+            thumbnail_size (tuple): (width, height) of the grayscale thumbnails of the screenshots to compare
+            pixel_threshold (int): Gray level difference of a thumbnail pixel to count it as changed
+            unchanged_pixel_ratio (float): Maximum ratio of the changed pixels of an unchanged screen,
+                                           for the blinking cursors and the like
+            minor_pixel_ratio (float): Maximum ratio of the changed pixels of a minor change
+            minor_similarity (float): Minimum structure similarity of the vh of a minor change
+        """
+        self.thumbnail_size = thumbnail_size
+        self.pixel_threshold = pixel_threshold
+        self.unchanged_pixel_ratio = unchanged_pixel_ratio
+        self.minor_pixel_ratio = minor_pixel_ratio
+        self.minor_similarity = minor_similarity
+        self.__ui_similarity = _UISimilarity()
+
+    def get_thumbnail(self, ui_data):
+        """
+        Return the grayscale thumbnail of the screenshot, computed once and cached on the UIData
+        """
+        if ui_data.screenshot_thumbnail is None or ui_data.screenshot_thumbnail.shape[::-1] != self.thumbnail_size:
+            ui_data.screenshot_thumbnail = ui_data.screenshot.thumbnail(self.thumbnail_size)
+        return ui_data.screenshot_thumbnail
+
+    def changed_pixel_ratio(self, ui_data, prev_ui_data):
+        """
+        Ratio of the changed pixels between the thumbnails of the two screenshots
+        Returns:
+            ratio (float): 0 to 1, None if either screenshot can not be decoded
+        """
+        thumbnail, prev_thumbnail = self.get_thumbnail(ui_data), self.get_thumbnail(prev_ui_data)
+        if thumbnail is None or prev_thumbnail is None:
+            return None
+        diff = np.abs(thumbnail.astype(np.int16) - prev_thumbnail.astype(np.int16))
+        return float(np.mean(diff > self.pixel_threshold))
+
+    def detect_change(self, ui_data, prev_ui_data):
+        """
+        Classify the change of the screen from the previous UI
+        Args:
+            ui_data (UIData): The current UI after preprocessing
+            prev_ui_data (UIData): The previous UI after preprocessing, None for the first UI
+        Returns:
+            change (str): 'unchanged', 'minor change' or 'new screen'
+            details (dict): {'pixel_ratio': ratio of the changed thumbnail pixels, None if not comparable,
+                             'same_vh': True if the vh is identical, 'similarity': structure similarity of the vh}
+        """
+        if prev_ui_data is None:
+            return self.NEW_SCREEN, {'pixel_ratio': None, 'same_vh': False, 'similarity': 0}
+        same_vh = self.__ui_similarity.is_same_ui(ui_data, prev_ui_data)
+        similarity = 1.0 if same_vh else self.__ui_similarity.structure_similarity(ui_data, prev_ui_data)
+        # the screenshots are only compared if the vh does not already tell a new screen
+        pixel_ratio = self.changed_pixel_ratio(ui_data, prev_ui_data) if similarity >= self.minor_similarity else None
+        details = {'pixel_ratio': pixel_ratio, 'same_vh': same_vh, 'similarity': similarity}
+
+        if same_vh and (pixel_ratio is None or pixel_ratio <= self.unchanged_pixel_ratio):
+            return self.UNCHANGED, details
+        if similarity >= self.minor_similarity and (pixel_ratio is None or pixel_ratio <= self.minor_pixel_ratio):
+            return self.MINOR_CHANGE, details
+        return self.NEW_SCREEN, details
@@ -1,5 +1,6 @@
 import json
 import re
+from uta.UIProcessing._UITreeSerializer import _UITreeSerializer
 
 
 class _UIChecker:
@@ -8,6 +9,7 @@ class _UIChecker:
     """
     def __init__(self, model_manager):
         self.__model_manager = model_manager
+        self.__tree_serializer = _UITreeSerializer(model_manager)
         self.__system_prompt = 'You are a mobile assistant. Given an UI, you should check if it contains any of the following components that require user decisions:\n' \
                                '1. UI Modal: A window or dialog box overlaying on the top of main content showing Alerts, Confirmations or Instructions.\n' \
                                '2. User Permission: Dialog box asking for user permission to perform app functionalities.\n' \
@@ -57,7 +59,7 @@ class _UIChecker:
         try:
             conversation = [{'role': 'system', 'content': self.__system_prompt},
                             {'role': 'user', 'content': f'Here is the view hierarchy of a UI :\n'
-                                                        f'{str(ui_data.element_tree)}\n'}]
+                                                        f'{self.__tree_serializer.serialize_element_tree(ui_data)}\n'}]
             resp = self.__model_manager.send_fm_conversation(conversation)
             special_compo = self.transfer_to_dict(resp)
             print(special_compo)
@@ -0,0 +1,138 @@
+from uta.DataStructures._UIElementStore import _UIElementStore
+
+
+class _UIDiffer:
+    """
+    Diff the UI against the previous UI to find the unchanged elements whose analysis can be reused
+    """
+    def __init__(self):
+        pass
+
+    '''
+    *************************
+    *** Element Signature ***
+    *************************
+    '''
+    # flags of the element compared in its identity
+    __identity_flags = _UIElementStore.flag_bit('clickable') | _UIElementStore.flag_bit('checked') | \
+        _UIElementStore.flag_bit('selected') | _UIElementStore.flag_bit('focused') | _UIElementStore.flag_bit('scrollable')
+
+    @staticmethod
+    def __element_identity(element, store):
+        """
+        The identity and content of an element, compared to tell if the element changed
+        Args:
+            element (dict): UI element
+            store (_UIElementStore): Element store of the UI, for the structural attributes
+        Returns:
+            identity (tuple)
+        """
+        ele_id = element['id']
+        # the ocr text is appended to 'text' only for elements without vh text, so recover the vh text
+        text = '' if 'ocr' in element else element.get('text')
+        return (store.string(store.resource_codes[ele_id]), store.string(store.class_codes[ele_id]),
+                tuple(store.bounds[ele_id].tolist()), text, element.get('content-desc'),
+                int(store.flags[ele_id]) & _UIDiffer.__identity_flags)
+
+    def compute_element_signatures(self, ui_data):
+        """
+        Compute the subtree signature for each element, bottom-up from the leaves
+        Elements that share a signature have the same identity and content in their whole subtree
+        Args:
+            ui_data (UIData): Target UI data
+        Returns:
+            ui_data.element_signatures (list): Signature of each element indexed by element id
+        """
+        if len(ui_data.element_signatures) == len(ui_data.elements):
+            return ui_data.element_signatures
+        store = ui_data.get_element_store()
+        signatures = [None] * len(ui_data.elements)
+        # children always have larger ids than their parents
+        for element in reversed(ui_data.elements):
+            children_signatures = tuple(signatures[c_id] for c_id in store.children_of(element['id']))
+            signatures[element['id']] = hash((self.__element_identity(element, store), children_signatures))
+        ui_data.element_signatures = signatures
+        return signatures
+
+    '''
+    ***************
+    *** UI Diff ***
+    ***************
+    '''
+    def diff_ui(self, ui_data, prev_ui_data):
+        """
+        Match the elements in the UI to the unchanged elements in the previous UI
+        Args:
+            ui_data (UIData): The current UI
+            prev_ui_data (UIData): The previous UI
+        Returns:
+            matched (dict): {element id: the matched element in the previous UI}, only for unchanged elements
+        """
+        prev_elements_by_signature = {}
+        for prev_ele, signature in zip(prev_ui_data.elements, self.compute_element_signatures(prev_ui_data)):
+            prev_elements_by_signature.setdefault(signature, []).append(prev_ele)
+        matched = {}
+        for ele, signature in zip(ui_data.elements, self.compute_element_signatures(ui_data)):
+            candidates = prev_elements_by_signature.get(signature)
+            if candidates:
+                matched[ele['id']] = candidates.pop(0)
+        return matched
+
+    # analysis results read from the pixels of the element, only valid while its pixels are unchanged
+    __pixel_keys = ('ocr', 'icon-cls', 'caption')
+
+    @staticmethod
+    def __is_pixel_changed(changed_tiles, bounds, tile_size):
+        """
+        Check if any tile under the bounds has changed pixels
+        Args:
+            changed_tiles (ndarray): (rows, cols) bool grid from UIData.get_changed_tiles, None if not comparable
+            bounds (list): [left, top, right, bottom] of the element
+            tile_size (int): Size of the tiles
+        """
+        if changed_tiles is None:
+            return True
+        left, top, right, bottom = bounds
+        rows, cols = changed_tiles.shape
+        top, left = min(max(top // tile_size, 0), rows), min(max(left // tile_size, 0), cols)
+        bottom, right = min(max(-(-bottom // tile_size), top + 1), rows), min(max(-(-right // tile_size), left + 1), cols)
+        return bool(changed_tiles[top: bottom, left: right].any())
+
+    def reuse_unchanged_elements(self, ui_data, prev_ui_data, ocr=True, cls=False, tile_size=60):
+        """
+        Reuse the analysis results of the unchanged leaves from the previous UI
+        The ocr text, icon class and caption of a leaf are read from its pixels, which can change under an unchanged vh
+        (images, canvases, web views), so they are only reused if the pixels under the leaf are unchanged
+        Args:
+            ui_data (UIData): The current UI after preprocessing
+            prev_ui_data (UIData): The previous UI after analysis
+            ocr (bool): True if ocr text is required for the leaves
+            cls (bool): True if icon classification is required for the leaves
+            tile_size (int): Size of the tiles of the pixel diff, shared with the incremental annotation
+        Returns:
+            changed_leaves (list): Leaves that are new or changed, and need to be analyzed
+            ui_data.elements_leaves['text', 'ocr', 'icon-cls', 'description']: reused from the previous UI
+            ui_data.ocr_text: ocr results of the previous UI if no leaf changed, otherwise empty
+        """
+        matched = self.diff_ui(ui_data, prev_ui_data)
+        changed_leaves = []
+        for ele in ui_data.elements_leaves:
+            prev_ele = matched.get(ele['id'])
+            # the previous UI may not have been analyzed with ocr or classification
+            if prev_ele is None or 'description' not in prev_ele \
+                    or (ocr and ele['text'] == '' and 'ocr' not in prev_ele) or (cls and 'icon-cls' not in prev_ele):
+                changed_leaves.append(ele)
+                continue
+            # the screenshots are only diffed, once, if a reused result depends on the pixels
+            if any(key in prev_ele for key in self.__pixel_keys) and \
+                    self.__is_pixel_changed(ui_data.get_changed_tiles(prev_ui_data, tile_size), ele['bounds'], tile_size):
+                changed_leaves.append(ele)
+                continue
+            for key in ['text', 'ocr', 'icon-cls', 'description']:
+                if key in prev_ele:
+                    ele[key] = prev_ele[key]
+        # the previous ocr results only still hold if no leaf changed, otherwise they are redone by the ocr if it runs
+        ui_data.ocr_text = prev_ui_data.ocr_text if len(changed_leaves) == 0 else []
+        print('Reuse %d/%d unchanged leaves from the previous UI' % (len(ui_data.elements_leaves) - len(changed_leaves),
+                                                                    len(ui_data.elements_leaves)))
+        return changed_leaves
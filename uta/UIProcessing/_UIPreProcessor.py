@@ -1,13 +1,32 @@
-import copy
-import xmltodict
+import io
+import re
+import sys
+import xml.etree.ElementTree as ET
 
 
 class _UIPreProcessor:
     """
     Preprocess UI xml raw data by cleaning up vh and convert to json
     """
+    # numeric parser for the bounds string '[left,top][right,bottom]'
+    __bounds_pattern = re.compile(r'-?\d+')
+    # attributes repeated across the elements, interned so the elements share one string for each value
+    __interned_attrs = ('class', 'package', 'resource-id', 'index')
+    # {coordinate string: int} repeated across the bounds, python only caches the ints up to 256
+    __coordinates = {}
+    __max_coordinates = 65536
+
     def __init__(self):
-        pass
+        # Pluggable rules for pruning the vh tree, all applied within a single post-order traversal
+        # invalid element rules: (element) -> True if the element is invalid and should be replaced by its valid children
+        self.invalid_element_rules = [self.__is_invalid_element]
+        # inherit attribute rules: (parent, element) -> pass attributes down from the valid parent to the valid element
+        self.inherit_attr_rules = [self.__inherit_clickability]
+        # redundant nesting rules: (element, children) -> True if the element is redundant and should be replaced by its children
+        self.redundant_nesting_rules = [self.__is_redundant_nesting]
+        # Rules applied top-down while flattening the pruned tree to elements
+        # merge element rules: (element) -> merge the element with its children in place
+        self.merge_element_rules = [self.__merge_element_with_single_leaf_child]
 
     '''
     ******************************************
@@ -23,51 +42,72 @@ class _UIPreProcessor:
              ui_data.ui_vh_json (dict): VH in a tidy json format
         """
         # print('* Reformat xml vh *')
-        ui_data.ui_vh_json = xmltodict.parse(open(ui_data.xml_file, 'r', encoding='utf-8').read())
-        # Tidy up and reformat the json vh into Rico format
-        ui_data.ui_vh_json = {'activity': {'root': self.__cvt_node_to_rico_format(ui_data.ui_vh_json['hierarchy']['node'])}}
+        # Parse the xml and reformat the nodes into Rico format in a single streaming pass
+        # the vh captured in memory is parsed from the string without writing it to a file
+        xml_file = ui_data.xml_file if ui_data.xml is None else io.BytesIO(ui_data.xml.encode('utf-8'))
+        ui_data.ui_vh_json = {'activity': {'root': self.__parse_xml_to_rico_format(xml_file)}}
 
-    def __cvt_node_to_rico_format(self, node):
+    def __parse_xml_to_rico_format(self, xml_file):
         """
-        Recursively reformat ui element node to rico format
+        Stream through the xml vh and build the Rico format node tree on the fly
         Args:
-            node: ui element node in the dict
+            xml_file (path or file object): .xml file of the UI vh
         Return:
-            Reformatted node
-        """
-        node = self.__reformat_node(node)
-        if 'children' in node:
-            if type(node['children']) == list:
-                new_children = []
-                for child in node['children']:
-                    new_children.append(self.__cvt_node_to_rico_format(child))
-                node['children'] = new_children
+            root (dict): Reformatted root node with its children nested in 'children'
+        """
+        root = None
+        ancestors = []  # stack of the opened nodes
+        for event, xml_node in ET.iterparse(xml_file, events=('start', 'end')):
+            if xml_node.tag != 'node':
+                continue
+            if event == 'start':
+                node = self.__reformat_node(xml_node.attrib)
+                if len(ancestors) > 0:
+                    ancestors[-1].setdefault('children', []).append(node)
+                elif root is None:
+                    root = node
+                ancestors.append(node)
             else:
-                node['children'] = [self.__cvt_node_to_rico_format(node['children'])]
-        return node
+                ancestors.pop()
+                # release the parsed xml node as it has been converted
+                xml_node.clear()
+        return root
 
     @staticmethod
-    def __reformat_node(node):
+    def __reformat_node(attrib):
         """
         Tidy up node attributes
         """
         node_new = {}
-        for key in node.keys():
-            if node[key] == 'true':
-                node[key] = True
-            elif node[key] == 'false':
-                node[key] = False
-
-            if key == 'node':
-                node_new['children'] = node['node']
-            elif key == '@bounds':
-                node_new['bounds'] = eval(node['@bounds'].replace('][', ','))
-            # elif key == '@index':
+        for key, value in attrib.items():
+            if value == 'true':
+                value = True
+            elif value == 'false':
+                value = False
+
+            if key == 'bounds':
+                node_new['bounds'] = [_UIPreProcessor.__coordinate(n) for n in _UIPreProcessor.__bounds_pattern.findall(value)]
+            elif key in _UIPreProcessor.__interned_attrs and type(value) is str:
+                node_new[key] = sys.intern(value)
+            # elif key == 'index':
             #     continue
             else:
-                node_new[key.replace('@', '')] = node[key]
+                node_new[key] = value
         return node_new
 
+    @staticmethod
+    def __coordinate(string):
+        """
+        Parse a coordinate of the bounds, memoized so the bounds share one int object for each coordinate
+        """
+        coordinate = _UIPreProcessor.__coordinates.get(string)
+        if coordinate is None:
+            coordinate = int(string)
+            if len(_UIPreProcessor.__coordinates) >= _UIPreProcessor.__max_coordinates:
+                _UIPreProcessor.__coordinates.clear()
+            _UIPreProcessor.__coordinates[string] = coordinate
+        return coordinate
+
     '''
     **************************
     *** UI Info Extraction ***
@@ -80,92 +120,99 @@ class _UIPreProcessor:
             ui_data (UIData): ui data for processing
         Returns:
             ui_data.elements; ui_data.elements_leaves (list of dicts)
+            ui_data.element_store (_UIElementStore): Columnar store of the elements
         """
         # print('* Extract ui elements from vh *')
-        json_vh = ui_data.ui_vh_json
-        json_cp = copy.deepcopy(json_vh)
-        element_root = json_cp['activity']['root']
+        # the vh json is freshly parsed for each UI, so clean it up in place rather than on a copy
+        element_root = ui_data.ui_vh_json['activity']['root']
         element_root['class'] = 'root'
-        # clean up the json tree to remove redundant layout node
-        self.__prone_invalid_children(element_root)
-        self.__remove_redundant_nesting(element_root)
-        self.__merge_element_with_single_leaf_child(element_root)
-        # build hierarchy
+        # clean up the json tree to remove invalid and redundant layout node in one traversal
+        self.__prune_element_tree(element_root)
+        # flatten the hierarchy into elements and leaves in one traversal
         self.__extract_children_elements(ui_data, element_root, 0)
-        self.__gather_leaf_elements(ui_data)
+        ui_data.mark_elements_changed()
+        ui_data.get_element_store()
         # json.dump(self.elements, open(self.output_file_path_elements, 'w', encoding='utf-8'), indent=4)
         # print('Save elements to', self.output_file_path_elements)
 
-    def __prone_invalid_children(self, element):
+    def __prune_element_tree(self, element, parent=None):
         """
-        Prone invalid children elements
-        Leave valid children and prone their children recursively
-        Take invalid children's children as its own directly
+        Prune the element tree recursively through a post-order traversal by applying the pruning rules
+            1. Invalid element is pruned, and its valid children are taken by its parent directly
+            2. Valid element inherits attributes from its closest valid ancestor
+            3. Redundant nesting element is removed, and its children are taken by its parent directly
+        Args:
+            element (dict): Element node in the vh json
+            parent (dict): The closest valid ancestor of the element, None for the root
+        Returns:
+            valid_nodes (list): Valid elements that replace the element in its parent's children
+            kept_nodes (list): Elements that replace the element in its parent's children after removing redundant nesting
+        """
+        valid = parent is None or not any(rule(element) for rule in self.invalid_element_rules)
+        if valid and parent is not None:
+            for rule in self.inherit_attr_rules:
+                rule(parent, element)
+        if 'children' not in element:
+            return ([element], [element]) if valid else ([], [])
+
+        valid_children, kept_children = [], []
+        for child in element['children']:
+            child_valid, child_kept = self.__prune_element_tree(child, element if valid else parent)
+            valid_children += child_valid
+            kept_children += child_kept
+        if not valid:
+            return valid_children, kept_children
+        if len(valid_children) > 0 and any(rule(element, valid_children) for rule in self.redundant_nesting_rules):
+            # the redundant element still holds its valid children, in case it is kept by a redundant parent
+            element['children'] = valid_children
+            return [element], kept_children
+        element['children'] = kept_children
+        return [element], [element]
+
+    @staticmethod
+    def __is_invalid_element(element, min_length=5):
         """
-        def check_if_element_valid(ele, min_length=5):
-            """
-            Check if the element is valid and should be kept
-            """
-            if (ele['bounds'][0] >= ele['bounds'][2] - min_length
-                or ele['bounds'][1] >= ele['bounds'][3] - min_length) \
-                    or ('layout' in ele['class'].lower() and not ele['clickable']):
-                return False
+        Check if the element is too small or is a non-clickable layout
+        """
+        if element['bounds'][0] >= element['bounds'][2] - min_length \
+                or element['bounds'][1] >= element['bounds'][3] - min_length \
+                or ('layout' in element['class'].lower() and not element['clickable']):
             return True
+        return False
 
-        valid_children = []
-        if 'children' in element:
-            for child in element['children']:
-                if check_if_element_valid(child):
-                    valid_children.append(child)
-                    self.__prone_invalid_children(child)
-                else:
-                    valid_children += self.__prone_invalid_children(child)
-            element['children'] = valid_children
-        return valid_children
+    @staticmethod
+    def __inherit_clickability(parent, element):
+        """
+        Element is clickable if its parent is clickable
+        """
+        if parent['clickable']:
+            element['clickable'] = True
 
-    def __remove_redundant_nesting(self, element):
+    @staticmethod
+    def __is_redundant_nesting(element, children):
         """
-        Remove redundant parent node whose bounds are same
+        Parent node is redundant if any of its children has the same bounds
         """
-        if 'children' in element and len(element['children']) > 0:
-            redundant = False
-            new_children = []
-            for child in element['children']:
-                # inherit clickability
-                if element['clickable']:
-                    child['clickable'] = True
-                # recursively inspect child node
-                new_children += self.__remove_redundant_nesting(child)
-                if child['bounds'] == element['bounds']:
-                    redundant = True
-            # only return the children if the node is redundany
-            if redundant:
-                return new_children
-            else:
-                element['children'] = new_children
-        return [element]
+        for child in children:
+            if child['bounds'] == element['bounds']:
+                return True
+        return False
 
-    def __merge_element_with_single_leaf_child(self, element):
+    @staticmethod
+    def __merge_element_with_single_leaf_child(element):
         """
         Keep the resource-id and class and clickable of the child element
         """
-        if 'children' in element:
-            if len(element['children']) == 1 and 'children' not in element['children'][0]:
-                child = element['children'][0]
-                element['resource-id'] = child['resource-id'] if 'resource-id' in child else None
-                element['class'] = child['class']
-                element['clickable'] = child['clickable']
-                del element['children']
-            else:
-                new_children = []
-                for child in element['children']:
-                    new_children.append(self.__merge_element_with_single_leaf_child(child))
-                element['children'] = new_children
-        return element
+        if 'children' in element and len(element['children']) == 1 and 'children' not in element['children'][0]:
+            child = element['children'][0]
+            element['resource-id'] = child['resource-id'] if 'resource-id' in child else None
+            element['class'] = child['class']
+            element['clickable'] = child['clickable']
+            del element['children']
 
     def __extract_children_elements(self, ui_data, element, layer):
         """
-        Recursively extract children from an element
+        Recursively extract children from an element, and gather the leaf elements that have no children
         Args:
             ui_data (UIData)
             element (dict): dict node with attributes and hierarchical elements
@@ -173,6 +220,8 @@ class _UIPreProcessor:
         Returns:
              children_depth (int): maximum depth of children nodes
         """
+        for rule in self.merge_element_rules:
+            rule(element)
         element['id'] = ui_data.elements_ids
         element['layer'] = layer
         ui_data.elements.append(element)
@@ -186,20 +235,8 @@ class _UIPreProcessor:
             element['children-depth'] = children_depth
             # replace wordy 'children' with 'children-id'
             del element['children']
-        if 'ancestors' in element:
-            del element['ancestors']
+            element['class'] = sys.intern(element['class'] + '(container)')
+        else:
+            element['leaf-id'] = len(ui_data.elements_leaves)
+            ui_data.elements_leaves.append(element)
         return children_depth
-
-    @staticmethod
-    def __gather_leaf_elements(ui_data):
-        """
-        Gather all leaf elements that have no children together
-        """
-        i = 0
-        for ele in ui_data.elements:
-            if 'children-id' not in ele:
-                ele['leaf-id'] = i
-                ui_data.elements_leaves.append(ele)
-                i += 1
-            else:
-                ele['class'] += '(container)'
\ No newline at end of file
@@ -0,0 +1,150 @@
+import time
+import hashlib
+from collections import deque
+import numpy as np
+
+from uta.DataStructures._ScreenImage import _ScreenImage
+
+
+class _UISettleDetector:
+    """
+    Wait for the screen to settle after an action by polling cheap captures until it stops changing,
+    instead of sleeping for a fixed time. The time each app takes to settle is learned, so the polling starts
+    around when the app usually settles rather than right after the action
+    """
+    def __init__(self, poll_interval=0.25, stable_frames=2, timeout=5, initial_wait_ratio=0.5, history_size=20,
+                 thumbnail_size=(36, 76), pixel_threshold=24, max_changed_ratio=0.01, clock=time.monotonic, sleep=time.sleep):
+        """
+        Args:
+            poll_interval (float): Seconds between two captures
+            stable_frames (int): Number of consecutive captures without change to consider the screen settled
+            timeout (float): Default maximum seconds to wait
+            initial_wait_ratio (float): Wait this ratio of the learned settle time of the app before the first capture,
+                                        below 1 so the learned time can also decrease
+            history_size (int): Number of the recent settle times kept for each app
+            thumbnail_size (tuple): (width, height) of the grayscale thumbnails of the captured screenshots
+            pixel_threshold (int): Gray level difference of a thumbnail pixel to count it as changed
+            max_changed_ratio (float): Maximum ratio of the changed pixels of two captures of a still screen
+            clock (function): Returns the current time in seconds, replaceable to simulate the time in tests
+            sleep (function): Sleeps for the given seconds, replaceable to simulate the time in tests
+        """
+        self.poll_interval = poll_interval
+        self.stable_frames = stable_frames
+        self.timeout = timeout
+        self.initial_wait_ratio = initial_wait_ratio
+        self.history_size = history_size
+        self.thumbnail_size = thumbnail_size
+        self.pixel_threshold = pixel_threshold
+        self.max_changed_ratio = max_changed_ratio
+        self.clock = clock
+        self.sleep = sleep
+        self.__settle_times = {}    # {app: deque of the recent settle times in seconds}
+
+    '''
+    **************
+    *** Frames ***
+    **************
+    '''
+    def frame_signature(self, frame):
+        """
+        Cheap signature of a captured frame to compare with the next capture
+        Args:
+            frame (bytes, ndarray or str): Screenshot png/jpg bytes or decoded image, or hierarchy xml
+        Returns:
+            signature: Grayscale thumbnail of the screenshot or hash of the xml, None if nothing is captured or
+                       the capture is an error
+        """
+        if frame is None:
+            return None
+        if isinstance(frame, str):
+            # the error of a failed dump repeats on every poll, it must not be taken as an unchanged screen
+            if frame.startswith('ERROR'):
+                return None
+            return hashlib.blake2b(frame.encode('utf-8'), digest_size=16).digest()
+        return _ScreenImage(frame).thumbnail(self.thumbnail_size)
+
+    def is_same_frame(self, signature1, signature2):
+        """
+        Check if two frame signatures show the same screen
+        """
+        if signature1 is None or signature2 is None or type(signature1) != type(signature2):
+            return False
+        if isinstance(signature1, bytes):
+            return signature1 == signature2
+        diff = np.abs(signature1.astype(np.int16) - signature2.astype(np.int16))
+        return bool(np.mean(diff > self.pixel_threshold) <= self.max_changed_ratio)
+
+    '''
+    **************
+    *** Settle ***
+    **************
+    '''
+    def wait_for_settle(self, capture, app=None, timeout=None, min_wait=0):
+        """
+        Poll the captures until the screen is unchanged for stable_frames consecutive captures or the timeout is hit
+        Args:
+            capture (function): Returns the current frame, screenshot bytes or image, or hierarchy xml
+            app (str): App on the screen, to learn and use its settle time
+            timeout (float): Maximum seconds to wait, None to use the default timeout
+            min_wait (float): Minimum seconds to wait even if the screen settles earlier, for the screens that
+                              start changing some time after the action
+        Returns:
+            settled (bool): True if the screen settled before the timeout
+            elapsed (float): Seconds waited
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = self.clock()
+        # skip polling the part of the loading the app usually takes
+        initial_wait = min(self.expected_settle_time(app) * self.initial_wait_ratio, timeout)
+        if initial_wait > 0:
+            self.sleep(initial_wait)
+        last_capture = self.clock()
+        signature = self.frame_signature(capture())
+        last_change = self.clock()
+        stable, settled = 0, False
+        while self.clock() - start < timeout:
+            # the time taken by the capture counts towards the interval, so slow captures are not followed by a sleep
+            interval = self.poll_interval - (self.clock() - last_capture)
+            self.sleep(min(max(interval, 0), max(timeout - (self.clock() - start), 0)))
+            last_capture = self.clock()
+            prev_signature, signature = signature, self.frame_signature(capture())
+            if self.is_same_frame(signature, prev_signature):
+                stable += 1
+                if stable >= self.stable_frames:
+                    settled = True
+                    break
+            else:
+                stable = 0
+                last_change = self.clock()
+        if settled:
+            # the screen settled at its last change, the stable captures after it are the cost of confirming it
+            self.record_settle_time(app, last_change - start)
+        if self.clock() - start < min_wait:
+            self.sleep(min_wait - (self.clock() - start))
+        elapsed = self.clock() - start
+        return settled, elapsed
+
+    def record_settle_time(self, app, settle_time):
+        """
+        Add a settle time of the app to its statistics
+        """
+        self.__settle_times.setdefault(app, deque(maxlen=self.history_size)).append(settle_time)
+
+    def expected_settle_time(self, app):
+        """
+        Median of the recent settle times of the app, 0 if none is known
+        """
+        settle_times = self.__settle_times.get(app)
+        if not settle_times:
+            return 0
+        return float(np.median(settle_times))
+
+    def get_settle_stats(self):
+        """
+        Statistics of the learned settle times
+        Returns:
+            stats (dict): {app: {'count':, 'median':, 'p90':, 'max':}} in seconds
+        """
+        return {app: {'count': len(settle_times), 'median': float(np.median(settle_times)),
+                      'p90': float(np.percentile(settle_times, 90)), 'max': float(max(settle_times))}
+                for app, settle_times in self.__settle_times.items() if len(settle_times) > 0}
@@ -0,0 +1,294 @@
+import hashlib
+from collections import Counter
+import numpy as np
+
+from uta.DataStructures._UIElementStore import _UIElementStore
+
+
+class _UIFingerprint:
+    """
+    Structural fingerprint of a UI, computed once and cached on the UIData to compare it with other UIs.
+    The hashes are stable across processes, so fingerprints of UIs from earlier sessions are comparable
+    """
+    def __init__(self, store, label_hashes, structure_hashes, content_hashes, minhash, content_minhash,
+                 elements_version):
+        self.store = store                          # element store of the UI, for the tree structure
+        self.label_hashes = label_hashes            # hash of the class, resource-id and type flags of each element
+        self.structure_hashes = structure_hashes    # merkle hash of the labels of the subtree under each element
+        self.content_hashes = content_hashes        # merkle hash of the labels and content of the subtree
+        self.minhash = minhash                      # minhash signature of the bag of element-to-ancestor label paths
+        self.content_minhash = content_minhash      # minhash signature of the label paths and the text tokens
+        self.elements_version = elements_version    # elements_version of the UIData the fingerprint is computed from
+
+    def __len__(self):
+        return len(self.label_hashes)
+
+    @property
+    def structure_hash(self):
+        return self.structure_hashes[0]
+
+    @property
+    def content_hash(self):
+        return self.content_hashes[0]
+
+
+class _UISimilarity:
+    """
+    Compare UIs through their fingerprints instead of diffing the string of the element trees:
+        1. Merkle hashes of the subtrees tell identical UIs and shared subtrees in O(1) and O(n)
+        2. MinHash of the bag of element-to-ancestor label paths estimates the structural similarity in O(1),
+           and with the text tokens of the elements added to the bag, the similarity of the structure and content
+        3. Tree edit distance, pruned on the identical subtrees, for an exact structural distance
+    """
+    # flags telling the type of an element, part of its structural label
+    __label_flags = _UIElementStore.flag_bit('clickable') | _UIElementStore.flag_bit('scrollable') | \
+        _UIElementStore.flag_bit('checkable') | _UIElementStore.flag_bit('long-clickable')
+    # flags telling the state of an element, part of its content
+    __state_flags = _UIElementStore.flag_bit('selected') | _UIElementStore.flag_bit('checked') | \
+        _UIElementStore.flag_bit('focused') | _UIElementStore.flag_bit('enabled')
+    # maximum number of labels in the paths of the minhash
+    __path_length = 3
+    # universal hash functions ((a * x + b) mod prime) of the minhash, fixed so signatures are comparable across runs
+    __num_perm = 64
+    __prime = (1 << 31) - 1
+    __random_state = np.random.RandomState(1)
+    __perm_a = __random_state.randint(1, __prime, __num_perm).astype(np.uint64)
+    __perm_b = __random_state.randint(0, __prime, __num_perm).astype(np.uint64)
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def __hash(*values):
+        """
+        Stable 64-bit hash of the values
+        """
+        data = b'\x1f'.join(value.to_bytes(8, 'little') if type(value) is int else str(value).encode('utf-8')
+                            for value in values)
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+    @staticmethod
+    def __mix(h, value):
+        """
+        Fold a 64-bit hash into another, cheaper than __hash for combining the hashes already computed
+        """
+        h = ((h ^ value) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        return h ^ (h >> 29)
+
+    '''
+    *******************
+    *** Fingerprint ***
+    *******************
+    '''
+    def fingerprint(self, ui_data):
+        """
+        Compute the fingerprint of the UI, or return the one cached on the UIData
+        Args:
+            ui_data (UIData): Target UI data after preprocessing
+        Returns:
+            ui_data.fingerprint (_UIFingerprint): Fingerprint of the UI
+        """
+        if ui_data.fingerprint is not None and ui_data.fingerprint.elements_version == ui_data.elements_version:
+            return ui_data.fingerprint
+        store = ui_data.get_element_store()
+        n = len(ui_data.elements)
+        mix = self.__mix
+        flags, parents = store.flags.tolist(), store.parents.tolist()
+        labels = {}     # {(class code, resource-id code, flags): label hash}, as the labels repeat in the UI
+        label_hashes = [0] * n
+        for i, key in enumerate(zip(store.class_codes.tolist(), store.resource_codes.tolist(), flags)):
+            if key not in labels:
+                labels[key] = self.__hash(store.string(key[0]), store.string(key[1]), key[2] & self.__label_flags)
+            label_hashes[i] = labels[key]
+
+        # merkle hashes bottom-up, children always have larger ids than their parents
+        structure_hashes, content_hashes = [0] * n, [0] * n
+        for i in range(n - 1, -1, -1):
+            element = ui_data.elements[i]
+            # the ocr text is appended to 'text' only for elements without vh text, so recover the vh text
+            text = '' if 'ocr' in element else element.get('text')
+            structure_hash = label_hashes[i]
+            content_hash = mix(label_hashes[i], self.__hash(text, element.get('content-desc'), element['bounds'],
+                                                            flags[i] & self.__state_flags))
+            for c_id in store.children_of(i):
+                structure_hash = mix(structure_hash, structure_hashes[c_id])
+                content_hash = mix(content_hash, content_hashes[c_id])
+            structure_hashes[i], content_hashes[i] = structure_hash, content_hash
+
+        # paths of the labels from each element up to 1, 2 .. __path_length levels, numbered by occurrence to make
+        # the bag a set. The paths are short, so a changed ancestor only changes the longer paths of the elements under it
+        occurrences, shingles = Counter(), []
+        for i in range(n):
+            path_hash, ancestor, length = label_hashes[i], parents[i], 1
+            while True:
+                occurrences[path_hash] += 1
+                shingles.append(mix(path_hash, occurrences[path_hash]) % self.__prime)
+                if ancestor < 0 or length == self.__path_length:
+                    break
+                path_hash = mix(path_hash, label_hashes[ancestor])
+                ancestor, length = parents[ancestor], length + 1
+        # words of the text and content-desc of each element, under the label of the element
+        tokens, text_shingles = {}, []
+        for i, element in enumerate(ui_data.elements):
+            text = '' if 'ocr' in element else element.get('text')
+            for value in (text, element.get('content-desc')):
+                if not isinstance(value, str):
+                    continue
+                for token in value.lower().split():
+                    if token not in tokens:
+                        tokens[token] = self.__hash(token)
+                    token_hash = mix(label_hashes[i], tokens[token])
+                    occurrences[token_hash] += 1
+                    text_shingles.append(mix(token_hash, occurrences[token_hash]) % self.__prime)
+        minhash = self.__minhash(np.array(shingles, dtype=np.uint64))
+        content_minhash = np.minimum(minhash, self.__minhash(np.array(text_shingles, dtype=np.uint64)))
+
+        ui_data.fingerprint = _UIFingerprint(store, label_hashes, structure_hashes, content_hashes,
+                                             minhash.astype(np.uint32), content_minhash.astype(np.uint32),
+                                             ui_data.elements_version)
+        return ui_data.fingerprint
+
+    def __minhash(self, shingles):
+        """
+        Minimum of each hash function over the shingles, the prime for an empty set of shingles
+        """
+        if len(shingles) == 0:
+            return np.full(self.__num_perm, self.__prime, dtype=np.uint64)
+        return ((self.__perm_a[:, None] * shingles[None, :] + self.__perm_b[:, None]) % self.__prime).min(axis=1)
+
+    '''
+    ******************
+    *** Similarity ***
+    ******************
+    '''
+    def is_same_ui(self, ui_data1, ui_data2):
+        """
+        Check if two UIs are identical in both the structure and the content of the elements
+        """
+        return self.fingerprint(ui_data1).content_hash == self.fingerprint(ui_data2).content_hash
+
+    def is_same_structure(self, ui_data1, ui_data2):
+        """
+        Check if two UIs have the same element tree, regardless of the text, bounds and state of the elements
+        """
+        return self.fingerprint(ui_data1).structure_hash == self.fingerprint(ui_data2).structure_hash
+
+    def structure_similarity(self, ui_data1, ui_data2):
+        """
+        Estimate the Jaccard similarity of the element-to-ancestor label paths of two UIs through their minhash signatures
+        Args:
+            ui_data1 (UIData): The comparing ui
+            ui_data2 (UIData): The comparing ui
+        Returns:
+            similarity (float): The similarity between two trees, 0 to 1
+        """
+        fingerprint1, fingerprint2 = self.fingerprint(ui_data1), self.fingerprint(ui_data2)
+        if fingerprint1.structure_hash == fingerprint2.structure_hash:
+            return 1.0
+        return float(np.mean(fingerprint1.minhash == fingerprint2.minhash))
+
+    def content_similarity(self, ui_data1, ui_data2):
+        """
+        Estimate the Jaccard similarity of the label paths and the text tokens of two UIs through their minhash
+        signatures, so the UIs of the same layout showing different text are told apart
+        Args:
+            ui_data1 (UIData): The comparing ui
+            ui_data2 (UIData): The comparing ui
+        Returns:
+            similarity (float): The similarity between two trees and their text, 0 to 1
+        """
+        fingerprint1, fingerprint2 = self.fingerprint(ui_data1), self.fingerprint(ui_data2)
+        if fingerprint1.content_hash == fingerprint2.content_hash:
+            return 1.0
+        return float(np.mean(fingerprint1.content_minhash == fingerprint2.content_minhash))
+
+    def subtree_similarity(self, ui_data1, ui_data2):
+        """
+        Share of the elements of two UIs whose whole subtree structure is found in the other UI
+        Args:
+            ui_data1 (UIData): The comparing ui
+            ui_data2 (UIData): The comparing ui
+        Returns:
+            similarity (float): The dice coefficient of the subtree hashes, 0 to 1
+        """
+        fingerprint1, fingerprint2 = self.fingerprint(ui_data1), self.fingerprint(ui_data2)
+        shared = Counter(fingerprint1.structure_hashes) & Counter(fingerprint2.structure_hashes)
+        return 2 * sum(shared.values()) / (len(fingerprint1) + len(fingerprint2))
+
+    def tree_edit_distance(self, ui_data1, ui_data2, max_distance=None):
+        """
+        Top-down tree edit distance between the element trees of two UIs, counting the relabeled elements
+        and the elements of the inserted or deleted subtrees. Identical subtrees are matched through their hashes
+        without being compared, and the alignments costing more than the max_distance are pruned
+        Args:
+            ui_data1 (UIData): The comparing ui
+            ui_data2 (UIData): The comparing ui
+            max_distance (int): Stop at this distance, None to compute the whole distance
+        Returns:
+            distance (int): The edit distance, max_distance + 1 if it is larger than the max_distance
+        """
+        fingerprint1, fingerprint2 = self.fingerprint(ui_data1), self.fingerprint(ui_data2)
+        store1, store2 = fingerprint1.store, fingerprint2.store
+        sizes1 = (store1.subtree_ends - np.arange(len(store1))).tolist()
+        sizes2 = (store2.subtree_ends - np.arange(len(store2))).tolist()
+        if max_distance is None:
+            max_distance = len(fingerprint1) + len(fingerprint2)
+        distances = {}
+
+        def distance(i, j):
+            if fingerprint1.structure_hashes[i] == fingerprint2.structure_hashes[j]:
+                return 0
+            if abs(sizes1[i] - sizes2[j]) > max_distance:
+                return max_distance + 1
+            if (i, j) in distances:
+                return distances[(i, j)]
+            relabel = 0 if fingerprint1.label_hashes[i] == fingerprint2.label_hashes[j] else 1
+            children1, children2 = store1.children_of(i), store2.children_of(j)
+            # align the children, a deleted or inserted child costs its whole subtree
+            prev = [0]
+            for c2 in children2:
+                prev.append(prev[-1] + sizes2[c2])
+            for c1 in children1:
+                cur = [prev[0] + sizes1[c1]]
+                for k, c2 in enumerate(children2):
+                    cost = min(prev[k + 1] + sizes1[c1], cur[k] + sizes2[c2])
+                    # the distance of two subtrees is at least the difference of their sizes
+                    if prev[k] + abs(sizes1[c1] - sizes2[c2]) < cost:
+                        cost = min(cost, prev[k] + distance(c1, c2))
+                    cur.append(cost)
+                prev = cur
+                if relabel + min(prev) > max_distance:
+                    break
+            distances[(i, j)] = min(relabel + prev[-1], max_distance + 1)
+            return distances[(i, j)]
+
+        return distance(0, 0)
+
+    def tree_edit_similarity(self, ui_data1, ui_data2):
+        """
+        Similarity of two UIs from their tree edit distance
+        Returns:
+            similarity (float): 1 - distance / total number of elements, 0 to 1
+        """
+        total = len(self.fingerprint(ui_data1)) + len(self.fingerprint(ui_data2))
+        return 1 - self.tree_edit_distance(ui_data1, ui_data2) / total
+
+    def find_similar_ui(self, ui_data, ui_datas, threshold=0.9):
+        """
+        Find the most similar UI to the ui_data among the UIs, such as the UIs visited before
+        Args:
+            ui_data (UIData): The target ui
+            ui_datas (list of UIData): The UIs to search in
+            threshold (float): Minimum structure similarity of the found UI
+        Returns:
+            index (int): Index of the most similar UI in the ui_datas, None if no UI is similar above the threshold
+            similarity (float): Structure similarity of the found UI
+        """
+        best_index, best_similarity = None, threshold
+        for i, other in enumerate(ui_datas):
+            similarity = self.structure_similarity(ui_data, other)
+            if similarity >= best_similarity:
+                best_index, best_similarity = i, similarity
+                if similarity == 1:
+                    break
+        return best_index, best_similarity if best_index is not None else 0
@@ -0,0 +1,105 @@
+import numpy as np
+
+
+class _UISpatialIndex:
+    """
+    Uniform grid index over UI boxes [left, top, right, bottom] for intersection and containment queries
+    Queries return the box indices in ascending order, the same order as a linear scan over the boxes
+    """
+    def __init__(self, boxes, cell_size=100):
+        """
+        Args:
+            boxes (list): List of bounds [left, top, right, bottom]
+            cell_size (int): Side length of the square grid cells
+        """
+        self.boxes = np.array(boxes, dtype=np.int64).reshape(-1, 4)
+        self.cell_size = cell_size
+        self.cells = {}     # {(row, col): [indices of boxes overlapping the cell]}
+        self.__build_grid()
+
+    def __build_grid(self):
+        # the cell ranges include the right and bottom edges, so that the boxes are found by points on their border
+        col_ranges = np.floor_divide(self.boxes[:, [0, 2]], self.cell_size)
+        row_ranges = np.floor_divide(self.boxes[:, [1, 3]], self.cell_size)
+        for i, ((c0, c1), (r0, r1)) in enumerate(zip(col_ranges.tolist(), row_ranges.tolist())):
+            for r in range(r0, r1 + 1):
+                for c in range(c0, c1 + 1):
+                    self.cells.setdefault((r, c), []).append(i)
+
+    def __candidates(self, left, top, right, bottom):
+        """
+        Get the indices of boxes sharing grid cells with the region
+        """
+        c0, c1 = left // self.cell_size, right // self.cell_size
+        r0, r1 = top // self.cell_size, bottom // self.cell_size
+        candidates = set()
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                candidates.update(self.cells.get((r, c), ()))
+        return np.array(sorted(candidates), dtype=np.int64)
+
+    '''
+    ***************
+    *** Queries ***
+    ***************
+    '''
+    def query_intersect(self, bounds):
+        """
+        Args:
+            bounds (list): [left, top, right, bottom]
+        Returns:
+            indices (list): Boxes having positive overlapping area with the bounds
+        """
+        left, top, right, bottom = bounds
+        ids = self.__candidates(left, top, right, bottom)
+        if len(ids) == 0:
+            return []
+        boxes = self.boxes[ids]
+        overlapped = (np.minimum(boxes[:, 2], right) > np.maximum(boxes[:, 0], left)) & \
+                     (np.minimum(boxes[:, 3], bottom) > np.maximum(boxes[:, 1], top))
+        return ids[overlapped].tolist()
+
+    def query_point(self, x, y):
+        """
+        Args:
+            x, y (int): Coordinate of the point
+        Returns:
+            indices (list): Boxes containing the point, borders included
+        """
+        ids = self.__candidates(x, y, x, y)
+        if len(ids) == 0:
+            return []
+        boxes = self.boxes[ids]
+        contained = (boxes[:, 0] <= x) & (x <= boxes[:, 2]) & (boxes[:, 1] <= y) & (y <= boxes[:, 3])
+        return ids[contained].tolist()
+
+    def query_contained(self, bounds):
+        """
+        Args:
+            bounds (list): [left, top, right, bottom]
+        Returns:
+            indices (list): Boxes that are inside the bounds
+        """
+        left, top, right, bottom = bounds
+        ids = self.__candidates(left, top, right, bottom)
+        if len(ids) == 0:
+            return []
+        boxes = self.boxes[ids]
+        contained = (boxes[:, 0] >= left) & (boxes[:, 1] >= top) & (boxes[:, 2] <= right) & (boxes[:, 3] <= bottom)
+        return ids[contained].tolist()
+
+    def query_containing(self, bounds):
+        """
+        Args:
+            bounds (list): [left, top, right, bottom]
+        Returns:
+            indices (list): Boxes that contain the bounds
+        """
+        left, top, right, bottom = bounds
+        # any box containing the bounds covers its top-left corner
+        ids = self.__candidates(left, top, left, top)
+        if len(ids) == 0:
+            return []
+        boxes = self.boxes[ids]
+        containing = (boxes[:, 0] <= left) & (boxes[:, 1] <= top) & (boxes[:, 2] >= right) & (boxes[:, 3] >= bottom)
+        return ids[containing].tolist()
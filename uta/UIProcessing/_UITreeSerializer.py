@@ -0,0 +1,151 @@
+class _UITreeSerializer:
+    """
+    Serialize the element tree into a compact indented text for prompts, one element per line:
+        <id> <Class>[ <flags>][ "<description>"][ #<resource-id>]
+    Attribute names are never repeated, the nesting is given by the indentation
+    """
+    legend = 'Each line is an element: id Class flags(c:clickable, s:scrollable, x:selected) "description" ' \
+             '#resource-id, children are indented under their parent.'
+
+    def __init__(self, model_manager, token_budget=3000, max_collapsed_chars=120):
+        """
+        Args:
+            model_manager (ModelManager): To count the tokens of the serialized tree
+            token_budget (int): Maximum tokens of the serialized tree, None for no limit
+            max_collapsed_chars (int): Maximum characters of the description of a collapsed subtree
+        """
+        self.__model_manager = model_manager
+        self.token_budget = token_budget
+        self.max_collapsed_chars = max_collapsed_chars
+
+    def serialize_element_tree(self, ui_data, token_budget=-1):
+        """
+        Serialize the element tree of the UI, truncating it by priority to fit in the token budget:
+        1. Drop the wrapper containers and the leaves that are neither interactive nor described;
+        2. Collapse the subtrees that are off the screen into one line;
+        3. Collapse the subtrees without any interactive element into one line with their descriptions;
+        4. Drop the lines of the lowest priority, from the bottom of the UI, until the budget is met.
+           Interactive and described elements are dropped last, and containers outlive their kept children
+        Args:
+            ui_data (UIData): UI with element_tree built
+            token_budget (int): Maximum tokens, -1 to use the default budget and None for no limit
+        Returns:
+            tree_text (str): Compact element tree
+        """
+        if token_budget == -1:
+            token_budget = self.token_budget
+        # the bounds of the root are the screen, in the same coordinates as the elements
+        roots = self.__compact_node(ui_data.element_tree, ui_data.elements, ui_data.elements[0]['bounds'])
+        # the root is always kept to give the tree an anchor
+        root = roots[0] if len(roots) == 1 and roots[0]['id'] == ui_data.element_tree['id'] else \
+            self.__make_node(ui_data.element_tree, roots, False)
+
+        for collapse_level in (0, 1, 2):
+            lines = []
+            self.__render_node(root, 0, collapse_level, lines)
+            tree_text = self.legend + '\n' + '\n'.join([line for line, _ in lines])
+            if token_budget is None or self.__model_manager.count_token_size(tree_text) <= token_budget:
+                return tree_text
+        return self.__truncate_lines(lines, token_budget)
+
+    '''
+    ******************
+    *** Compaction ***
+    ******************
+    '''
+    def __make_node(self, element, children, offscreen):
+        """
+        Build the compact node of an element
+        """
+        interactive = bool(element.get('clickable') or element.get('scrollable') or element.get('selected'))
+        description = element.get('description')
+        description = ' '.join(str(description).split()) if description else None
+        flags = ('c' if element.get('clickable') else '') + ('s' if element.get('scrollable') else '') + \
+                ('x' if element.get('selected') else '')
+        head = str(element['id']) + ' ' + element['class'].replace('(container)', '').split('.')[-1]
+        if flags:
+            head += ' ' + flags
+        tail = ''
+        if element.get('resource-id') and ':id/' in element['resource-id']:
+            tail = ' #' + element['resource-id'].split(':id/')[-1]
+        priority = 2 * interactive + (description is not None)
+        return {'id': element['id'], 'head': head, 'tail': tail, 'children': children, 'description': description,
+                'priority': max([priority] + [c['priority'] for c in children]),
+                'subtree_interactive': interactive or any([c['subtree_interactive'] for c in children]),
+                'offscreen': offscreen}
+
+    def __compact_node(self, element, elements, screen):
+        """
+        Compact the subtree of the element recursively
+        Returns:
+            nodes (list): Compact nodes that take the place of the element in its parent,
+                          empty if the element is dropped and its children if it is a dropped wrapper
+        """
+        children = []
+        for child in element.get('children', []):
+            children += self.__compact_node(child, elements, screen)
+        meaningful = element.get('clickable') or element.get('scrollable') or element.get('selected') or \
+            element.get('description')
+        if not meaningful and ('children' not in element or len(children) <= 1):
+            return children
+        left, top, right, bottom = elements[element['id']]['bounds']
+        offscreen = right <= screen[0] or bottom <= screen[1] or left >= screen[2] or top >= screen[3]
+        return [self.__make_node(element, children, offscreen)]
+
+    '''
+    *****************
+    *** Rendering ***
+    *****************
+    '''
+    def __collect_descriptions(self, node, descriptions):
+        if node['description']:
+            descriptions.append(node['description'])
+        for child in node['children']:
+            self.__collect_descriptions(child, descriptions)
+        return descriptions
+
+    def __render_node(self, node, depth, collapse_level, lines):
+        """
+        Render the node and its children into lines of (text, priority)
+        Args:
+            collapse_level (int): 0: no collapse; 1: collapse off-screen subtrees; 2: also collapse non-interactive subtrees
+        """
+        line = ' ' * depth + node['head']
+        if depth > 0 and collapse_level >= 1 and node['offscreen']:
+            lines.append((line + node['tail'] + ' ~offscreen', 0))
+            return
+        if depth > 0 and collapse_level >= 2 and len(node['children']) > 0 and not node['subtree_interactive']:
+            descriptions = ' | '.join(self.__collect_descriptions(node, []))
+            if len(descriptions) > self.max_collapsed_chars:
+                descriptions = descriptions[:self.max_collapsed_chars] + '...'
+            lines.append((line + ' "' + descriptions + '"' + node['tail'], node['priority']))
+            return
+        if node['description']:
+            line += ' "' + node['description'] + '"'
+        lines.append((line + node['tail'], node['priority']))
+        for child in node['children']:
+            self.__render_node(child, depth + 1, collapse_level, lines)
+
+    def __truncate_lines(self, lines, token_budget):
+        """
+        Binary search the most lines to keep within the budget, dropping the lines of the lowest priority and the
+        latest order first. As a container's priority is the highest of its subtree and it comes before its
+        children, a container is never dropped before its children
+        """
+        drop_order = sorted(range(1, len(lines)), key=lambda i: (lines[i][1], -i))
+
+        def join_lines(n_drop):
+            dropped = set(drop_order[:n_drop])
+            kept = [line for i, (line, _) in enumerate(lines) if i not in dropped]
+            if n_drop > 0:
+                kept.append('... %d elements omitted' % n_drop)
+            return self.legend + '\n' + '\n'.join(kept)
+
+        low, high = 0, len(drop_order)
+        while low < high:
+            mid = (low + high) // 2
+            if self.__model_manager.count_token_size(join_lines(mid)) <= token_budget:
+                high = mid
+            else:
+                low = mid + 1
+        return join_lines(low)
@@ -1,9 +1,17 @@
-from difflib import SequenceMatcher
 import cv2
 import numpy as np
 
+from uta.UIProcessing._UISpatialIndex import _UISpatialIndex
+from uta.UIProcessing._UISimilarity import _UISimilarity
+
 
 class _UIUtil:
+    # style of the element id labels in annotation
+    __label_style = {'vspace': 10, 'hspace': 10, 'font_scale': 1, 'thickness': 2, 'background_RGB': (10, 10, 10),
+                     'text_RGB': (200, 200, 200), 'alpha': 0.55}
+
+    __ui_similarity = _UISimilarity()
+
     def __init__(self):
         pass
 
@@ -17,43 +25,116 @@ class _UIUtil:
         Returns:
             Element node (dict): If found, otherwise None
         """
-        def search_node_by_id(node, ele_id):
-            '''
-            Recursively search for node by element id, if not matched for current node, look into its children
-            '''
-            if node['id'] == ele_id:
-                return node
-            if node['id'] > ele_id:
-                return None
-            if 'children' in node:
-                last_child = None
-                for child in node['children']:
-                    if child['id'] == ele_id:
-                        return child
-                    if child['id'] > ele_id:
-                        break
-                    last_child = child
-                return search_node_by_id(last_child, ele_id)
-
         ele_id = int(ele_id)
-        if ele_id >= len(ui_data.elements):
+        if not 0 <= ele_id < len(ui_data.elements):
             print('No element with id', ele_id, 'is found')
             return None
-        return search_node_by_id(ui_data.element_tree, ele_id)
+        return ui_data.get_element_tree_nodes()[ele_id]
+
+    @staticmethod
+    def get_ui_element_parent(ui_data, ele_id):
+        """
+        Return the parent of the UI element
+        Args:
+            ui_data (UIData): Target UIData
+            ele_id (str or int): The element ID
+        Returns:
+            Element (dict): The parent element, None for the root
+        """
+        parent = int(ui_data.get_element_store().parents[int(ele_id)])
+        return ui_data.elements[parent] if parent >= 0 else None
+
+    @staticmethod
+    def get_ui_element_ancestors(ui_data, ele_id):
+        """
+        Return the ancestors of the UI element
+        Args:
+            ui_data (UIData): Target UIData
+            ele_id (str or int): The element ID
+        Returns:
+            Elements (list of dict): The ancestors from the parent up to the root
+        """
+        return [ui_data.elements[a_id] for a_id in ui_data.get_element_store().ancestors_of(int(ele_id))]
+
+    @staticmethod
+    def get_ui_element_siblings(ui_data, ele_id):
+        """
+        Return the siblings of the UI element
+        Args:
+            ui_data (UIData): Target UIData
+            ele_id (str or int): The element ID
+        Returns:
+            Elements (list of dict): The other children of the element's parent, in order
+        """
+        ele_id = int(ele_id)
+        store = ui_data.get_element_store()
+        parent = int(store.parents[ele_id])
+        if parent < 0:
+            return []
+        return [ui_data.elements[c_id] for c_id in store.children_of(parent) if c_id != ele_id]
+
+    @staticmethod
+    def get_nearest_clickable_ancestor(ui_data, ele_id, include_self=True):
+        """
+        Return the nearest clickable element above the UI element, which receives a click on the element
+        Args:
+            ui_data (UIData): Target UIData
+            ele_id (str or int): The element ID
+            include_self (bool): True to return the element itself if it is clickable
+        Returns:
+            Element (dict): The nearest clickable element, None if no one is clickable
+        """
+        clickable = ui_data.get_element_store().nearest_clickable_ancestor(int(ele_id), include_self)
+        return ui_data.elements[clickable] if clickable is not None else None
+
+    @staticmethod
+    def get_ui_element_by_coordinate(ui_data, x, y, only_leaves=False):
+        """
+        Return the top-most UI element at the screen coordinate
+        Args:
+            ui_data (UIData): Target UIData
+            x, y (int): Screen coordinate
+            only_leaves (bool): True to only look up element_leaves
+        Returns:
+            Element (dict): The deepest element containing the coordinate, the later drawn one if overlapped, otherwise None
+        """
+        store = ui_data.get_element_store()
+        if ui_data.elements_spatial_index is None:
+            ui_data.elements_spatial_index = _UISpatialIndex(store.bounds)
+        element_id = None
+        for ele_id in ui_data.elements_spatial_index.query_point(x, y):
+            if only_leaves and store.leaf_ids[ele_id] < 0:
+                continue
+            if element_id is None or store.layers[ele_id] >= store.layers[element_id]:
+                element_id = ele_id
+        return ui_data.elements[element_id] if element_id is not None else None
 
     @staticmethod
     def check_ui_tree_similarity(ui_data1, ui_data2):
         """
-        Compute the similarity between two uis by checking their element trees
+        Compute the similarity between two uis by checking their element trees and the text of the elements,
+        through the minhash of their fingerprints cached on the UIData
         Args:
             ui_data1 (UIData): The comparing ui
             ui_data2 (UIData): The comparing ui
         Returns:
             similarity (float): The similarity between two trees
         """
-        return SequenceMatcher(None, str(ui_data1.element_tree), str(ui_data2.element_tree)).ratio()
+        return _UIUtil.__ui_similarity.content_similarity(ui_data1, ui_data2)
 
-    def annotate_elements_with_id(self, ui_data, only_leaves=True, show=True, draw_bound=False):
+    @staticmethod
+    def check_ui_structure_similarity(ui_data1, ui_data2):
+        """
+        Compute the similarity between the layouts of two uis, regardless of the text of the elements
+        Args:
+            ui_data1 (UIData): The comparing ui
+            ui_data2 (UIData): The comparing ui
+        Returns:
+            similarity (float): The similarity between two tree structures
+        """
+        return _UIUtil.__ui_similarity.structure_similarity(ui_data1, ui_data2)
+
+    def annotate_elements_with_id(self, ui_data, only_leaves=True, show=True, draw_bound=False, prev_ui_data=None):
         """
         Annotate elements on the ui screenshot using IDs
         Args:
@@ -61,39 +142,137 @@ class _UIUtil:
             only_leaves (bool): True to just show element_leaves
             show (bool): True to show the result
             draw_bound (bool): True to draw bounding box of elements
+            prev_ui_data (UIData): The previous annotated UI, if given, only re-annotate the changed regions
         Returns:
             annotated_img (cv2 image): Annotated UI screenshot
+            ui_data.annotated_elements_ops (list): Drawing operations of the annotation
         """
-        board = ui_data.ui_screenshot.copy()
-        if only_leaves:
-            elements = ui_data.elements_leaves
-        else:
-            elements = ui_data.elements
-        # draw bounding box
+        store = ui_data.get_element_store()
+        ids = store.leaves() if only_leaves else np.arange(len(store))
+        # read the bounds from the element store rather than the element dicts
+        bounds = [tuple(b) for b in store.bounds[ids].tolist()]
+        # draw bounding box first and then annotate elements
+        ops = []
         if draw_bound:
-            for ele in elements:
-                left, top, right, bottom = ele['bounds']
-                cv2.rectangle(board, (left, top), (right, bottom), (0, 250, 0), 2)
-                board = self.draw_transparent_border_rectangle(board, (left, top), (right, bottom), (0, 250, 0), 3, 0.7)
-        # annotate elements
-        for i, ele in enumerate(elements):
-            left, top, right, bottom = ele['bounds']
-            try:
-                # mark on the top if possible
-                board = self.putBText(board, str(ele['id']), text_offset_x=(left + right) // 2, text_offset_y=top - 5,
-                                      vspace=10, hspace=10, font_scale=1, thickness=2, background_RGB=(10,10,10),
-                                      text_RGB=(200,200,200), alpha=0.55)
-            except ValueError as e:
-                # else mark on the bottom
-                board = self.putBText(board, str(ele['id']), text_offset_x=(left + right) // 2, text_offset_y=bottom,
-                                      vspace=10, hspace=10, font_scale=1, thickness=2, background_RGB=(10,10,10),
-                                      text_RGB=(200,200,200), alpha=0.55)
+            ops += [('bound', b) for b in bounds]
+        ops += [('id', str(ele_id), b) for ele_id, b in zip(ids.tolist(), bounds)]
+
+        board = None
+        if prev_ui_data is not None:
+            board = self.__reannotate_changed_regions(ui_data, prev_ui_data, ops)
+        if board is None:
+            board = ui_data.ui_screenshot.copy()
+            for op in ops:
+                board = self.__draw_annotation_op(board, op)
+        ui_data.annotated_elements_ops = ops
         if show:
             cv2.imshow('a', cv2.resize(board, (500, 1000)))
             cv2.waitKey()
             cv2.destroyAllWindows()
         return board
 
+    def __draw_annotation_op(self, board, op):
+        """
+        Draw an annotation operation on the board
+        Args:
+            board (cv2 image): Image to draw on
+            op (tuple): ('bound', bounds) or ('id', text, bounds)
+        Returns:
+            board (cv2 image)
+        """
+        if op[0] == 'bound':
+            left, top, right, bottom = op[1]
+            cv2.rectangle(board, (left, top), (right, bottom), (0, 250, 0), 2)
+            return self.draw_transparent_border_rectangle(board, (left, top), (right, bottom), (0, 250, 0), 3, 0.7)
+        left, top, right, bottom = op[2]
+        try:
+            # mark on the top if possible
+            return self.putBText(board, op[1], text_offset_x=(left + right) // 2, text_offset_y=top - 5, **self.__label_style)
+        except ValueError as e:
+            # else mark on the bottom
+            return self.putBText(board, op[1], text_offset_x=(left + right) // 2, text_offset_y=bottom, **self.__label_style)
+
+    def __annotation_op_footprint(self, op):
+        """
+        Get the region that can be affected by an annotation operation
+        Args:
+            op (tuple): ('bound', bounds) or ('id', text, bounds)
+        Returns:
+            footprint (tuple): (left, top, right, bottom) of the affected region
+        """
+        margin = 2
+        if op[0] == 'bound':
+            left, top, right, bottom = op[1]
+            return left - 3 - margin, top - 3 - margin, right + 3 + margin + 1, bottom + 3 + margin + 1
+        left, top, right, bottom = op[2]
+        vspace, hspace = self.__label_style['vspace'], self.__label_style['hspace']
+        (text_width, text_height) = cv2.getTextSize(op[1], cv2.FONT_HERSHEY_DUPLEX, fontScale=self.__label_style['font_scale'],
+                                                    thickness=self.__label_style['thickness'])[0]
+        x = (left + right) // 2
+        # putBText fails on the top and falls back to the bottom if the label exceeds the top or left of the image
+        y = top - 5 if top - 5 - vspace >= 0 and x - hspace >= 0 else bottom
+        return x - hspace - margin, y - vspace - margin, x + text_width + hspace + margin, y + text_height + vspace + margin
+
+    def __reannotate_changed_regions(self, ui_data, prev_ui_data, ops, tile_size=60, max_changed_ratio=0.6):
+        """
+        Reuse the previous annotated screenshot and only redraw the changed tiles of the screen
+        A tile is unchanged if both its screenshot pixels and the annotation operations over it are the same
+        Args:
+            ui_data (UIData): Target UIData
+            prev_ui_data (UIData): The previous annotated UIData
+            ops (list): Annotation operations for the target UIData
+            tile_size (int): Size of the square tiles to compare
+            max_changed_ratio (float): Redraw the whole screen if the ratio of the changed tiles is larger than this
+        Returns:
+            annotated_img (cv2 image): Annotated UI screenshot, None if the previous annotation is not reusable
+        """
+        prev_board = prev_ui_data.annotated_elements_screenshot
+        if prev_board is None or prev_ui_data.annotated_elements_ops is None \
+                or prev_board.shape != ui_data.ui_screenshot.shape or prev_ui_data.ui_screenshot.shape != ui_data.ui_screenshot.shape:
+            return None
+        height, width = ui_data.ui_screenshot.shape[:2]
+        rows, cols = -(-height // tile_size), -(-width // tile_size)
+
+        def map_ops_to_tiles(annotation_ops):
+            # index the footprints of the operations on a grid of the tiles
+            footprints, footprint_ops = [], []
+            for op in annotation_ops:
+                left, top, right, bottom = self.__annotation_op_footprint(op)
+                left, top, right, bottom = max(left, 0), max(top, 0), min(right, width), min(bottom, height)
+                if left < right and top < bottom:
+                    footprints.append((left, top, right, bottom))
+                    footprint_ops.append(op)
+            tile_ops = [[] for _ in range(rows * cols)]
+            for (r, c), op_ids in _UISpatialIndex(footprints, cell_size=tile_size).cells.items():
+                if r < rows and c < cols:
+                    tile_ops[r * cols + c] = [footprint_ops[i] for i in op_ids]
+            return tile_ops
+
+        # tiles with changed screenshot pixels, copied as the tiles with changed annotations are added to it
+        changed_tiles = ui_data.get_changed_tiles(prev_ui_data, tile_size).reshape(-1).copy()
+        # tiles with changed annotations
+        tile_ops, prev_tile_ops = map_ops_to_tiles(ops), map_ops_to_tiles(prev_ui_data.annotated_elements_ops)
+        for i in range(rows * cols):
+            if tile_ops[i] != prev_tile_ops[i]:
+                changed_tiles[i] = True
+        if changed_tiles.mean() > max_changed_ratio:
+            return None
+
+        board = prev_board.copy()
+        if changed_tiles.any():
+            # redraw the operations over the changed tiles on a clean screenshot, and paste the changed tiles back
+            redraw_ops = set()
+            for i in np.flatnonzero(changed_tiles):
+                redraw_ops.update(tile_ops[i])
+            redrawn = ui_data.ui_screenshot.copy()
+            for op in ops:
+                if op in redraw_ops:
+                    redrawn = self.__draw_annotation_op(redrawn, op)
+            changed_mask = np.repeat(np.repeat(changed_tiles.reshape(rows, cols), tile_size, axis=0), tile_size, axis=1)[:height, :width]
+            np.copyto(board, redrawn, where=changed_mask[..., None])
+        print('Re-annotate %d/%d changed tiles' % (changed_tiles.sum(), rows * cols))
+        return board
+
     '''
     ***************
     *** Drawing ***
@@ -134,7 +313,14 @@ class _UIUtil:
 
     @staticmethod
     def draw_transparent_border_rectangle(img, left_top, right_bottom, color, thickness, alpha):
-        overlay = np.zeros_like(img, dtype=np.uint8)
-        cv2.rectangle(overlay, left_top, right_bottom, color, thickness)
-        return cv2.addWeighted(overlay, alpha, img, 1, 0)
+        # only blend the region around the rectangle, as the rest of the overlay is blank
+        height, width = img.shape[:2]
+        left, top = max(0, min(left_top[0], right_bottom[0]) - thickness), max(0, min(left_top[1], right_bottom[1]) - thickness)
+        right, bottom = min(width, max(left_top[0], right_bottom[0]) + thickness + 1), min(height, max(left_top[1], right_bottom[1]) + thickness + 1)
+        if left >= right or top >= bottom:
+            return img
+        overlay = np.zeros_like(img[top:bottom, left:right], dtype=np.uint8)
+        cv2.rectangle(overlay, (left_top[0] - left, left_top[1] - top), (right_bottom[0] - left, right_bottom[1] - top), color, thickness)
+        img[top:bottom, left:right] = cv2.addWeighted(overlay, alpha, img[top:bottom, left:right], 1, 0)
+        return img
 
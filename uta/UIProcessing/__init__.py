@@ -3,3 +3,9 @@ from uta.UIProcessing._UIAnalyser import _UIAnalyser
 from uta.UIProcessing.UIProcessor import UIProcessor
 from uta.UIProcessing._UIChecker import _UIChecker
 from uta.UIProcessing._UIUtil import _UIUtil
+from uta.UIProcessing._UIDiffer import _UIDiffer
+from uta.UIProcessing._UISimilarity import _UISimilarity, _UIFingerprint
+from uta.UIProcessing._UIChangeDetector import _UIChangeDetector
+from uta.UIProcessing._UISettleDetector import _UISettleDetector
+from uta.UIProcessing._UISpatialIndex import _UISpatialIndex
+from uta.UIProcessing._UITreeSerializer import _UITreeSerializer
\ No newline at end of file
@@ -1,12 +1,13 @@
-import time
 from os.path import join as pjoin
 import traceback
+from collections import OrderedDict
 import cv2
 
 from uta.DataStructures import *
 from uta.ModelManagement import ModelManager
 from uta.SystemConnection import SystemConnector
 from uta.AvailableTaskList import TaskList
+from uta.TaskDeclearation import TaskDeclarator
 from uta.TaskAction import TaskActionChecker
 from uta.ThirdPartyAppManagement import ThirdPartyAppManager
 from uta.UIProcessing import UIProcessor
@@ -23,11 +24,16 @@ class UTA:
         # workers
         self.ui_processor = UIProcessor(self.model_manager)
         self.task_list = TaskList(self.model_manager)
+        self.task_declarator = TaskDeclarator(self.model_manager)
         self.task_action_checker = TaskActionChecker(self.model_manager)
         self.app_recommender = ThirdPartyAppManager(self.model_manager)
         # current data
         self.cur_user = None  # User object, current user
         self.cur_task = None  # Task object, current task
+        # last processed UIData of the recently running tasks for incremental processing, {(user_id, task_id): UIData},
+        # from the least to the most recently used, the least recently used is evicted beyond max_last_ui_data
+        self.last_ui_data = OrderedDict()
+        self.max_last_ui_data = 16
 
     '''
     *************
@@ -65,6 +71,7 @@ class UTA:
         # if the task does not exist, creat a new one within the user's folder
         if not task:
             task = Task(task_id=task_id, user_id=user_id, task_description=user_msg)
+            self.last_ui_data.pop((user_id, task_id), None)
         else:
             if user_msg:
                 if task.res_task_match.get('State') and 'related' in task.res_task_match['State'].lower() or \
@@ -118,10 +125,16 @@ class UTA:
                 self.system_connector.save_task(task)
                 return match_app
 
-            declare_resp = self.task_list.match_task_to_list(task)
+            # justify the user's answer to a clarification question alongside matching the task, and stop early if it is unrelated
+            results, stopped_by = self.task_declarator.declare_task(task, self.task_list, checks=('Justify', 'TaskMatch'))
+            if stopped_by:
+                # answer in the task match format, asking the user again as for an unrelated request
+                task.res_task_match = {'State': 'Unrelated', 'Reason': results[stopped_by].get('Explanation'), 'Proc': 'TaskMatch'}
             self.system_connector.save_task(task)
-            return declare_resp
+            return task.res_task_match if stopped_by else results['TaskMatch']
         except Exception as e:
+            # drop the half-applied declaration, the next call reloads the task from its last save
+            self.system_connector.discard_task(user_id, task_id)
             error_trace = traceback.format_exc()
             action = {"Action": "Error at the backend.", "Exception": e, "Traceback": error_trace}
             print(action)
@@ -143,7 +156,7 @@ class UTA:
             max_try (int): The maximum number of attempts
             show_ui (bool): True to show the annotated UI and the actions to be performed
             printlog (bool): True to print the log of large model
-            wait_time (int): Seconds to wait for the loading of new page before
+            wait_time (int): Maximum seconds to wait for the loading of new page before the next step
         Returns:
             Output and perform the action on the device
         """
@@ -154,18 +167,29 @@ class UTA:
         task.keyboard_active = device.check_keyboard_active()
         output_dir = pjoin(self.system_connector.user_data_root, 'test', task_id)
 
+        prev_ui, prev_action = None, None
         for i in range(max_try):
             print('\n*** UI ', i, '***')
             # 1. process ui
-            ui_img_file, ui_xml_file = device.cap_and_save_ui_screenshot_and_xml(ui_id=len(task.relations), output_dir=output_dir)
-            ui = self.process_ui_data(ui_img_file, ui_xml_file, device.get_device_resolution(), show=show_ui)
+            # the capture is processed in memory while the device saves it in the background
+            ui_id = len(task.relations)
+            ui_img, ui_xml = device.cap_ui_screenshot_and_xml(ui_id=ui_id, output_dir=output_dir)
+            ui = self.process_ui_data(None, None, device.get_device_resolution(), show=show_ui, prev_ui_data=prev_ui,
+                                      ui_img=ui_img, ui_xml=ui_xml, ui_id=str(ui_id))
             self.system_connector.save_ui_data(ui, output_dir=output_dir)
 
             # 2. check action
             task.conversation_automation = []  # clear up the conversation of previous ui
-            # check action on the UI by checking the relation and target elements
-            action = self.task_action_checker.action_on_ui_vision(ui, task, printlog)
+            if prev_action is not None and self.ui_processor.detect_ui_change(ui, prev_ui) == 'unchanged':
+                # the last action had no visible effect, retry it or check the UI without the vision model
+                action = self.task_action_checker.recover_no_op_action(ui, task, prev_action)
+                if action is None:
+                    action = self.task_action_checker.action_on_ui(ui, task, printlog)
+            else:
+                # check action on the UI by checking the relation and target elements
+                action = self.task_action_checker.action_on_ui_vision(ui, task, printlog)
             action = self.set_action(action)
+            prev_ui, prev_action = ui, action
             self.system_connector.save_task(task)
             print(action)
 
@@ -179,7 +203,7 @@ class UTA:
             else:
                 device.take_action(action=action, ui_data=ui, show=show_ui)
             print('* Waiting for loading page *')
-            time.sleep(wait_time)
+            device.wait_for_settle(timeout=wait_time, app=action.get('App'))
 
     def check_action_on_ui(self, ui_img_file, ui_xml_file, task_desc, resolution, keyboard_active):
         """
@@ -223,7 +247,8 @@ class UTA:
             task.keyboard_active = keyboard_active
 
             # 1. process ui
-            ui = self.process_ui_data(ui_img_file, ui_xml_file, user.device_resolution, show=printlog)
+            ui = self.process_ui_data(ui_img_file, ui_xml_file, user.device_resolution, show=printlog,
+                                      prev_ui_data=self.last_ui_data.get((user_id, task_id)))
             self.system_connector.save_ui_data(ui, output_dir=pjoin(self.system_connector.user_data_root, user_id, task_id))
 
             # 2. act step
@@ -232,16 +257,24 @@ class UTA:
             action = self.task_action_checker.action_on_ui_vision(ui, task, printlog)
             action = self.set_action(action)
             self.system_connector.save_task(task)
+            if action.get('Action') == 'Complete':
+                # the task ends, persist it now rather than waiting for the background write
+                self.system_connector.flush_task(user_id, task_id)
+            self.update_last_ui_data(user_id, task_id, ui, action)
             return ui, action
 
         except Exception as e:
+            # the failed step leaves the last UI unknown, so the next step is processed in full
+            self.last_ui_data.pop((user_id, task_id), None)
+            # drop the half-applied step, the next step reloads the task from its last save
+            self.system_connector.discard_task(user_id, task_id)
             error_trace = traceback.format_exc()
             action = {"Action": "Error at the backend.", "Exception": e, "Traceback": error_trace}
             print(action)
             return None, action
 
     def automate_task(self, user_id, task_id, ui_img_file, ui_xml_file,
-                      package_name=None, activity_name=None, keyboard_active=False, printlog=False):
+                      package_name=None, activity_name=None, keyboard_active=False, printlog=False, annotate=True):
         """
         Identify the action on the current ui to automate the task
         Args:
@@ -253,6 +286,8 @@ class UTA:
             activity_name (str): Current page name
             keyboard_active (bool): If the keyboard is active, can only input text when the keyboard is active
             printlog (bool): If True, enables logging of outputs.
+            annotate (bool): False to skip the annotated screenshot, which the text-only automation does not use,
+                             so the screenshot is not decoded unless the ocr needs it
         Returns:
             Action (dict): {"Action": }
         """
@@ -264,7 +299,8 @@ class UTA:
             task.keyboard_active = keyboard_active
 
             # 1. process ui
-            ui = self.process_ui_data(ui_img_file, ui_xml_file, user.device_resolution)
+            ui = self.process_ui_data(ui_img_file, ui_xml_file, user.device_resolution,
+                                      prev_ui_data=self.last_ui_data.get((user_id, task_id)), annotate=annotate)
             self.system_connector.save_ui_data(ui, output_dir=pjoin(self.system_connector.user_data_root, user_id, task_id))
 
             # 2. act step
@@ -273,8 +309,16 @@ class UTA:
             action = self.task_action_checker.action_on_ui(ui, task, printlog)
             action = self.set_action(action)
             self.system_connector.save_task(task)
+            if action.get('Action') == 'Complete':
+                # the task ends, persist it now rather than waiting for the background write
+                self.system_connector.flush_task(user_id, task_id)
+            self.update_last_ui_data(user_id, task_id, ui, action)
             return ui, action
         except Exception as e:
+            # the failed step leaves the last UI unknown, so the next step is processed in full
+            self.last_ui_data.pop((user_id, task_id), None)
+            # drop the half-applied step, the next step reloads the task from its last save
+            self.system_connector.discard_task(user_id, task_id)
             error_trace = traceback.format_exc()
             action = {"Action": "Error at the backend.", "Exception": e, "Traceback": error_trace}
             print(action)
@@ -302,7 +346,26 @@ class UTA:
             return action
         return action
 
-    def process_ui_data(self, ui_img_file, ui_xml_file, device_resolution, show=False, annotate_bound=True):
+    def update_last_ui_data(self, user_id, task_id, ui, action):
+        """
+        Keep the processed UI of the task for incremental processing of the next step, and release it once the task ends.
+        Only the most recently running tasks are kept, so abandoned tasks are evicted
+        Args:
+            user_id (str): User id
+            task_id (str): Task id
+            ui (UIData): Processed UI of the current step
+            action (dict): Action on the current UI
+        """
+        if action.get('Action') == 'Complete':
+            self.last_ui_data.pop((user_id, task_id), None)
+        else:
+            self.last_ui_data[(user_id, task_id)] = ui
+            self.last_ui_data.move_to_end((user_id, task_id))
+            while len(self.last_ui_data) > self.max_last_ui_data:
+                self.last_ui_data.popitem(last=False)
+
+    def process_ui_data(self, ui_img_file, ui_xml_file, device_resolution, show=False, annotate_bound=True, prev_ui_data=None,
+                        ui_img=None, ui_xml=None, ui_id=None, annotate=True):
         """
         Process ui dato
         Args:
@@ -311,12 +374,20 @@ class UTA:
             device_resolution (tuple): Device resolution
             show (bool): True to show the detection result
             annotate_bound (bool): True to draw bounding boxes for elements in annotation
+            prev_ui_data (UIData): Processed UI of the previous step, if given, only re-annotate the changed regions
+            ui_img (bytes): Screenshot captured in memory, used instead of the ui_img_file
+            ui_xml (str): VH xml captured in memory, used instead of the ui_xml_file
+            ui_id (str): Id of the UI captured in memory
+            annotate (bool): False to skip annotating the elements on the screenshot
         Return:
             annotated_ui (image): ui with processing results
         """
-        ui = self.system_connector.load_ui_data(screenshot_file=ui_img_file, xml_file=ui_xml_file, ui_resize=device_resolution)
+        ui = self.system_connector.load_ui_data(screenshot_file=ui_img_file, xml_file=ui_xml_file, ui_resize=device_resolution,
+                                                screenshot=ui_img, xml=ui_xml, ui_id=ui_id)
         self.ui_processor.preprocess_ui(ui)
-        ui.annotated_elements_screenshot = self.ui_processor.annotate_elements_with_id(ui, show=show, draw_bound=annotate_bound)
+        if annotate:
+            ui.annotated_elements_screenshot = self.ui_processor.annotate_elements_with_id(ui, show=show, draw_bound=annotate_bound,
+                                                                                           prev_ui_data=prev_ui_data)
         # resize image
         # annotated_elements_screenshot = cv2.resize(annotated_elements_screenshot, (device_resolution[0]//4, device_resolution[1]//4))
         return ui